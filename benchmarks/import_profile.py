@@ -0,0 +1,63 @@
+"""
+Import-time profile of the API: how long `import app` takes and which modules
+cost the most, with and without the optional admin / migrations pieces.
+
+    $ python benchmarks/import_profile.py            # top 15 modules per profile
+    $ python benchmarks/import_profile.py --top 30
+
+Uses `python -X importtime` in a fresh interpreter per run, so nothing is
+cached between profiles.
+"""
+import os
+import sys
+import argparse
+import subprocess
+
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+
+PROFILES = {
+    'full (admin + migrations)': {'ADMIN_ENABLED': '1', 'MIGRATIONS_ENABLED': '1'},
+    'api only':                  {'ADMIN_ENABLED': '0', 'MIGRATIONS_ENABLED': '0'},
+}
+
+
+def import_times(extra_env):
+    env = dict(os.environ, **extra_env)
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import app'],
+        cwd=SRC, env=env, capture_output=True, text=True, check=True
+    )
+
+    # Lines look like: "import time:  self [us] | cumulative | <indent>imported package"
+    # Each indent level (2 spaces) is one step deeper in the import chain
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, raw_name = line[len('import time:'):].split('|')
+        depth = (len(raw_name) - len(raw_name.lstrip()) - 1) // 2
+        modules.append((raw_name.strip(), int(cumulative_us), depth))
+    return modules
+
+
+def report(title, modules, top):
+    total = next(cumulative for name, cumulative, depth in modules if name == 'app')
+    print(f"\n=== {title}: import app = {total / 1000:.1f} ms, {len(modules)} modules ===")
+
+    # Direct imports of app.py (first importer pays for the whole sub-tree)
+    direct = sorted(
+        ((name, cumulative) for name, cumulative, depth in modules if depth == 1),
+        key=lambda item: item[1], reverse=True
+    )
+    for name, cumulative in direct[:top]:
+        print(f"  {cumulative / 1000:>8.1f} ms  {name}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    for title, env in PROFILES.items():
+        report(title, import_times(env), args.top)
@@ -0,0 +1,89 @@
+"""
+Concurrent read throughput of the SQLite database: default journal vs the
+production profile from src/sqlite_tuning.py.
+
+A writer thread keeps inserting rows while N reader threads run the same
+query the /people endpoint runs. With the default rollback journal readers
+block on every write; with WAL they don't.
+
+    $ python benchmarks/sqlite_read_throughput.py --readers 8 --seconds 5
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+from sqlite_tuning import sqlite_engine_options  # noqa: E402
+
+
+def build_engine(path, tuned):
+    options = sqlite_engine_options() if tuned else {'connect_args': {'check_same_thread': False}}
+    return create_engine(f"sqlite:///{path}", pool_size=32, max_overflow=0, **options)
+
+
+def seed(engine, rows):
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE people (id INTEGER PRIMARY KEY, name VARCHAR(100), homeworld VARCHAR(40))"))
+        conn.execute(
+            text("INSERT INTO people (name, homeworld) VALUES (:name, :homeworld)"),
+            [{'name': f'person {i}', 'homeworld': 'Tatooine'} for i in range(rows)]
+        )
+
+
+def run(tuned, readers, seconds, rows):
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    engine = build_engine(path, tuned)
+    seed(engine, rows)
+
+    stop = threading.Event()
+    reads = [0] * readers
+    writes = [0]
+    errors = [0]
+
+    def reader(index):
+        while not stop.is_set():
+            try:
+                with engine.connect() as conn:
+                    conn.execute(text("SELECT id, name, homeworld FROM people LIMIT 100")).fetchall()
+                reads[index] += 1
+            except Exception:
+                errors[0] += 1
+
+    def writer():
+        while not stop.is_set():
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text("INSERT INTO people (name, homeworld) VALUES ('new', 'Naboo')"))
+                writes[0] += 1
+            except Exception:
+                errors[0] += 1
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    threads.append(threading.Thread(target=writer))
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+
+    total = sum(reads)
+    label = 'tuned (WAL)' if tuned else 'default'
+    print(f"{label:<12} reads/s: {total / seconds:>10.0f}   writes/s: {writes[0] / seconds:>8.0f}   errors: {errors[0]}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--rows', type=int, default=5000)
+    args = parser.parse_args()
+
+    run(False, args.readers, args.seconds, args.rows)
+    run(True,  args.readers, args.seconds, args.rows)
@@ -0,0 +1,32 @@
+"""table_generation counters of the cached catalog lists
+
+Revision ID: 0a9d4e2b7c51
+Revises: f1c7a3e9b062
+Create Date: 2026-10-19 17:12:44.310528
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0a9d4e2b7c51'
+down_revision = 'f1c7a3e9b062'
+branch_labels = None
+depends_on = None
+
+
+TABLES = ('people', 'planet', 'vehicle')
+
+
+def upgrade():
+    table_generation = op.create_table('table_generation',
+    sa.Column('table_name', sa.String(length=50), nullable=False),
+    sa.Column('generation', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('table_name')
+    )
+    op.bulk_insert(table_generation, [{'table_name': table, 'generation': 0} for table in TABLES])
+
+
+def downgrade():
+    op.drop_table('table_generation')
@@ -0,0 +1,43 @@
+"""denormalized favorite_count on people, planet and vehicle
+
+Revision ID: b3f9a6c41d85
+Revises: 7d4e1b9c2f60
+Create Date: 2026-10-19 10:03:17.551902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3f9a6c41d85'
+down_revision = '7d4e1b9c2f60'
+branch_labels = None
+depends_on = None
+
+
+COUNTERS = (
+    ('people',  'favorite_people',   'people_id'),
+    ('planet',  'favorite_planets',  'planet_id'),
+    ('vehicle', 'favorite_vehicles', 'vehicle_id'),
+)
+
+
+def upgrade():
+    for table, favorites_table, fk in COUNTERS:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('favorite_count', sa.Integer(), server_default='0', nullable=False))
+            batch_op.create_index(batch_op.f(f'ix_{table}_favorite_count'), ['favorite_count'], unique=False)
+
+        # Backfill from the existing favorites
+        op.execute(
+            f"UPDATE {table} SET favorite_count = "
+            f"(SELECT COUNT(*) FROM {favorites_table} WHERE {favorites_table}.{fk} = {table}.id)"
+        )
+
+
+def downgrade():
+    for table, favorites_table, fk in reversed(COUNTERS):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_index(batch_op.f(f'ix_{table}_favorite_count'))
+            batch_op.drop_column('favorite_count')
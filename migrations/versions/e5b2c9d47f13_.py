@@ -0,0 +1,52 @@
+"""people.homeworld_id foreign key to planet, backfilled from people.homeworld
+
+Revision ID: e5b2c9d47f13
+Revises: c81e5d2a7b34
+Create Date: 2026-10-19 14:12:40.218337
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b2c9d47f13'
+down_revision = 'c81e5d2a7b34'
+branch_labels = None
+depends_on = None
+
+
+BATCH_SIZE = 1000
+
+# Same matching as residents.backfill_homeworlds(): the planet URL first, then its name
+BACKFILL = sa.text(
+    "UPDATE people SET homeworld_id = COALESCE("
+    "    (SELECT MIN(planet.id) FROM planet WHERE rtrim(planet.url, '/') = rtrim(people.homeworld, '/')),"
+    "    (SELECT MIN(planet.id) FROM planet WHERE planet.name = people.homeworld)"
+    ") WHERE people.id >= :start AND people.id < :end AND people.homeworld_id IS NULL"
+)
+
+
+def upgrade():
+    with op.batch_alter_table('people', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('homeworld_id', sa.Integer(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_people_homeworld_id'), ['homeworld_id'], unique=False)
+        batch_op.create_foreign_key('fk_people_homeworld_id_planet', 'planet', ['homeworld_id'], ['id'], ondelete='SET NULL')
+
+    if op.get_context().as_sql:
+        # Offline (--sql) scripts can't read MAX(id), one range covers every row
+        op.execute(BACKFILL.bindparams(start=0, end=2 ** 31 - 1))
+        return
+
+    # Backfill by id ranges, so no statement touches the whole table at once
+    connection = op.get_bind()
+    max_id = connection.execute(sa.text("SELECT MAX(id) FROM people")).scalar() or 0
+    for start in range(0, max_id + 1, BATCH_SIZE):
+        connection.execute(BACKFILL, {'start': start, 'end': start + BATCH_SIZE})
+
+
+def downgrade():
+    with op.batch_alter_table('people', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_people_homeworld_id_planet', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_people_homeworld_id'))
+        batch_op.drop_column('homeworld_id')
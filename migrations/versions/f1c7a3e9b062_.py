@@ -0,0 +1,35 @@
+"""pre-rendered serialized JSON on people, planet and vehicle
+
+Revision ID: f1c7a3e9b062
+Revises: e5b2c9d47f13
+Create Date: 2026-10-19 15:40:08.904113
+
+The blobs are rendered by the application (serialize()), fill them after the
+upgrade with `flask prerender-catalog`. Until then reads render NULL rows on
+the fly.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1c7a3e9b062'
+down_revision = 'e5b2c9d47f13'
+branch_labels = None
+depends_on = None
+
+
+TABLES = ('people', 'planet', 'vehicle')
+
+
+def upgrade():
+    for table in TABLES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('serialized', sa.Text(), nullable=True))
+
+
+def downgrade():
+    for table in reversed(TABLES):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column('serialized')
@@ -1,22 +1,155 @@
 import os
 from flask_admin import Admin
 from models import db, User, People, Planet, Vehicle, FavoritePeople, FavoritePlanets, FavoriteVehicles
+from auth import hash_password, is_password_hash
+from residents import detach_residents
 from flask_admin.contrib.sqla import ModelView
+from sqlalchemy import func, text, and_, or_
+
+
+############################################
+#######   ModelView for big tables   #######
+############################################
+"""
+Plain ModelViews do not survive big tables:
+
+    [x] list page runs an unbounded COUNT(*) ---------> capped count, planner estimate on Postgres
+    [x] one lazy load per row for relation columns ---> joinedload of the listed relations
+    [x] one-to-many pickers load every favorite ------> excluded from the forms
+    [x] search / filters on any column ---------------> only on indexed columns
+    [x] search is ILIKE '%term%' (full scan) ---------> prefix range on the column's btree index
+    [x] favorites edited behind the handlers' back ---> favorites views are read-only
+"""
+class ScalableModelView(ModelView):
+    page_size = 50
+    can_set_page_size = True
+
+    # We compute our own (capped) count in get_list
+    simple_list_pager = True
+    count_cap = int(os.environ.get('ADMIN_COUNT_CAP', 10000))
+
+    def estimated_count(self):
+        """ Planner estimate of the table size (Postgres only), None elsewhere """
+        if self.session.get_bind().dialect.name != 'postgresql':
+            return None
+        return self.session.execute(
+            text("SELECT reltuples::bigint FROM pg_class WHERE relname = :table"),
+            {'table': self.model.__tablename__}
+        ).scalar()
+
+    def capped_count(self, query):
+        """ Exact count, but never scans more than `count_cap` rows """
+        limited = query.order_by(None).with_entities(self.model.id).limit(self.count_cap).subquery()
+        return self.session.query(func.count()).select_from(limited).scalar()
+
+    def get_list(self, page, sort_column, sort_desc, search, filters, execute=True, page_size=None):
+        # Build the filtered, sorted query without pagination so it can be counted first
+        _, query = super().get_list(page, sort_column, sort_desc, search, filters, execute=False, page_size=False)
+
+        count = self.capped_count(query)
+        if count >= self.count_cap and not search and not filters:
+            count = max(self.estimated_count() or 0, count)
+
+        query = self._apply_pagination(query, page, page_size)
+        return count, query.all() if execute else query
+
+    def _apply_search(self, query, count_query, joins, count_joins, search):
+        # Case sensitive prefix as a range ('Luke' <= name < 'Luke\uffff'): a btree range on
+        # SQLite and Postgres alike, where ILIKE '%term%' reads the whole table
+        search = search.strip()
+        if not search:
+            return query, count_query, joins, count_joins
+
+        prefix = or_(*(and_(column >= search, column < search + '\uffff') for column, _ in self._search_fields))
+        query = query.filter(prefix)
+        if count_query is not None:
+            count_query = count_query.filter(prefix)
+        return query, count_query, joins, count_joins
+
+
+############################################
+#######      Users and catalog       #######
+############################################
+class UserView(ScalableModelView):
+    column_exclude_list     = ('password',)
+    column_searchable_list  = ('username', 'email')
+    column_filters          = ('username', 'email')
+    form_excluded_columns   = ('favorite_people', 'favorite_planets', 'favorite_vehicles')
+
+    def on_model_change(self, form, model, is_created):
+        # Typed in plain text, stored hashed (an untouched field still holds the hash)
+        if not is_password_hash(model.password):
+            model.password = hash_password(model.password)
+
+
+class PeopleView(ScalableModelView):
+    column_searchable_list  = ('name',)
+    column_filters          = ('name', 'created')
+    column_exclude_list     = ('serialized',)
+    form_excluded_columns   = ('favorite_by', 'favorite_count', 'serialized')
+
+
+class PlanetView(ScalableModelView):
+    column_searchable_list  = ('name',)
+    column_filters          = ('name', 'created')
+    column_exclude_list     = ('serialized',)
+    form_excluded_columns   = ('favorite_by', 'favorite_count', 'serialized')
+
+    def on_model_delete(self, model):
+        # Like the API and the delete-catalog job: the residents' blobs drop the dead homeworld_id
+        detach_residents(model.id)
+
+
+class VehicleView(ScalableModelView):
+    column_searchable_list  = ('name',)
+    column_filters          = ('name', 'created')
+    column_exclude_list     = ('serialized',)
+    form_excluded_columns   = ('favorite_by', 'favorite_count', 'serialized')
+
+
+############################################
+#######          Favorites           #######
+############################################
+class ReadOnlyFavoritesView(ScalableModelView):
+    # Favorites are written by the API only: the handlers keep favorite_count, the
+    # favorite flags, trending and the events in step with the rows
+    can_create = False
+    can_edit   = False
+    can_delete = False
+
+
+class FavoritePeopleView(ReadOnlyFavoritesView):
+    column_list                 = ('id', 'user', 'people', 'created_at')
+    column_select_related_list  = (FavoritePeople.user, FavoritePeople.people)
+    column_filters              = ('user_id', 'people_id')
+
+
+class FavoritePlanetsView(ReadOnlyFavoritesView):
+    column_list                 = ('id', 'user', 'planet', 'created_at')
+    column_select_related_list  = (FavoritePlanets.user, FavoritePlanets.planet)
+    column_filters              = ('user_id', 'planet_id')
+
+
+class FavoriteVehiclesView(ReadOnlyFavoritesView):
+    column_list                 = ('id', 'user', 'vehicle', 'created_at')
+    column_select_related_list  = (FavoriteVehicles.user, FavoriteVehicles.vehicle)
+    column_filters              = ('user_id', 'vehicle_id')
+
 
 def setup_admin(app):
     app.secret_key = os.environ.get('FLASK_APP_KEY', 'sample key')
     app.config['FLASK_ADMIN_SWATCH'] = 'cerulean'
     admin = Admin(app, name='4Geeks Admin', template_mode='bootstrap3')
 
-    
+
     # Add your models here, for example this is how we add a the User model to the admin
-    admin.add_view(ModelView(User, db.session))
-    admin.add_view(ModelView(People, db.session))
-    admin.add_view(ModelView(FavoritePeople, db.session))
-    admin.add_view(ModelView(Planet, db.session))
-    admin.add_view(ModelView(FavoritePlanets, db.session))
-    admin.add_view(ModelView(Vehicle, db.session))
-    admin.add_view(ModelView(FavoriteVehicles, db.session))
+    admin.add_view(UserView(User, db.session))
+    admin.add_view(PeopleView(People, db.session))
+    admin.add_view(FavoritePeopleView(FavoritePeople, db.session))
+    admin.add_view(PlanetView(Planet, db.session))
+    admin.add_view(FavoritePlanetsView(FavoritePlanets, db.session))
+    admin.add_view(VehicleView(Vehicle, db.session))
+    admin.add_view(FavoriteVehiclesView(FavoriteVehicles, db.session))
 
     # You can duplicate that line to add mew models
-    # admin.add_view(ModelView(YourModelName, db.session))
\ No newline at end of file
+    # admin.add_view(ModelView(YourModelName, db.session))
@@ -0,0 +1,208 @@
+"""
+Admission control: per-route concurrency limits with a bounded wait queue and
+per-client token buckets, so expensive endpoints are throttled while the cheap
+ones keep serving.
+"""
+import os
+import math
+import time
+import logging
+import threading
+
+from flask import request, jsonify
+
+
+logger = logging.getLogger(__name__)
+
+
+#########################################################################################
+#########################################################################################
+#############                       ADMISSION CONTROL                       #############
+#########################################################################################
+#########################################################################################
+"""
+Configuration (environment variables):
+
+    ADMISSION_CONTROL=0 ................. disable everything below
+    ADMISSION_EXPENSIVE_CONCURRENCY=4 ... requests running at once, per expensive route
+    ADMISSION_EXPENSIVE_QUEUE=8 ......... requests allowed to wait for a slot, per route
+    ADMISSION_QUEUE_TIMEOUT=1.0 ......... seconds a queued request waits before a 503
+    ADMISSION_ROUTE_LIMITS= ............. per-route overrides "get_all_users=2:4,run_batch_requests=1:2"
+                                          (endpoint=concurrency:queue, any endpoint of the api blueprint)
+    ADMISSION_RATE=50 ................... requests per second per client (0 = no rate limit)
+    ADMISSION_BURST=100 ................. bucket size per client
+    ADMISSION_TRUSTED_PROXIES=1 ......... proxies in front of the app appending to X-Forwarded-For
+                                          (1: the Render/Heroku router, 0: clients connect directly)
+
+Limits are per worker process: with sync workers a worker only runs one
+request at a time, the concurrency limits matter with GUNICORN_THREADS > 1.
+Buckets are in process too, so the effective client rate is ADMISSION_RATE
+times the number of workers the load balancer spreads it over.
+
+Saturated routes answer 503, clients over their rate 429, both with Retry-After.
+"""
+
+# Endpoints (of the api blueprint) limited by default
+EXPENSIVE_ROUTES = (
+    'get_all_people',
+    'get_all_planets',
+    'get_all_vehicles',
+    'get_all_users',
+    'get_user_favorites',
+    'get_user_recommendations',
+    'get_people_also_favorited',
+    'run_batch_requests',
+)
+
+# Full lists that turn cheap with ?ids= (one IN query)
+MULTIGET_ROUTES = ('get_all_people', 'get_all_planets', 'get_all_vehicles', 'get_all_users')
+
+TRUSTED_PROXIES = int(os.getenv('ADMISSION_TRUSTED_PROXIES', '1'))
+
+MAX_CLIENTS = 10000
+SLOT_KEY = 'admission.limiter'
+
+
+def _parse_route_limits(value):
+    limits = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        endpoint, _, numbers = item.partition('=')
+        concurrency, _, queue = numbers.partition(':')
+        limits[endpoint.strip()] = (int(concurrency), int(queue or 0))
+    return limits
+
+
+############################################
+#######   Concurrency + wait queue   #######
+############################################
+class RouteLimiter:
+
+    def __init__(self, concurrency, queue):
+        self.slots   = threading.BoundedSemaphore(concurrency)
+        self.queue   = queue
+        self.waiting = 0
+        self.lock    = threading.Lock()
+
+    def acquire(self, timeout):
+        if self.slots.acquire(blocking=False):
+            return True
+
+        with self.lock:
+            if self.waiting >= self.queue:
+                return False
+            self.waiting += 1
+        try:
+            return self.slots.acquire(timeout=timeout)
+        finally:
+            with self.lock:
+                self.waiting -= 1
+
+    def release(self):
+        self.slots.release()
+
+
+############################################
+#######   Per-client token buckets   #######
+############################################
+class TokenBuckets:
+
+    def __init__(self, rate, burst):
+        self.rate    = rate
+        self.burst   = burst
+        self.lock    = threading.Lock()
+        self.buckets = {}  # client -> (tokens, updated_at)
+
+    def take(self, client):
+        """ 0 when admitted, else the seconds until a token is available """
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated_at = self.buckets.get(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+
+            if tokens < 1:
+                self.buckets[client] = (tokens, now)
+                return (1 - tokens) / self.rate
+
+            self.buckets[client] = (tokens - 1, now)
+            if len(self.buckets) > MAX_CLIENTS:
+                self._prune(now)
+            return 0
+
+    def _prune(self, now):
+        # A client idle long enough to have refilled its bucket carries no state
+        refill = self.burst / self.rate
+        self.buckets = {
+            client: state for client, state in self.buckets.items()
+            if now - state[1] < refill
+        }
+
+
+def client_id():
+    """ Address of the client, as seen by the first trusted proxy """
+    # Each trusted proxy appends the address it got the request from: the hop the first
+    # of them appended is the client, everything to its left was sent by the client itself
+    hops = [hop.strip() for hop in request.headers.get('X-Forwarded-For', '').split(',') if hop.strip()]
+    if TRUSTED_PROXIES and len(hops) >= TRUSTED_PROXIES:
+        return hops[-TRUSTED_PROXIES]
+    return request.remote_addr or 'unknown'
+
+
+def _rejected(status, message, retry_after):
+    response = jsonify({
+        'success': False,
+        'message': message
+    })
+    response.status_code = status
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+############################################
+#######             Setup            #######
+############################################
+def configure_admission(app):
+    if os.getenv('ADMISSION_CONTROL', '1') == '0':
+        return
+
+    concurrency   = int(os.getenv('ADMISSION_EXPENSIVE_CONCURRENCY', '4'))
+    queue         = int(os.getenv('ADMISSION_EXPENSIVE_QUEUE', '8'))
+    queue_timeout = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', '1.0'))
+    rate          = float(os.getenv('ADMISSION_RATE', '50'))
+    burst         = float(os.getenv('ADMISSION_BURST', '100'))
+
+    route_limits = {endpoint: (concurrency, queue) for endpoint in EXPENSIVE_ROUTES}
+    route_limits.update(_parse_route_limits(os.getenv('ADMISSION_ROUTE_LIMITS', '')))
+    limiters = {
+        f'api.{endpoint}': RouteLimiter(*limits)
+        for endpoint, limits in route_limits.items() if limits[0] > 0
+    }
+    buckets = TokenBuckets(rate, burst) if rate > 0 else None
+
+    @app.before_request
+    def admit_request():
+        endpoint = request.endpoint or ''
+        if request.method == 'OPTIONS' or not endpoint.startswith('api.'):
+            return None
+
+        if buckets is not None:
+            wait = buckets.take(client_id())
+            if wait:
+                return _rejected(429, 'Too many requests, slow down', wait)
+
+        limiter = limiters.get(endpoint)
+        if limiter is None or (endpoint[4:] in MULTIGET_ROUTES and 'ids' in request.args):
+            return None
+
+        if not limiter.acquire(queue_timeout):
+            logger.warning(f"Admission control: {endpoint} saturated, request shed")
+            return _rejected(503, 'Server busy, retry later', queue_timeout)
+
+        # Kept on the WSGI environ, not g: /batch sub-requests share the app context
+        request.environ[SLOT_KEY] = limiter
+        return None
+
+    @app.teardown_request
+    def release_slot(exception=None):
+        limiter = request.environ.pop(SLOT_KEY, None)
+        if limiter is not None:
+            limiter.release()
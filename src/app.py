@@ -2,15 +2,34 @@
 This module takes care of starting the API Server, Loading the DB and Adding the endpoints
 """
 import os
-from flask import Flask, request, jsonify, url_for
-from flask_migrate import Migrate
-from flask_swagger import swagger
+from flask import Flask, Blueprint, request, jsonify, current_app, g, send_from_directory
+from werkzeug.exceptions import NotFound
 from flask_cors import CORS
-from utils import APIException, generate_sitemap
-from admin import setup_admin
-from models import db, User
-
-from models import db, User, People, Planet, Vehicle, FavoritePeople, FavoritePlanets, FavoriteVehicles
+from utils import APIException, generate_sitemap, parse_id_list
+from sqlite_tuning import configure_sqlite
+from db_routing import configure_read_replica
+from response_cache import configure_response_cache
+from auth import configure_auth, check_password, issue_token, token_user_id, AuthError, TOKEN_TTL
+from idempotency import configure_idempotency
+from admission import configure_admission
+from statement_timeouts import configure_statement_timeouts
+from slow_queries import configure_slow_query_log
+from counters import most_favorited
+from commands import setup_commands
+from trending import trending, TrendingUnavailable, KINDS as TRENDING_KINDS, WINDOWS as TRENDING_WINDOWS
+from recommendations import recommender, hydrate, RecommendationsUnavailable
+from favorites import user_favorites, favorite_membership, FAVORITE_KINDS
+from multiget import get_many, parse_multiget_ids, with_not_found_markers
+from batch import parse_batch, run_batch, run_atomic_batch, after_commit
+from favorite_flags import favorite_flags
+from prerender import catalog_blobs, catalog_blob, in_request_order, with_fields, raw_json
+from residents import resolve_homeworld_id, residents_counts, residents_page, detach_residents
+from changes import changes_since, CursorExpired
+from events import emit_event
+from jobs import configure_jobs, enqueue_job, cancel_job, FINISHED as JOB_FINISHED, EXPORT_DIR as JOBS_EXPORT_DIR
+
+from models import db, User, People, Planet, Vehicle, FavoritePeople, FavoritePlanets, FavoriteVehicles, Job
+from sqlalchemy import or_
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 
 
@@ -23,34 +42,22 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 ######################################
 
-app = Flask(__name__)
-app.url_map.strict_slashes = False
-
-db_url = os.getenv("DATABASE_URL")
-if db_url is not None:
-    app.config['SQLALCHEMY_DATABASE_URI'] = db_url.replace("postgres://", "postgresql://")
-else:
-    app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:////tmp/test.db"
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-MIGRATE = Migrate(app, db)
-db.init_app(app)
-CORS(app)
-setup_admin(app)
+# Every endpoint lives on this blueprint, the app itself is built by create_app() at the bottom
+api = Blueprint('api', __name__)
 
 
 # Handle/serialize errors like a JSON object
-@app.errorhandler(APIException)
+@api.app_errorhandler(APIException)
 def handle_invalid_usage(error):
     return jsonify(error.to_dict()), error.status_code
 
 # generate sitemap with all your endpoints
-@app.route('/')
+@api.route('/')
 def sitemap():
-    return generate_sitemap(app)
+    return generate_sitemap(current_app)
 
 
-@app.route('/user', methods=['GET'])
+@api.route('/user', methods=['GET'])
 def handle_hello():
 
     response_body = {
@@ -91,21 +98,55 @@ Extra changes from original requirements:
     |
     |-----------
     |    People's information [GET], [POST], [PUT] and [DELETE]:
-    |        [] Get list of ALL PEOPLE ----------------> [GET]    /people
+    |        [] Get list of ALL PEOPLE ----------------> [GET]    /people?user_id=<id>&ids=1,5,9  (is_favorite flags, multi-get)
     |        [] Get ONE PERSON ------------------------> [GET]    /people/<int:people_id>
+    |        [] Most favorited PEOPLE -----------------> [GET]    /people/popular?limit=10
+    |        [] Changes of PEOPLE (delta sync) --------> [GET]    /people/changes?since=<cursor>
+    |        [] Also favorited with a PERSON ----------> [GET]    /people/<int:people_id>/also-favorited
     |        [] Add one PEOPLE ------------------------> [POST]   /people
     |        [] Update one PEOPLE ---------------------> [PUT]    /people/<int:people_id>
     |        [] Delete one PEOPLE ---------------------> [DELETE] /people/<int:people_id>
     |
     |-----------
     |    Planets' information [GET], [POST], [PUT] and [DELETE]:
-    |        [] Get list of ALL PLANETS ---------------> [GET]    /planets
+    |        [] Get list of ALL PLANETS ---------------> [GET]    /planets?user_id=<id>&ids=1,5,9  (is_favorite flags, multi-get)
     |        [] Get ONE PLANET ------------------------> [GET]    /planets/<int:planet_id>
+    |        [] Most favorited PLANETS ----------------> [GET]    /planets/popular?limit=10
+    |        [] Changes of PLANETS (delta sync) -------> [GET]    /planets/changes?since=<cursor>
+    |        [] Residents of ONE PLANET ---------------> [GET]    /planets/<int:planet_id>/residents?page=1&per_page=20
     |        [] Add one PLANET ------------------------> [POST]   /planets
     |        [] Update one PLANET ---------------------> [PUT]    /planets/<int:planet_id>
     |        [] Delete one PLANET ---------------------> [DELETE] /planets/<int:planet_id>
     |
     |
+    |-----------
+    |    Trending favorites:
+    |        [] Top trending by type ------------------> [GET]    /trending?type=planet&window=7d
+    |
+    |
+    |-----------
+    |    Event stream (ASGI entry point only, see events.py):
+    |        [] Catalog and favorites changes (SSE) ---> [GET]    /events?topics=people,favorites  (favorites: Bearer token, Last-Event-ID resume)
+    |
+    |
+    |-----------
+    |    Background jobs (imports, exports, repairs, bulk deletes, see jobs.py):
+    |        [] Queue a job ---------------------------> [POST]   /jobs  {"type": "import-catalog", "params": {"kind": "people", "items": [...]}}
+    |        [] Status and progress of ONE job --------> [GET]    /jobs/<int:job_id>
+    |        [] Cancel ONE job ------------------------> [POST]   /jobs/<int:job_id>/cancel
+    |        [] Download an export --------------------> [GET]    /jobs/<int:job_id>/download
+    |
+    |
+    |-----------
+    |    Batch:
+    |        [] Many API calls in one request ---------> [POST]   /batch  {"requests": [{"method", "path", "body"}], "atomic": false}
+    |
+    |
+    |-----------
+    |    Retries: every POST / PUT / DELETE accepts an `Idempotency-Key` header,
+    |             a retry with the same key gets the first answer back (see idempotency.py)
+    |
+    |
     |-----------------------------------------------------------------------
     |
     |
@@ -113,9 +154,14 @@ Extra changes from original requirements:
     |
     |-----------
     |    [GET] User's information:
-    |        [] Get list of ALL USERS -----------------> [GET]  /users
+    |        [] Get list of ALL USERS -----------------> [GET]  /users?ids=1,5,9  (ids: multi-get)
     |        [] Get One User info ---------------------> [GET]  /user/<int:user_id>  ..................................... (EXTRA endpoint)
     |
+    |-----------
+    |    Login (see auth.py):
+    |        [] Token for the favorites endpoints -----> [POST] /login  {"email": ..., "password": ...}
+    |           then send `Authorization: Bearer <token>` to every /user/<int:user_id>/favorite... endpoint
+    |
     |
     |-----------------------------------------------------------------------
     |
@@ -125,6 +171,8 @@ Extra changes from original requirements:
     |-----------
     |    Favorites from One USER:
     |        [] One user, ALL Favorites ---------------> [GET]    /user/<int:user_id>/favorites  ......................... CHANGED URL ENDPOINT
+    |        [] Recommendations for one USER ----------> [GET]    /user/<int:user_id>/recommendations
+    |        [] Are these ids favorites? --------------> [GET]    /user/<int:user_id>/favorites/contains?people=1,2&planets=3
     |
     |-----------
     |    Adding new favorites:
@@ -159,15 +207,34 @@ Extra changes from original requirements:
 ############################################
 #######    Get list of ALL PEOPLE    #######
 ############################################
-@app.route('/people', methods=['GET'])
+@api.route('/people', methods=['GET'])
 def get_all_people():
 
     try:
-        people = People.query.all()
-        return jsonify({
-            'total': len(people),
-            'data': [person.serialize() for person in people]
-        }), 200
+        # ?ids=1,5,9 -> only those, in that order, one IN query
+        ids = None
+        if 'ids' in request.args:
+            try:
+                ids = parse_multiget_ids(request.args['ids'])
+            except ValueError as e:
+                return jsonify({
+                    'success': False,
+                    'message': str(e)
+                }), 400
+
+        # Pre-rendered rows (see prerender.py), spliced into the body as they are
+        rows = catalog_blobs(People, ids)
+
+        # ?user_id=<id> marks the user's favorites (checked against the token, see auth.py), on top of the shared catalog rows
+        user_id = request.args.get('user_id', type=int)
+        if user_id is not None:
+            rows = favorite_flags.overlay(user_id, 'people', rows)
+
+        data = in_request_order(ids, rows) if ids is not None else [blob for _, blob in rows]
+
+        return raw_json({
+            'total': len(rows)
+        }, data), 200
     
     except SQLAlchemyError as e:
         logger.error(f"Database error in get_all_people: {str(e)}")
@@ -186,25 +253,104 @@ def get_all_people():
         }), 500
 
 
+############################################
+#######   Most favorited PEOPLE      #######
+############################################
+@api.route('/people/popular', methods=['GET'])
+def get_popular_people():
+
+    try:
+        limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+        people = most_favorited(People, limit)
+
+        return jsonify({
+            'success': True,
+            'total': len(people),
+            'data': [{**item.serialize(), 'favorite_count': item.favorite_count} for item in people]
+        }), 200
+
+    except SQLAlchemyError as e:
+        logger.error(f"Database error in get_popular_people: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Database error occurred',
+            'error': str(e)
+        }), 500
+
+    except Exception as e:
+        logger.error(f"Unexpected error in get_popular_people: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Internal server error',
+            'error': str(e)
+        }), 500
+
+
+############################################
+#######   Changes of PEOPLE (sync)   #######
+############################################
+@api.route('/people/changes', methods=['GET'])
+def get_people_changes():
+
+    try:
+        # Cursors are positions on the primary, a lagging replica would skip rows
+        g.force_primary = True
+        try:
+            rows, deleted, cursor, has_more = changes_since(People, request.args.get('since'))
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'message': str(e)
+            }), 400
+        except CursorExpired:
+            return jsonify({
+                'success': False,
+                'message': 'Cursor expired, sync again from the start (without since)'
+            }), 410
+
+        return raw_json({
+            'success': True,
+            'deleted': deleted,
+            'next': cursor,
+            'has_more': has_more,
+            'total': len(rows)
+        }, [blob for _, blob in rows]), 200
+
+    except SQLAlchemyError as e:
+        logger.error(f"Database error in get_people_changes: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Database error occurred',
+            'error': str(e)
+        }), 500
+
+    except Exception as e:
+        logger.error(f"Unexpected error in get_people_changes: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Internal server error',
+            'error': str(e)
+        }), 500
+
+
 ############################################
 #######     Get ONE PERSON by ID     #######
 ############################################
-@app.route('/people/<int:people_id>', methods=['GET'])
+@api.route('/people/<int:people_id>', methods=['GET'])
 def get_one_person(people_id):
     
     try:
-        person = People.query.get(people_id)
+        person = catalog_blob(People, people_id)
 
-        if not person:
+        if person is None:
             return jsonify({
                 'success': False,
                 'message': f'Person with ID {people_id} not found'
             }), 404
         
-        return jsonify({
-            'success': True,
-            'data': person.serialize()
-        }), 200
+        return raw_json({
+            'success': True
+        }, person), 200
     
     except SQLAlchemyError as e:
         logger.error(f"Database error in get_one_person: {str(e)}")
@@ -223,6 +369,56 @@ def get_one_person(people_id):
         }), 500
 
 
+############################################
+#######  People also favorited       #######
+############################################
+@api.route('/people/<int:people_id>/also-favorited', methods=['GET'])
+def get_people_also_favorited(people_id):
+
+    try:
+        person = People.query.get(people_id)
+
+        if not person:
+            return jsonify({
+                'success': False,
+                'message': f'Person with ID {people_id} not found'
+            }), 404
+
+        recommender.ensure_started(current_app._get_current_object())
+        limit     = min(max(request.args.get('limit', 10, type=int), 1), 50)
+        only_kind = request.args.get('type')
+        data      = hydrate(recommender.also_favorited('people', people_id, limit, only_kind))
+
+        return jsonify({
+            'success': True,
+            'people_id': people_id,
+            'total': len(data),
+            'data': data
+        }), 200
+
+    except RecommendationsUnavailable as e:
+        return jsonify({
+            'success': False,
+            'message': f'Recommendations are not available ({str(e)}), retry later'
+        }), 503, {'Retry-After': '10'}
+
+    except SQLAlchemyError as e:
+        logger.error(f"Database error in get_people_also_favorited: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Database error occurred',
+            'error': str(e)
+        }), 500
+
+    except Exception as e:
+        logger.error(f"Unexpected error in get_people_also_favorited: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Internal server error',
+            'error': str(e)
+        }), 500
+
+
 ############################################
 #######         Add one PERSON       #######
 ############################################
@@ -240,7 +436,7 @@ def get_one_person(people_id):
     "url": "https://swapi.dev/api/people/4/"
 }
 """
-@app.route('/people', methods=['POST'])
+@api.route('/people', methods=['POST'])
 def add_person():
 
     try:
@@ -274,10 +470,12 @@ def add_person():
             mass       = data['mass'],
             skin_color = data['skin_color'],
             homeworld  = data['homeworld'],
-            url        = data['url']
+            url        = data['url'],
+            homeworld_id = data.get('homeworld_id') or resolve_homeworld_id(data['homeworld'])
         )
 
         db.session.add(new_person)
+        emit_event('people.created', new_person)
         db.session.commit()
 
         return jsonify({
@@ -317,7 +515,7 @@ def add_person():
 ############################################
 #######       Update one PERSON      #######
 ############################################
-@app.route('/people/<int:people_id>', methods=['PUT'])
+@api.route('/people/<int:people_id>', methods=['PUT'])
 def update_person(people_id):
 
     try:
@@ -344,6 +542,13 @@ def update_person(people_id):
             if field in data:
                 setattr(person, field, data[field])
 
+        # An explicit homeworld_id wins, else it follows the homeworld string
+        if 'homeworld_id' in data:
+            person.homeworld_id = data['homeworld_id']
+        elif 'homeworld' in data:
+            person.homeworld_id = resolve_homeworld_id(data['homeworld'])
+
+        emit_event('people.updated', person)
         db.session.commit()
 
         return jsonify({
@@ -383,7 +588,7 @@ def update_person(people_id):
 ############################################
 #######       Delete one PERSON      #######
 ############################################
-@app.route('/people/<int:people_id>', methods=['DELETE'])
+@api.route('/people/<int:people_id>', methods=['DELETE'])
 def delete_person(people_id):
 
     try:
@@ -396,7 +601,9 @@ def delete_person(people_id):
             }), 404
 
         db.session.delete(person)
+        emit_event('people.deleted', id=people_id)
         db.session.commit()
+        after_commit(lambda: favorite_flags.forget_entity('people', people_id))
 
         return jsonify({
             'success': True,
@@ -433,17 +640,39 @@ def delete_person(people_id):
 ############################################
 #######    Get list of ALL PLANETS   #######
 ############################################
-@app.route('/planets', methods=['GET'])
+@api.route('/planets', methods=['GET'])
 def get_all_planets():
 
     try:
-        planets = Planet.query.all()
-
-        return jsonify({
+        # ?ids=1,5,9 -> only those, in that order, one IN query
+        ids = None
+        if 'ids' in request.args:
+            try:
+                ids = parse_multiget_ids(request.args['ids'])
+            except ValueError as e:
+                return jsonify({
+                    'success': False,
+                    'message': str(e)
+                }), 400
+
+        # Pre-rendered rows (see prerender.py), spliced into the body as they are
+        rows = catalog_blobs(Planet, ids)
+
+        # Residents of every listed planet with one GROUP BY, not one count per planet
+        counts = residents_counts(ids)
+        rows = [(planet_id, with_fields(blob, residents_count=counts.get(planet_id, 0))) for planet_id, blob in rows]
+
+        # ?user_id=<id> marks the user's favorites (checked against the token, see auth.py), on top of the shared catalog rows
+        user_id = request.args.get('user_id', type=int)
+        if user_id is not None:
+            rows = favorite_flags.overlay(user_id, 'planets', rows)
+
+        data = in_request_order(ids, rows) if ids is not None else [blob for _, blob in rows]
+
+        return raw_json({
             'success': True,
-            'total': len(planets),
-            'data': [planet.serialize() for planet in planets]
-        }), 200
+            'total': len(rows)
+        }, data), 200
     
     except SQLAlchemyError as e:
         logger.error(f"Database error in get_all_planets: {str(e)}")
@@ -462,25 +691,108 @@ def get_all_planets():
         }), 500
 
 
+############################################
+#######   Most favorited PLANETS     #######
+############################################
+@api.route('/planets/popular', methods=['GET'])
+def get_popular_planets():
+
+    try:
+        limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+        planets = most_favorited(Planet, limit)
+
+        return jsonify({
+            'success': True,
+            'total': len(planets),
+            'data': [{**item.serialize(), 'favorite_count': item.favorite_count} for item in planets]
+        }), 200
+
+    except SQLAlchemyError as e:
+        logger.error(f"Database error in get_popular_planets: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Database error occurred',
+            'error': str(e)
+        }), 500
+
+    except Exception as e:
+        logger.error(f"Unexpected error in get_popular_planets: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Internal server error',
+            'error': str(e)
+        }), 500
+
+
+############################################
+#######   Changes of PLANETS (sync)  #######
+############################################
+@api.route('/planets/changes', methods=['GET'])
+def get_planets_changes():
+
+    try:
+        # Cursors are positions on the primary, a lagging replica would skip rows
+        g.force_primary = True
+        try:
+            rows, deleted, cursor, has_more = changes_since(Planet, request.args.get('since'))
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'message': str(e)
+            }), 400
+        except CursorExpired:
+            return jsonify({
+                'success': False,
+                'message': 'Cursor expired, sync again from the start (without since)'
+            }), 410
+
+        # Same rows as GET /planets, residents_count included
+        counts = residents_counts([planet_id for planet_id, _ in rows])
+        rows = [(planet_id, with_fields(blob, residents_count=counts.get(planet_id, 0))) for planet_id, blob in rows]
+
+        return raw_json({
+            'success': True,
+            'deleted': deleted,
+            'next': cursor,
+            'has_more': has_more,
+            'total': len(rows)
+        }, [blob for _, blob in rows]), 200
+
+    except SQLAlchemyError as e:
+        logger.error(f"Database error in get_planets_changes: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Database error occurred',
+            'error': str(e)
+        }), 500
+
+    except Exception as e:
+        logger.error(f"Unexpected error in get_planets_changes: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Internal server error',
+            'error': str(e)
+        }), 500
+
+
 ############################################
 #######     Get ONE PLANET by ID     #######
 ############################################
-@app.route('/planets/<int:planet_id>', methods=['GET'])
+@api.route('/planets/<int:planet_id>', methods=['GET'])
 def get_one_planet(planet_id):
    
     try:
-        planet = Planet.query.get(planet_id)
+        planet = catalog_blob(Planet, planet_id)
 
-        if not planet:
+        if planet is None:
             return jsonify({
                 'success': False,
                 'message': f'Planet with ID {planet_id} not found'
             }), 404
         
-        return jsonify({
-            'success': True,
-            'data': planet.serialize()
-        }), 200
+        return raw_json({
+            'success': True
+        }, with_fields(planet, residents_count=residents_counts([planet_id]).get(planet_id, 0))), 200
     
     except SQLAlchemyError as e:
         logger.error(f"Database error in get_one_planet: {str(e)}")
@@ -499,6 +811,51 @@ def get_one_planet(planet_id):
         }), 500
 
 
+############################################
+#######   Residents of ONE PLANET    #######
+############################################
+@api.route('/planets/<int:planet_id>/residents', methods=['GET'])
+def get_planet_residents(planet_id):
+
+    try:
+        planet = Planet.query.get(planet_id)
+
+        if not planet:
+            return jsonify({
+                'success': False,
+                'message': f'Planet with ID {planet_id} not found'
+            }), 404
+
+        page     = max(request.args.get('page', 1, type=int), 1)
+        per_page = min(max(request.args.get('per_page', 20, type=int), 1), 100)
+        people, total = residents_page(planet_id, page, per_page)
+
+        return jsonify({
+            'success': True,
+            'planet_id': planet_id,
+            'page': page,
+            'per_page': per_page,
+            'total': total,
+            'data': [person.serialize() for person in people]
+        }), 200
+
+    except SQLAlchemyError as e:
+        logger.error(f"Database error in get_planet_residents: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Database error occurred',
+            'error': str(e)
+        }), 500
+
+    except Exception as e:
+        logger.error(f"Unexpected error in get_planet_residents: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Internal server error',
+            'error': str(e)
+        }), 500
+
+
 ############################################
 #######     Add one PLANET     #######
 ############################################
@@ -516,7 +873,7 @@ def get_one_planet(planet_id):
     "url": "https://swapi.dev/api/planets/1/"
 }
 """
-@app.route('/planets', methods=['POST'])
+@api.route('/planets', methods=['POST'])
 def add_planet():
 
     try:
@@ -554,6 +911,7 @@ def add_planet():
         )
 
         db.session.add(new_planet)
+        emit_event('planets.created', new_planet)
         db.session.commit()
 
         return jsonify({
@@ -593,7 +951,7 @@ def add_planet():
 ############################################
 #######       Update one PLANET      #######
 ############################################
-@app.route('/planets/<int:planet_id>', methods=['PUT'])
+@api.route('/planets/<int:planet_id>', methods=['PUT'])
 def update_planet(planet_id):
 
     try:
@@ -620,6 +978,7 @@ def update_planet(planet_id):
             if field in data:
                 setattr(planet, field, data[field])
 
+        emit_event('planets.updated', planet)
         db.session.commit()
 
         return jsonify({
@@ -659,7 +1018,7 @@ def update_planet(planet_id):
 ############################################
 #######       Delete one PLANET      #######
 ############################################
-@app.route('/planets/<int:planet_id>', methods=['DELETE'])
+@api.route('/planets/<int:planet_id>', methods=['DELETE'])
 def delete_planet(planet_id):
 
     try:
@@ -671,8 +1030,11 @@ def delete_planet(planet_id):
                 'message': f'Planet with ID {planet_id} not found'
             }), 404
 
+        detach_residents(planet_id)
         db.session.delete(planet)
+        emit_event('planets.deleted', id=planet_id)
         db.session.commit()
+        after_commit(lambda: favorite_flags.forget_entity('planets', planet_id))
 
         return jsonify({
             'success': True,
@@ -710,17 +1072,35 @@ def delete_planet(planet_id):
 ############################################
 #######   Get list of ALL VEHICLES   #######
 ############################################
-@app.route('/vehicles', methods=['GET'])
+@api.route('/vehicles', methods=['GET'])
 def get_all_vehicles():
 
     try:
-        vehicles = Vehicle.query.all()
-
-        return jsonify({
+        # ?ids=1,5,9 -> only those, in that order, one IN query
+        ids = None
+        if 'ids' in request.args:
+            try:
+                ids = parse_multiget_ids(request.args['ids'])
+            except ValueError as e:
+                return jsonify({
+                    'success': False,
+                    'message': str(e)
+                }), 400
+
+        # Pre-rendered rows (see prerender.py), spliced into the body as they are
+        rows = catalog_blobs(Vehicle, ids)
+
+        # ?user_id=<id> marks the user's favorites (checked against the token, see auth.py), on top of the shared catalog rows
+        user_id = request.args.get('user_id', type=int)
+        if user_id is not None:
+            rows = favorite_flags.overlay(user_id, 'vehicles', rows)
+
+        data = in_request_order(ids, rows) if ids is not None else [blob for _, blob in rows]
+
+        return raw_json({
             'success': True,
-            'data': [vehicle.serialize() for vehicle in vehicles],
-            'total': len(vehicles)
-        }), 200
+            'total': len(rows)
+        }, data), 200
     
     except SQLAlchemyError as e:
         logger.error(f"Database error in get_all_vehicles: {str(e)}")
@@ -740,35 +1120,31 @@ def get_all_vehicles():
 
 
 ############################################
-#######     Get ONE VEHICLE by ID    #######
+#######   Most favorited VEHICLES    #######
 ############################################
-@app.route('/vehicles/<int:vehicle_id>', methods=['GET'])
-def get_one_vehicle(vehicle_id):
+@api.route('/vehicles/popular', methods=['GET'])
+def get_popular_vehicles():
 
     try:
-        vehicle = Vehicle.query.get(vehicle_id)
+        limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+        vehicles = most_favorited(Vehicle, limit)
 
-        if not vehicle:
-            return jsonify({
-                'success': False,
-                'message': f'Vehicle with ID {vehicle_id} not found'
-            }), 404
-        
         return jsonify({
             'success': True,
-            'data': vehicle.serialize()
+            'total': len(vehicles),
+            'data': [{**item.serialize(), 'favorite_count': item.favorite_count} for item in vehicles]
         }), 200
-    
+
     except SQLAlchemyError as e:
-        logger.error(f"Database error in get_one_vehicle: {str(e)}")
+        logger.error(f"Database error in get_popular_vehicles: {str(e)}")
         return jsonify({
             'success': False,
             'message': 'Database error occurred',
             'error': str(e)
         }), 500
-    
+
     except Exception as e:
-        logger.error(f"Unexpected error in get_one_vehicle: {str(e)}")
+        logger.error(f"Unexpected error in get_popular_vehicles: {str(e)}")
         return jsonify({
             'success': False,
             'message': 'Internal server error',
@@ -777,36 +1153,119 @@ def get_one_vehicle(vehicle_id):
 
 
 ############################################
-#######        Add one VEHICLE       #######
+#######  Changes of VEHICLES (sync)  #######
 ############################################
-""" JSON example
-{
-    "name": "Sand Crawler",
-    "model": "Digger Crawler",
-    "vehicle_class": "wheeled",
-    "manufacturer": "Corellia Mining Corporation",
-    "length": "36.8",
-    "cost_in_credits": "150000",
-    "crew": "46",
-    "passengers": "30",
-    "max_atmos_speed": "30",
-    "cargo_capacity": "50000",
-    "consumables": "2 months",
-    "url": "https://swapi.dev/api/vehicles/4/"
-}
-"""
-@app.route('/vehicles', methods=['POST'])
-def add_vehicle():
+@api.route('/vehicles/changes', methods=['GET'])
+def get_vehicles_changes():
 
     try:
-        data = request.get_json()
-
-        if not data:
+        # Cursors are positions on the primary, a lagging replica would skip rows
+        g.force_primary = True
+        try:
+            rows, deleted, cursor, has_more = changes_since(Vehicle, request.args.get('since'))
+        except ValueError as e:
             return jsonify({
                 'success': False,
-                'message': 'No JSON data provided'
+                'message': str(e)
             }), 400
-
+        except CursorExpired:
+            return jsonify({
+                'success': False,
+                'message': 'Cursor expired, sync again from the start (without since)'
+            }), 410
+
+        return raw_json({
+            'success': True,
+            'deleted': deleted,
+            'next': cursor,
+            'has_more': has_more,
+            'total': len(rows)
+        }, [blob for _, blob in rows]), 200
+
+    except SQLAlchemyError as e:
+        logger.error(f"Database error in get_vehicles_changes: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Database error occurred',
+            'error': str(e)
+        }), 500
+
+    except Exception as e:
+        logger.error(f"Unexpected error in get_vehicles_changes: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Internal server error',
+            'error': str(e)
+        }), 500
+
+
+############################################
+#######     Get ONE VEHICLE by ID    #######
+############################################
+@api.route('/vehicles/<int:vehicle_id>', methods=['GET'])
+def get_one_vehicle(vehicle_id):
+
+    try:
+        vehicle = catalog_blob(Vehicle, vehicle_id)
+
+        if vehicle is None:
+            return jsonify({
+                'success': False,
+                'message': f'Vehicle with ID {vehicle_id} not found'
+            }), 404
+        
+        return raw_json({
+            'success': True
+        }, vehicle), 200
+    
+    except SQLAlchemyError as e:
+        logger.error(f"Database error in get_one_vehicle: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Database error occurred',
+            'error': str(e)
+        }), 500
+    
+    except Exception as e:
+        logger.error(f"Unexpected error in get_one_vehicle: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Internal server error',
+            'error': str(e)
+        }), 500
+
+
+############################################
+#######        Add one VEHICLE       #######
+############################################
+""" JSON example
+{
+    "name": "Sand Crawler",
+    "model": "Digger Crawler",
+    "vehicle_class": "wheeled",
+    "manufacturer": "Corellia Mining Corporation",
+    "length": "36.8",
+    "cost_in_credits": "150000",
+    "crew": "46",
+    "passengers": "30",
+    "max_atmos_speed": "30",
+    "cargo_capacity": "50000",
+    "consumables": "2 months",
+    "url": "https://swapi.dev/api/vehicles/4/"
+}
+"""
+@api.route('/vehicles', methods=['POST'])
+def add_vehicle():
+
+    try:
+        data = request.get_json()
+
+        if not data:
+            return jsonify({
+                'success': False,
+                'message': 'No JSON data provided'
+            }), 400
+
         # Validate required fields
         required_fields = ['name', 'model', 'vehicle_class', 'manufacturer', 'length', 'cost_in_credits', 'crew', 'passengers', 'max_atmos_speed', 'cargo_capacity', 'consumables', 'url']
         
@@ -835,6 +1294,7 @@ def add_vehicle():
         ) 
 
         db.session.add(new_vehicle)
+        emit_event('vehicles.created', new_vehicle)
         db.session.commit()
 
         return jsonify({
@@ -874,7 +1334,7 @@ def add_vehicle():
 ############################################
 #######      Update one VEHICLE      #######
 ############################################
-@app.route('/vehicles/<int:vehicle_id>', methods=['PUT'])
+@api.route('/vehicles/<int:vehicle_id>', methods=['PUT'])
 def update_vehicle(vehicle_id):
 
     try:
@@ -901,6 +1361,7 @@ def update_vehicle(vehicle_id):
             if field in data:
                 setattr(vehicle, field, data[field])
 
+        emit_event('vehicles.updated', vehicle)
         db.session.commit()
 
         return jsonify({
@@ -940,7 +1401,7 @@ def update_vehicle(vehicle_id):
 ############################################
 #######      Delete one VEHICLE      #######
 ############################################
-@app.route('/vehicles/<int:vehicle_id>', methods=['DELETE'])
+@api.route('/vehicles/<int:vehicle_id>', methods=['DELETE'])
 def delete_vehicle(vehicle_id):
 
     try:
@@ -953,7 +1414,9 @@ def delete_vehicle(vehicle_id):
             }), 404
 
         db.session.delete(vehicle)
+        emit_event('vehicles.deleted', id=vehicle_id)
         db.session.commit()
+        after_commit(lambda: favorite_flags.forget_entity('vehicles', vehicle_id))
 
         return jsonify({
             'success': True,
@@ -981,6 +1444,80 @@ def delete_vehicle(vehicle_id):
 
 
 
+#########################################################################################
+#########################################################################################
+#############                      TRENDING ENDPOINTS                       #############
+#########################################################################################
+#########################################################################################
+
+
+############################################
+#######   Trending favorites (decay) #######
+############################################
+"""
+    /trending?type=planet&window=7d&limit=10
+
+    type:   people | planet | vehicle
+    window: 1d | 7d | 30d   (time constant of the exponential decay)
+"""
+@api.route('/trending', methods=['GET'])
+def get_trending():
+
+    try:
+        kind   = request.args.get('type', 'people')
+        window = request.args.get('window', '7d')
+        limit  = min(max(request.args.get('limit', 10, type=int), 1), 100)
+
+        if kind not in TRENDING_KINDS or window not in TRENDING_WINDOWS:
+            return jsonify({
+                'success': False,
+                'message': f'type must be one of {", ".join(TRENDING_KINDS)} and window one of {", ".join(TRENDING_WINDOWS)}'
+            }), 400
+
+        trending.ensure_started(current_app._get_current_object())
+        ranking = trending.top(kind, window, limit)
+
+        model = TRENDING_KINDS[kind][0]
+        entities = {item.id: item for item in model.query.filter(model.id.in_([entity_id for entity_id, _ in ranking]))}
+
+        data = [
+            {**entities[entity_id].serialize(), 'trending_score': round(score, 4)}
+            for entity_id, score in ranking if entity_id in entities
+        ]
+
+        return jsonify({
+            'success': True,
+            'type': kind,
+            'window': window,
+            'total': len(data),
+            'data': data
+        }), 200
+
+    except TrendingUnavailable as e:
+        return jsonify({
+            'success': False,
+            'message': f'Trending is not available ({str(e)}), retry later'
+        }), 503, {'Retry-After': '10'}
+
+    except SQLAlchemyError as e:
+        logger.error(f"Database error in get_trending: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Database error occurred',
+            'error': str(e)
+        }), 500
+
+    except Exception as e:
+        logger.error(f"Unexpected error in get_trending: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Internal server error',
+            'error': str(e)
+        }), 500
+
+
+
+
 #########################################################################################
 #########################################################################################
 #############                         USER ENDPOINTS                        #############
@@ -1000,15 +1537,36 @@ def delete_vehicle(vehicle_id):
 ############################################
 #######    Get list of ALL USERS     #######
 ############################################
-@app.route('/users', methods=['GET'])
+@api.route('/users', methods=['GET'])
 def get_all_users():
 
     try:
-        users = User.query.all()
+        # ?ids=1,5,9 -> only those, in that order, one IN query
+        ids = None
+        if 'ids' in request.args:
+            try:
+                ids = parse_multiget_ids(request.args['ids'])
+            except ValueError as e:
+                return jsonify({
+                    'success': False,
+                    'message': str(e)
+                }), 400
+
+        if ids is not None:
+            found = get_many(User, ids)
+            users = [found[entity_id] for entity_id in ids if entity_id in found]
+        else:
+            users = User.query.all()
+
+
+        data = [user.serialize() for user in users]
+
+        if ids is not None:
+            data = with_not_found_markers(ids, data)
 
         return jsonify({
             'success': True,
-            'data': [user.serialize() for user in users],
+            'data': data,
             'total': len(users)
         }), 200
     
@@ -1032,7 +1590,7 @@ def get_all_users():
 ############################################
 #######       Get One User info      #######
 ############################################
-@app.route('/user/<int:user_id>', methods=['GET'])
+@api.route('/user/<int:user_id>', methods=['GET'])
 def get_one_user(user_id):
 
     try:
@@ -1068,6 +1626,71 @@ def get_one_user(user_id):
 
 
 
+############################################
+#######   LOGIN, signed short token  #######
+############################################
+@api.route('/login', methods=['POST'])
+def login():
+
+    try:
+        payload  = request.get_json(silent=True) or {}
+        username = payload.get('email') or payload.get('username')
+        password = payload.get('password')
+
+        if not isinstance(username, str) or not isinstance(password, str):
+            return jsonify({
+                'success': False,
+                'message': 'Body must be {"email" (or "username"): ..., "password": ...}'
+            }), 400
+
+        user = User.query.filter(or_(User.email == username, User.username == username)).first()
+
+        # Same answer for an unknown user and a wrong password
+        if not check_password(user, password):
+            return jsonify({
+                'success': False,
+                'message': 'Invalid credentials'
+            }), 401
+
+        # A plain text password left from before the hashing was just replaced by its hash
+        db.session.commit()
+
+        return jsonify({
+            'success': True,
+            'user_id': user.id,
+            'is_active': user.is_active,
+            'token': issue_token(user),
+            'token_type': 'Bearer',
+            'expires_in': TOKEN_TTL
+        }), 200
+
+    except AuthError as e:
+        return jsonify({
+            'success': False,
+            'message': e.message
+        }), e.status
+
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logger.error(f"Database error in login: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Database error occurred',
+            'error': str(e)
+        }), 500
+
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Unexpected error in login: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Internal server error',
+            'error': str(e)
+        }), 500
+
+
+
+
 #########################################################################################
 #########################################################################################
 #############                      FAVORITES ENDPOINTS                      #############
@@ -1079,13 +1702,15 @@ def get_one_user(user_id):
 ############################################
 #######   One user, ALL Favorites    #######
 ############################################
-@app.route('/user/<int:user_id>/favorites', methods=['GET'])
+@api.route('/user/<int:user_id>/favorites', methods=['GET'])
 def get_user_favorites(user_id):
 
     try:
-        user = User.query.get(user_id)
+        # One UNION ALL query for the three favorites tables and their entities
+        favorites = user_favorites(user_id)
 
-        if not user:
+        # Only an empty result without a verified token needs to know whether the user exists at all
+        if not any(favorites.values()) and token_user_id() != user_id and not User.query.get(user_id):
             return jsonify({
                 'success': False,
                 'message': f'User with ID {user_id} not found'
@@ -1094,15 +1719,11 @@ def get_user_favorites(user_id):
         return jsonify({
             'success': True,
             'user_id': user_id,
-            'favorites': {
-                'people':   [fav.serialize() for fav in user.favorite_people],
-                'planets':  [fav.serialize() for fav in user.favorite_planets],
-                'vehicles': [fav.serialize() for fav in user.favorite_vehicles]
-            },
+            'favorites': favorites,
             'totals': {
-                'people':   len(user.favorite_people),
-                'planets':  len(user.favorite_planets),
-                'vehicles': len(user.favorite_vehicles)
+                'people':   len(favorites['people']),
+                'planets':  len(favorites['planets']),
+                'vehicles': len(favorites['vehicles'])
             }
         }), 200
 
@@ -1125,6 +1746,134 @@ def get_user_favorites(user_id):
 
 
 
+############################################
+#######  Bulk favorite membership    #######
+############################################
+# Ids accepted by one /favorites/contains request, all kinds together
+MAX_CONTAINS_IDS = 5000
+
+@api.route('/user/<int:user_id>/favorites/contains', methods=['GET'])
+def get_user_favorites_contains(user_id):
+
+    try:
+        try:
+            ids_by_kind = {
+                kind: parse_id_list(request.args[kind])
+                for kind in FAVORITE_KINDS if request.args.get(kind)
+            }
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'message': 'Ids must be comma separated integers, e.g. ?people=1,2,3'
+            }), 400
+
+        if not ids_by_kind:
+            return jsonify({
+                'success': False,
+                'message': f'Nothing to check, use any of: {", ".join(FAVORITE_KINDS)}'
+            }), 400
+
+        if sum(len(ids) for ids in ids_by_kind.values()) > MAX_CONTAINS_IDS:
+            return jsonify({
+                'success': False,
+                'message': f'At most {MAX_CONTAINS_IDS} ids per request'
+            }), 400
+
+        # Answer from the user's cached flags when a catalog overlay already loaded them
+        bitsets = favorite_flags.cached(user_id)
+        if bitsets is not None:
+            membership = {
+                kind: {entity_id: entity_id in bitsets[kind] for entity_id in ids}
+                for kind, ids in ids_by_kind.items()
+            }
+        else:
+            membership = favorite_membership(user_id, ids_by_kind)
+
+        # Only an answer without any favorite nor verified token needs to know whether the user exists at all
+        if not any(any(flags.values()) for flags in membership.values()) and token_user_id() != user_id \
+                and not User.query.get(user_id):
+            return jsonify({
+                'success': False,
+                'message': f'User with ID {user_id} not found'
+            }), 404
+
+        return jsonify({
+            'success': True,
+            'user_id': user_id,
+            **membership
+        }), 200
+
+    except SQLAlchemyError as e:
+        logger.error(f"Database error in get_user_favorites_contains: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Database error occurred',
+            'error': str(e)
+        }), 500
+
+    except Exception as e:
+        logger.error(f"Unexpected error in get_user_favorites_contains: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Internal server error',
+            'error': str(e)
+        }), 500
+
+
+
+
+############################################
+#######  Recommendations for USER    #######
+############################################
+@api.route('/user/<int:user_id>/recommendations', methods=['GET'])
+def get_user_recommendations(user_id):
+
+    try:
+        user = User.query.get(user_id)
+
+        if not user:
+            return jsonify({
+                'success': False,
+                'message': f'User with ID {user_id} not found'
+            }), 404
+
+        recommender.ensure_started(current_app._get_current_object())
+        limit     = min(max(request.args.get('limit', 10, type=int), 1), 50)
+        only_kind = request.args.get('type')
+        data      = hydrate(recommender.for_user(user_id, limit, only_kind))
+
+        return jsonify({
+            'success': True,
+            'user_id': user_id,
+            'total': len(data),
+            'data': data
+        }), 200
+
+    except RecommendationsUnavailable as e:
+        return jsonify({
+            'success': False,
+            'message': f'Recommendations are not available ({str(e)}), retry later'
+        }), 503, {'Retry-After': '10'}
+
+    except SQLAlchemyError as e:
+        logger.error(f"Database error in get_user_recommendations: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Database error occurred',
+            'error': str(e)
+        }), 500
+
+    except Exception as e:
+        logger.error(f"Unexpected error in get_user_recommendations: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Internal server error',
+            'error': str(e)
+        }), 500
+
+
+
+
 ##########################################################
 ################    ADDING FAVORITES    ##################
 ##########################################################
@@ -1133,14 +1882,12 @@ def get_user_favorites(user_id):
 ############################################
 #######  Add One PLANET to favorites #######
 ############################################
-@app.route('/user/<int:user_id>/favorite/planet/<int:planet_id>', methods=['POST'])
+@api.route('/user/<int:user_id>/favorite/planet/<int:planet_id>', methods=['POST'])
 def add_favorite_planet(user_id, planet_id):
 
     try:
-        # Check if user exists
-        user = User.query.get(user_id)
-
-        if not user:
+        # A verified token vouches for the user (see auth.py), it is only looked up without one
+        if token_user_id() != user_id and not User.query.get(user_id):
             return jsonify({
                 'success': False,
                 'message': f'User with ID {user_id} not found'
@@ -1169,7 +1916,11 @@ def add_favorite_planet(user_id, planet_id):
         # Create new favorite
         new_favorite = FavoritePlanets(user_id=user_id, planet_id=planet_id)
         db.session.add(new_favorite)
+        db.session.flush()  # created_at, trending weighs the favorite by it
+        emit_event('favorites.added', user_id=user_id, kind='planets', id=planet_id, favorited_at=new_favorite.created_at.isoformat())
         db.session.commit()
+        after_commit(lambda: favorite_flags.set(user_id, 'planets', planet_id, True))
+        after_commit(recommender.mark_dirty)
 
         return jsonify({
             'success': True,
@@ -1208,14 +1959,12 @@ def add_favorite_planet(user_id, planet_id):
 ############################################
 ####### Add One PEOPLE to favorites  #######
 ############################################
-@app.route('/user/<int:user_id>/favorite/people/<int:people_id>', methods=['POST'])
+@api.route('/user/<int:user_id>/favorite/people/<int:people_id>', methods=['POST'])
 def add_favorite_people(user_id, people_id):
 
     try:
-        # Check if user exists
-        user = User.query.get(user_id)
-
-        if not user:
+        # A verified token vouches for the user (see auth.py), it is only looked up without one
+        if token_user_id() != user_id and not User.query.get(user_id):
             return jsonify({
                 'success': False,
                 'message': f'User with ID {user_id} not found'
@@ -1245,7 +1994,11 @@ def add_favorite_people(user_id, people_id):
         # Create new favorite
         new_favorite = FavoritePeople(user_id=user_id, people_id=people_id)
         db.session.add(new_favorite)
+        db.session.flush()  # created_at, trending weighs the favorite by it
+        emit_event('favorites.added', user_id=user_id, kind='people', id=people_id, favorited_at=new_favorite.created_at.isoformat())
         db.session.commit()
+        after_commit(lambda: favorite_flags.set(user_id, 'people', people_id, True))
+        after_commit(recommender.mark_dirty)
 
         return jsonify({
             'success': True,
@@ -1284,14 +2037,12 @@ def add_favorite_people(user_id, people_id):
 ############################################
 ####### Add One VEHICLE to favorites #######
 ############################################
-@app.route('/user/<int:user_id>/favorite/vehicle/<int:vehicle_id>', methods=['POST'])
+@api.route('/user/<int:user_id>/favorite/vehicle/<int:vehicle_id>', methods=['POST'])
 def add_favorite_vehicle(user_id, vehicle_id):
 
     try:
-        # Check if user exists
-        user = User.query.get(user_id)
-
-        if not user:
+        # A verified token vouches for the user (see auth.py), it is only looked up without one
+        if token_user_id() != user_id and not User.query.get(user_id):
             return jsonify({
                 'success': False,
                 'message': f'User with ID {user_id} not found'
@@ -1321,7 +2072,11 @@ def add_favorite_vehicle(user_id, vehicle_id):
         # Create new favorite
         new_favorite = FavoriteVehicles(user_id=user_id, vehicle_id=vehicle_id)
         db.session.add(new_favorite)
+        db.session.flush()  # created_at, trending weighs the favorite by it
+        emit_event('favorites.added', user_id=user_id, kind='vehicles', id=vehicle_id, favorited_at=new_favorite.created_at.isoformat())
         db.session.commit()
+        after_commit(lambda: favorite_flags.set(user_id, 'vehicles', vehicle_id, True))
+        after_commit(recommender.mark_dirty)
 
         return jsonify({
             'success': True,
@@ -1367,14 +2122,12 @@ def add_favorite_vehicle(user_id, vehicle_id):
 ############################################
 ##### Delete One PLANET from favorites #####
 ############################################
-@app.route('/user/<int:user_id>/favorite/planet/<int:planet_id>', methods=['DELETE'])
+@api.route('/user/<int:user_id>/favorite/planet/<int:planet_id>', methods=['DELETE'])
 def delete_favorite_planet(user_id, planet_id):
 
     try:
-        # Check if user exists
-        user = User.query.get(user_id)
-
-        if not user:
+        # A verified token vouches for the user (see auth.py), it is only looked up without one
+        if token_user_id() != user_id and not User.query.get(user_id):
             return jsonify({
                 'success': False,
                 'message': f'User with ID {user_id} not found'
@@ -1395,7 +2148,10 @@ def delete_favorite_planet(user_id, planet_id):
         planet_name = favorite.planet.name
 
         db.session.delete(favorite)
+        emit_event('favorites.removed', user_id=user_id, kind='planets', id=planet_id, favorited_at=favorite.created_at.isoformat())
         db.session.commit()
+        after_commit(lambda: favorite_flags.set(user_id, 'planets', planet_id, False))
+        after_commit(recommender.mark_dirty)
 
         return jsonify({
             'success': True,
@@ -1424,13 +2180,12 @@ def delete_favorite_planet(user_id, planet_id):
 ############################################
 ##### Delete One PEOPLE from favorites #####
 ############################################
-@app.route('/user/<int:user_id>/favorite/people/<int:people_id>', methods=['DELETE'])
+@api.route('/user/<int:user_id>/favorite/people/<int:people_id>', methods=['DELETE'])
 def delete_favorite_people(user_id, people_id):
 
     try:
-        # Check if user exists
-        user = User.query.get(user_id)
-        if not user:
+        # A verified token vouches for the user (see auth.py), it is only looked up without one
+        if token_user_id() != user_id and not User.query.get(user_id):
             return jsonify({
                 'success': False,
                 'message': f'User with ID {user_id} not found'
@@ -1450,7 +2205,10 @@ def delete_favorite_people(user_id, people_id):
 
         person_name = favorite.people.name
         db.session.delete(favorite)
+        emit_event('favorites.removed', user_id=user_id, kind='people', id=people_id, favorited_at=favorite.created_at.isoformat())
         db.session.commit()
+        after_commit(lambda: favorite_flags.set(user_id, 'people', people_id, False))
+        after_commit(recommender.mark_dirty)
 
         return jsonify({
             'success': True,
@@ -1478,14 +2236,12 @@ def delete_favorite_people(user_id, people_id):
 ############################################
 ##### Delete One VEHICLE from favorites ####
 ############################################
-@app.route('/user/<int:user_id>/favorite/vehicle/<int:vehicle_id>', methods=['DELETE'])
+@api.route('/user/<int:user_id>/favorite/vehicle/<int:vehicle_id>', methods=['DELETE'])
 def delete_favorite_vehicle(user_id, vehicle_id):
 
     try:
-        # Check if user exists
-        user = User.query.get(user_id)
-
-        if not user:
+        # A verified token vouches for the user (see auth.py), it is only looked up without one
+        if token_user_id() != user_id and not User.query.get(user_id):
             return jsonify({
                 'success': False,
                 'message': f'User with ID {user_id} not found'
@@ -1506,7 +2262,10 @@ def delete_favorite_vehicle(user_id, vehicle_id):
         vehicle_name = favorite.vehicle.name
 
         db.session.delete(favorite)
+        emit_event('favorites.removed', user_id=user_id, kind='vehicles', id=vehicle_id, favorited_at=favorite.created_at.isoformat())
         db.session.commit()
+        after_commit(lambda: favorite_flags.set(user_id, 'vehicles', vehicle_id, False))
+        after_commit(recommender.mark_dirty)
 
         return jsonify({
             'success': True,
@@ -1535,9 +2294,313 @@ def delete_favorite_vehicle(user_id, vehicle_id):
 
 
 
+#########################################################################################
+#########################################################################################
+#############                         JOB ENDPOINTS                         #############
+#########################################################################################
+#########################################################################################
+
+
+############################################
+#######      Queue a background JOB  #######
+############################################
+@api.route('/jobs', methods=['POST'])
+def create_job():
+
+    try:
+        payload = request.get_json(silent=True)
+        if not isinstance(payload, dict):
+            return jsonify({
+                'success': False,
+                'message': 'Body must be {"type": ..., "params": {...}}'
+            }), 400
+
+        try:
+            job = enqueue_job(payload.get('type'), payload.get('params'))
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'message': str(e)
+            }), 400
+
+        response = jsonify({
+            'success': True,
+            'message': 'Job queued',
+            'data': job.serialize()
+        })
+        response.headers['Location'] = f'/jobs/{job.id}'
+        return response, 202
+
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logger.error(f"Database error in create_job: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Database error occurred',
+            'error': str(e)
+        }), 500
+
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Unexpected error in create_job: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Internal server error',
+            'error': str(e)
+        }), 500
+
+
+############################################
+#######    Status of ONE JOB by ID   #######
+############################################
+@api.route('/jobs/<int:job_id>', methods=['GET'])
+def get_job(job_id):
+
+    try:
+        # Progress is written by another thread or process, the replica may lag behind it
+        g.force_primary = True
+        job = db.session.get(Job, job_id)
+
+        if not job:
+            return jsonify({
+                'success': False,
+                'message': f'Job with ID {job_id} not found'
+            }), 404
+
+        return jsonify({
+            'success': True,
+            'data': job.serialize()
+        }), 200
+
+    except SQLAlchemyError as e:
+        logger.error(f"Database error in get_job: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Database error occurred',
+            'error': str(e)
+        }), 500
+
+    except Exception as e:
+        logger.error(f"Unexpected error in get_job: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Internal server error',
+            'error': str(e)
+        }), 500
+
+
+############################################
+#######      Cancel ONE JOB by ID    #######
+############################################
+@api.route('/jobs/<int:job_id>/cancel', methods=['POST'])
+def cancel_one_job(job_id):
+
+    try:
+        job = db.session.get(Job, job_id)
+
+        if not job:
+            return jsonify({
+                'success': False,
+                'message': f'Job with ID {job_id} not found'
+            }), 404
+
+        if job.status in JOB_FINISHED:
+            return jsonify({
+                'success': False,
+                'message': f'Job with ID {job_id} already {job.status}'
+            }), 409
+
+        cancel_job(job)
+
+        return jsonify({
+            'success': True,
+            'message': 'Job cancelled' if job.status == 'cancelled' else 'Cancellation requested, the job stops at its next batch',
+            'data': job.serialize()
+        }), 202
+
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logger.error(f"Database error in cancel_one_job: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Database error occurred',
+            'error': str(e)
+        }), 500
+
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Unexpected error in cancel_one_job: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Internal server error',
+            'error': str(e)
+        }), 500
+
+
+############################################
+#######   Download an EXPORT result  #######
+############################################
+@api.route('/jobs/<int:job_id>/download', methods=['GET'])
+def download_job_result(job_id):
+
+    try:
+        g.force_primary = True
+        job = db.session.get(Job, job_id)
+
+        if not job or job.type != 'export-catalog' or job.status != 'succeeded':
+            return jsonify({
+                'success': False,
+                'message': f'No finished export with job ID {job_id}'
+            }), 404
+
+        # Written by the process that ran the job, see JOBS_EXPORT_DIR
+        return send_from_directory(JOBS_EXPORT_DIR, job.serialize()['result']['file'], mimetype='application/json')
+
+    except NotFound:
+        return jsonify({
+            'success': False,
+            'message': f'Export file of job {job_id} is not on this server'
+        }), 404
+
+    except SQLAlchemyError as e:
+        logger.error(f"Database error in download_job_result: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Database error occurred',
+            'error': str(e)
+        }), 500
+
+    except Exception as e:
+        logger.error(f"Unexpected error in download_job_result: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Internal server error',
+            'error': str(e)
+        }), 500
+
+
+
+
+
+##################################################################################################################################
+##################################################################################################################################
+
+#########################################################################################
+#########################################################################################
+#############                        BATCH ENDPOINT                         #############
+#########################################################################################
+#########################################################################################
+
+
+############################################
+#######   Many API calls in one      #######
+############################################
+@api.route('/batch', methods=['POST'])
+def run_batch_requests():
+
+    try:
+        payload = request.get_json(silent=True)
+        atomic = bool(payload.get('atomic')) if isinstance(payload, dict) else False
+
+        try:
+            sub_requests = parse_batch(payload, request.headers)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'message': str(e)
+            }), 400
+
+        app = current_app._get_current_object()
+        if atomic:
+            responses, committed = run_atomic_batch(app, sub_requests)
+        else:
+            responses, committed = run_batch(app, sub_requests), None
+
+        return jsonify({
+            'success': True,
+            'atomic': atomic,
+            'committed': committed,
+            'total': len(responses),
+            'responses': responses
+        }), 200
+
+    except SQLAlchemyError as e:
+        logger.error(f"Database error in run_batch_requests: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Database error occurred',
+            'error': str(e)
+        }), 500
+
+    except Exception as e:
+        logger.error(f"Unexpected error in run_batch_requests: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Internal server error',
+            'error': str(e)
+        }), 500
+
+
+
+
+
 ##################################################################################################################################
 ##################################################################################################################################
 
+#########################################################################################
+#########################################################################################
+#############                      APPLICATION FACTORY                      #############
+#########################################################################################
+#########################################################################################
+"""
+Optional pieces are only imported when enabled, so API-only nodes boot faster:
+
+    ADMIN_ENABLED=0 ........ skip flask_admin / WTForms and the admin views
+    MIGRATIONS_ENABLED=0 ... skip flask_migrate / alembic (only `flask db ...` needs them)
+
+Run `python benchmarks/import_profile.py` to see where boot time goes.
+"""
+def create_app():
+    app = Flask(__name__)
+    app.url_map.strict_slashes = False
+
+    db_url = os.getenv("DATABASE_URL")
+    if db_url is not None:
+        app.config['SQLALCHEMY_DATABASE_URI'] = db_url.replace("postgres://", "postgresql://")
+    else:
+        app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:////tmp/test.db"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['ADMIN_ENABLED']      = os.getenv('ADMIN_ENABLED', '1') != '0'
+    app.config['MIGRATIONS_ENABLED'] = os.getenv('MIGRATIONS_ENABLED', '1') != '0'
+    configure_sqlite(app)
+    configure_read_replica(app)
+    configure_response_cache(app)
+    configure_auth(app)
+    configure_idempotency(app)
+    configure_admission(app)
+    configure_statement_timeouts(app)
+    configure_slow_query_log(app)
+    configure_jobs(app)
+
+    if app.config['MIGRATIONS_ENABLED']:
+        from flask_migrate import Migrate
+        Migrate(app, db)
+
+    db.init_app(app)
+    CORS(app)
+    app.register_blueprint(api)
+    setup_commands(app)
+
+    if app.config['ADMIN_ENABLED']:
+        from admin import setup_admin
+        setup_admin(app)
+
+    return app
+
+
+app = create_app()
+
+
 # this only runs if `$ python src/app.py` is executed
 if __name__ == '__main__':
     PORT = int(os.environ.get('PORT', 3000))
@@ -0,0 +1,290 @@
+"""
+Optional ASGI entry point (next to wsgi.py).
+
+The catalog and favorites READ endpoints are served natively with SQLAlchemy's
+AsyncSession, so one process can keep thousands of slow clients waiting on the
+database without a worker thread each. GET /events (Server-Sent Events, see
+events.py) is only served here. Every other route is handed over to the
+regular Flask app.
+
+The native routes answer the same bytes as Flask (pre-rendered blobs, same
+encoding) but skip the Flask hooks: no whole-response cache (response_cache.py,
+no gzip / ETag), no admission control (admission.py) and no statement timeout
+(statement_timeouts.py). The async engine's pool bounds their database
+concurrency instead. Deployments relying on those hooks set ASGI_NATIVE_READS=0
+and every route goes through Flask.
+
+    $ uvicorn asgi:application --app-dir src --workers 2
+
+Drivers: aiosqlite for SQLite, asyncpg for PostgreSQL.
+"""
+import os
+import re
+import json
+import time
+import logging
+
+from asgiref.wsgi import WsgiToAsgi
+from sqlalchemy import event, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from models import User, People, Planet, Vehicle
+from favorites import user_favorites_query, rows_to_favorites
+from residents import residents_counts_query
+from prerender import render, with_fields, raw_json_body
+from utils import IN_CHUNK
+from events import EventBroker, stream_events
+from auth import authorize, AuthError
+from sqlite_tuning import is_sqlite_url, apply_pragmas
+from db_routing import STICKY_COOKIE
+from app import app as flask_app
+
+
+logger = logging.getLogger(__name__)
+
+
+#########################################################################################
+#########################################################################################
+#############                     ASYNC DATABASE ENGINES                    #############
+#########################################################################################
+#########################################################################################
+def async_url(url):
+    """ Same database, async driver """
+    url = url.replace("postgres://", "postgresql://")
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    if url.startswith("sqlite://"):
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    return url
+
+
+def build_engine(url):
+    if url is None:
+        return None
+
+    if is_sqlite_url(url):
+        engine = create_async_engine(async_url(url))
+        if os.getenv('SQLITE_TUNING', '1') != '0':
+            event.listen(engine.sync_engine, 'connect', lambda dbapi_connection, record: apply_pragmas(dbapi_connection))
+        return engine
+
+    return create_async_engine(
+        async_url(url),
+        pool_size=int(os.getenv('ASGI_POOL_SIZE', '20')),
+        max_overflow=int(os.getenv('ASGI_POOL_OVERFLOW', '20')),
+        pool_pre_ping=True,
+    )
+
+
+primary_engine = build_engine(flask_app.config['SQLALCHEMY_DATABASE_URI'])
+replica_engine = build_engine(os.getenv('DATABASE_REPLICA_URL'))
+
+PrimarySession = async_sessionmaker(primary_engine, expire_on_commit=False)
+ReplicaSession = async_sessionmaker(replica_engine, expire_on_commit=False) if replica_engine else None
+
+# GET /events subscribers of this process, fed by one outbox poller on the primary
+event_broker = EventBroker(primary_engine)
+
+
+def session_for(scope):
+    # Same read-your-writes rule as the Flask app: sticky clients read the primary
+    if ReplicaSession is None:
+        return PrimarySession()
+
+    cookies = dict(
+        part.strip().split('=', 1)
+        for name, value in scope['headers'] if name == b'cookie'
+        for part in value.decode('latin-1').split(';') if '=' in part
+    )
+    try:
+        sticky = float(cookies.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        sticky = False
+
+    return PrimarySession() if sticky else ReplicaSession()
+
+
+
+#########################################################################################
+#########################################################################################
+#############                       READ ENDPOINTS                          #############
+#########################################################################################
+#########################################################################################
+"""
+Each handler returns (body, status) with exactly the same body as its Flask
+twin in app.py: catalog rows are the pre-rendered blobs of prerender.py,
+spliced as they are, a missing blob is rendered on the fly.
+"""
+
+
+async def catalog_blobs(session, model, ids=None):
+    """ Async twin of prerender.catalog_blobs, [(id, blob)] of every row or of `ids` """
+    query = select(model.id, model.serialized)
+    query = query.order_by(model.id) if ids is None else query.where(model.id.in_(ids))
+    rows = (await session.execute(query)).all()
+
+    missing = [entity_id for entity_id, blob in rows if blob is None]
+    rendered = {}
+    for start in range(0, len(missing), IN_CHUNK):
+        entities = await session.scalars(select(model).where(model.id.in_(missing[start:start + IN_CHUNK])))
+        rendered.update((entity.id, render(entity)) for entity in entities)
+    return [(entity_id, blob if blob is not None else rendered[entity_id]) for entity_id, blob in rows]
+
+
+async def catalog_blob(session, model, entity_id):
+    rows = await catalog_blobs(session, model, [entity_id])
+    return rows[0][1] if rows else None
+
+
+async def get_all_people(session):
+    rows = await catalog_blobs(session, People)
+    return raw_json_body({'total': len(rows)}, [blob for _, blob in rows]), 200
+
+
+async def get_one_person(session, people_id):
+    person = await catalog_blob(session, People, people_id)
+    if person is None:
+        return {'success': False, 'message': f'Person with ID {people_id} not found'}, 404
+    return raw_json_body({'success': True}, person), 200
+
+
+async def get_all_planets(session):
+    rows = await catalog_blobs(session, Planet)
+    counts = dict((await session.execute(residents_counts_query())).all())
+    data = [with_fields(blob, residents_count=counts.get(planet_id, 0)) for planet_id, blob in rows]
+    return raw_json_body({'success': True, 'total': len(rows)}, data), 200
+
+
+async def get_one_planet(session, planet_id):
+    planet = await catalog_blob(session, Planet, planet_id)
+    if planet is None:
+        return {'success': False, 'message': f'Planet with ID {planet_id} not found'}, 404
+    counts = dict((await session.execute(residents_counts_query([planet_id]))).all())
+    return raw_json_body({'success': True}, with_fields(planet, residents_count=counts.get(planet_id, 0))), 200
+
+
+async def get_all_vehicles(session):
+    rows = await catalog_blobs(session, Vehicle)
+    return raw_json_body({'success': True, 'total': len(rows)}, [blob for _, blob in rows]), 200
+
+
+async def get_one_vehicle(session, vehicle_id):
+    vehicle = await catalog_blob(session, Vehicle, vehicle_id)
+    if vehicle is None:
+        return {'success': False, 'message': f'Vehicle with ID {vehicle_id} not found'}, 404
+    return raw_json_body({'success': True}, vehicle), 200
+
+
+async def get_user_favorites(session, user_id, verified):
+    # Same single UNION ALL query as the Flask endpoint
+    favorites = rows_to_favorites(await session.execute(user_favorites_query(user_id)), user_id)
+
+    if not any(favorites.values()) and not verified and not await session.get(User, user_id):
+        return {'success': False, 'message': f'User with ID {user_id} not found'}, 404
+
+    return {
+        'success': True,
+        'user_id': user_id,
+        'favorites': favorites,
+        'totals': {
+            'people':   len(favorites['people']),
+            'planets':  len(favorites['planets']),
+            'vehicles': len(favorites['vehicles'])
+        }
+    }, 200
+
+
+ROUTES = [
+    (re.compile(r'^/people/?$'),                      get_all_people),
+    (re.compile(r'^/people/(\d+)/?$'),                get_one_person),
+    (re.compile(r'^/planets/?$'),                     get_all_planets),
+    (re.compile(r'^/planets/(\d+)/?$'),               get_one_planet),
+    (re.compile(r'^/vehicles/?$'),                    get_all_vehicles),
+    (re.compile(r'^/vehicles/(\d+)/?$'),              get_one_vehicle),
+    (re.compile(r'^/user/(\d+)/favorites/?$'),        get_user_favorites),
+]
+
+NATIVE_READS = os.getenv('ASGI_NATIVE_READS', '1') != '0'
+
+# Handlers acting as the user of their first argument, checked like auth.py's before_request
+USER_ROUTES = {get_user_favorites}
+
+
+
+#########################################################################################
+#########################################################################################
+#############                        ASGI APPLICATION                       #############
+#########################################################################################
+#########################################################################################
+flask_fallback = WsgiToAsgi(flask_app)
+
+
+def match_route(scope):
+    # Only plain GETs are served here, anything with a query string goes to Flask
+    if scope['type'] != 'http' or scope['method'] != 'GET' or scope.get('query_string'):
+        return None, None
+    for pattern, handler in ROUTES:
+        found = pattern.match(scope['path'])
+        if found:
+            return handler, [int(arg) for arg in found.groups()]
+    return None, None
+
+
+async def send_json(send, body, status):
+    # Pre-rendered bodies go out as they are, the others encoded like Flask's jsonify()
+    if not isinstance(body, str):
+        body = json.dumps(body, sort_keys=True, separators=(',', ':')) + '\n'
+    payload = body.encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(payload)).encode()),
+            (b'access-control-allow-origin', b'*'),
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': payload})
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await event_broker.close()
+                await primary_engine.dispose()
+                if replica_engine is not None:
+                    await replica_engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    if scope['type'] == 'http' and scope['method'] == 'GET' and scope['path'].rstrip('/') == '/events':
+        return await stream_events(scope, receive, send, event_broker)
+
+    handler, args = match_route(scope) if NATIVE_READS else (None, None)
+    if handler is None:
+        return await flask_fallback(scope, receive, send)
+
+    if handler in USER_ROUTES:
+        try:
+            args.append(authorize(dict(scope['headers']).get(b'authorization', b'').decode('latin-1'), args[0]))
+        except AuthError as e:
+            return await send_json(send, {'success': False, 'message': e.message}, e.status)
+
+    try:
+        async with session_for(scope) as session:
+            body, status = await handler(session, *args)
+
+    except SQLAlchemyError as e:
+        logger.error(f"Database error in {handler.__name__}: {str(e)}")
+        body, status = {'success': False, 'message': 'Database error occurred', 'error': str(e)}, 500
+
+    except Exception as e:
+        logger.error(f"Unexpected error in {handler.__name__}: {str(e)}")
+        body, status = {'success': False, 'message': 'Internal server error', 'error': str(e)}, 500
+
+    await send_json(send, body, status)
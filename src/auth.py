@@ -0,0 +1,216 @@
+"""
+Stateless login: POST /login checks the password once and answers a signed,
+short-lived token carrying the user id and active flag.
+
+    POST /login  {"email": "luke@jedi.com", "password": "force123"}   ("username" works too)
+    -> {"token": "eyJzdWIi...", "token_type": "Bearer", "expires_in": 900}
+
+    GET /user/1/favorites
+    Authorization: Bearer eyJzdWIi...
+
+The favorites endpoints trust the verified claims: the token must belong to
+the user of the URL and that user must be active, no user row is read. The
+same goes for the user of a catalog list's ?user_id= favorite flags and for
+the favorites events of GET /events (events.py).
+Deactivating or deleting a user takes effect when their tokens expire.
+
+Passwords are stored as werkzeug hashes. Rows still holding a plain text
+password are hashed at their next login, or all at once with
+`flask hash-passwords`.
+"""
+import os
+import hmac
+import logging
+
+from flask import request
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+logger = logging.getLogger(__name__)
+
+
+#########################################################################################
+#########################################################################################
+#############                        TOKEN LOGIN                            #############
+#########################################################################################
+#########################################################################################
+"""
+Configuration (environment variables):
+
+    AUTH_SECRET_KEY ..................... signing key of the tokens (default FLASK_APP_KEY),
+                                          the same on every worker, changing it logs everyone out.
+                                          Mandatory with AUTH_REQUIRED=1 (the app refuses to start),
+                                          without it no token is issued nor accepted
+    AUTH_TOKEN_TTL_SECONDS=900 .......... token lifetime, also how long a deactivated user keeps access
+    AUTH_REQUIRED=1 ..................... 0: requests without a token still work the old way,
+                                          the user of the URL is looked up (migration window)
+"""
+
+SECRET_KEY = os.getenv('AUTH_SECRET_KEY') or os.getenv('FLASK_APP_KEY')
+TOKEN_TTL  = int(os.getenv('AUTH_TOKEN_TTL_SECONDS', '900'))
+REQUIRED   = os.getenv('AUTH_REQUIRED', '1') != '0'
+
+# Endpoints acting as the user of their <user_id>
+PROTECTED_ENDPOINTS = {
+    'api.get_user_favorites',
+    'api.get_user_favorites_contains',
+    'api.add_favorite_planet',
+    'api.add_favorite_people',
+    'api.add_favorite_vehicle',
+    'api.delete_favorite_planet',
+    'api.delete_favorite_people',
+    'api.delete_favorite_vehicle',
+    'api.get_user_recommendations',
+}
+
+# Endpoints acting as the user of their ?user_id= query, when given (favorite flags)
+OVERLAY_ENDPOINTS = {
+    'api.get_all_people',
+    'api.get_all_planets',
+    'api.get_all_vehicles',
+}
+
+VERIFIED_USER = 'auth.user_id'
+
+# No well-known fallback key: anyone could sign tokens with it
+_serializer = URLSafeTimedSerializer(SECRET_KEY, salt='auth-token') if SECRET_KEY else None
+
+
+class AuthError(Exception):
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status  = status
+        self.message = message
+
+
+############################################
+#######          Passwords           #######
+############################################
+_dummy_hash = None
+
+
+def _dummy_password_hash():
+    """ Compared against when the login is unknown: a wrong login costs as much as a wrong password """
+    global _dummy_hash
+    # Hashed on first use, not at import: scrypt would cost every process start (CLI, ASGI, workers)
+    if _dummy_hash is None:
+        _dummy_hash = generate_password_hash('dummy password')
+    return _dummy_hash
+
+
+def hash_password(password):
+    return generate_password_hash(password)
+
+
+def is_password_hash(value):
+    return value.startswith(('scrypt:', 'pbkdf2:'))
+
+
+def check_password(user, password):
+    """
+    True when `password` is the user's. A plain text password left from
+    before the hashing is checked as is, then replaced by its hash (the
+    caller commits).
+    """
+    if user is None:
+        check_password_hash(_dummy_password_hash(), password)
+        return False
+    if is_password_hash(user.password):
+        return check_password_hash(user.password, password)
+    if hmac.compare_digest(user.password.encode(), password.encode()):
+        user.password = hash_password(password)
+        return True
+    return False
+
+
+############################################
+#######            Tokens            #######
+############################################
+def issue_token(user):
+    """ A signed token of the user, AuthError(503) when no signing key is configured """
+    if _serializer is None:
+        raise AuthError(503, 'Token login is disabled: AUTH_SECRET_KEY is not set')
+    return _serializer.dumps({'sub': user.id, 'active': user.is_active})
+
+
+def verify_token(token):
+    """ The claims, AuthError(401) for a forged or expired token """
+    if _serializer is None:
+        raise AuthError(401, 'Token login is disabled: AUTH_SECRET_KEY is not set')
+    try:
+        claims = _serializer.loads(token, max_age=TOKEN_TTL)
+    except SignatureExpired:
+        raise AuthError(401, 'Token expired, log in again')
+    except BadSignature:
+        raise AuthError(401, 'Invalid token')
+    return claims
+
+
+def bearer_user_id(authorization):
+    """
+    Id of the active user whose token the Authorization header holds. None
+    without a header when AUTH_REQUIRED=0, AuthError (401 / 403) otherwise.
+    """
+    if not authorization:
+        if REQUIRED:
+            raise AuthError(401, 'Authorization: Bearer <token> required, get one from POST /login')
+        return None
+
+    scheme, _, token = authorization.partition(' ')
+    if scheme.lower() != 'bearer' or not token.strip():
+        raise AuthError(401, 'Authorization must be "Bearer <token>"')
+
+    claims = verify_token(token.strip())
+    if not claims.get('active'):
+        raise AuthError(403, f'User {claims.get("sub")} is not active')
+    return claims.get('sub')
+
+
+def authorize(authorization, user_id):
+    """
+    True when the Authorization header holds a valid token of the active
+    `user_id`. False without a header when AUTH_REQUIRED=0: the caller checks
+    the user exists itself. AuthError (401 / 403) otherwise.
+    """
+    token_user = bearer_user_id(authorization)
+    if token_user is None:
+        return False
+    if token_user != user_id:
+        raise AuthError(403, f'The token does not belong to user {user_id}')
+    return True
+
+
+def token_user_id():
+    """ The user id vouched for by this request's token, None without one """
+    return request.environ.get(VERIFIED_USER)
+
+
+def configure_auth(app):
+    if not SECRET_KEY:
+        if REQUIRED:
+            raise RuntimeError("AUTH_REQUIRED=1 needs AUTH_SECRET_KEY (or FLASK_APP_KEY) to sign the tokens")
+        logger.warning("AUTH_SECRET_KEY (or FLASK_APP_KEY) not set, token login is disabled")
+
+    @app.before_request
+    def check_token():
+        if request.endpoint in PROTECTED_ENDPOINTS:
+            user_id = request.view_args['user_id']
+        elif request.endpoint in OVERLAY_ENDPOINTS:
+            user_id = request.args.get('user_id', type=int)
+            if user_id is None:
+                return None
+        else:
+            return None
+
+        try:
+            if authorize(request.headers.get('Authorization'), user_id):
+                request.environ[VERIFIED_USER] = user_id
+        except AuthError as e:
+            response = app.json.response({'success': False, 'message': e.message})
+            response.status_code = e.status
+            if e.status == 401:
+                response.headers['WWW-Authenticate'] = 'Bearer'
+            return response
+        return None
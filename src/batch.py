@@ -0,0 +1,155 @@
+"""
+POST /batch: run several API calls in one HTTP request.
+
+    {
+        "atomic": false,
+        "requests": [
+            {"method": "GET",  "path": "/people?ids=1,2"},
+            {"method": "POST", "path": "/user/1/favorite/planet/3"},
+            {"method": "PUT",  "path": "/people/1", "body": {"name": "Luke"}}
+        ]
+    }
+
+Every sub-request is dispatched in-process through the normal Flask pipeline
+(before/after request hooks, error handlers), in order, and answered as
+{"status": <code>, "body": <json or text>}. The Authorization and Cookie
+headers of the batch request are passed on unless a sub-request sets its own.
+Sub-requests always come from the batch's client: its socket address and
+X-Forwarded-For, whatever they set (rate limits, idempotency key owners).
+
+With "atomic": true every sub-request runs on one connection and one
+transaction: the handlers' commits only release savepoints, and the whole
+batch is committed when every sub-request answered < 400, rolled back
+otherwise. In-memory side effects (favorite flags, recommendations) go
+through after_commit(): they run once the batch is committed and are dropped
+when it is rolled back.
+"""
+import os
+import logging
+
+from flask import g, request
+
+from models import db
+from db_routing import READ_METHODS
+
+
+logger = logging.getLogger(__name__)
+
+MAX_REQUESTS      = int(os.getenv('BATCH_MAX_REQUESTS', '20'))
+METHODS           = ('GET', 'POST', 'PUT', 'DELETE')
+INHERITED_HEADERS = ('Authorization', 'Cookie')
+# Identify the client (admission.client_id), never taken from a sub-request
+CLIENT_HEADERS    = ('X-Forwarded-For',)
+
+
+def parse_batch(payload, outer_headers):
+    """ Validated [(method, path, body, headers)], ValueError with a client facing message """
+    if not isinstance(payload, dict) or not isinstance(payload.get('requests'), list):
+        raise ValueError('Body must be {"requests": [{"method": ..., "path": ...}, ...]}')
+
+    sub_requests = payload['requests']
+    if not sub_requests:
+        raise ValueError('requests is empty')
+    if len(sub_requests) > MAX_REQUESTS:
+        raise ValueError(f'At most {MAX_REQUESTS} requests per batch')
+
+    parsed = []
+    for index, sub in enumerate(sub_requests):
+        if not isinstance(sub, dict):
+            raise ValueError(f'requests[{index}] must be an object')
+
+        method = str(sub.get('method', 'GET')).upper()
+        path = sub.get('path')
+        if method not in METHODS:
+            raise ValueError(f'requests[{index}]: method must be one of {", ".join(METHODS)}')
+        if not isinstance(path, str) or not path.startswith('/'):
+            raise ValueError(f'requests[{index}]: path must start with "/"')
+        if path.split('?', 1)[0].rstrip('/') == '/batch':
+            raise ValueError(f'requests[{index}]: batches cannot be nested')
+
+        headers = {name: outer_headers[name] for name in INHERITED_HEADERS if name in outer_headers}
+        headers.update(sub.get('headers') or {})
+        client_headers = {name.lower() for name in CLIENT_HEADERS}
+        headers = {name: value for name, value in headers.items() if name.lower() not in client_headers}
+        headers.update({name: outer_headers[name] for name in CLIENT_HEADERS if name in outer_headers})
+        parsed.append((method, path, sub.get('body'), headers))
+
+    return parsed
+
+
+def after_commit(callback):
+    """
+    Run `callback` once the handler's changes are really committed: at once
+    in a plain request (the handler committed already), after the commit of
+    the whole transaction inside an atomic batch, never if it rolls back.
+    """
+    pending = g.get('after_commit')
+    if pending is None:
+        callback()
+    else:
+        pending.append(callback)
+
+
+def _dispatch(app, method, path, body, headers, environ_base):
+    with app.test_request_context(path, method=method, json=body, headers=headers, environ_base=environ_base):
+        try:
+            response = app.full_dispatch_request()
+        except Exception as e:
+            logger.error(f"Unhandled error in batch sub-request {method} {path}: {str(e)}")
+            return {'status': 500, 'body': {'success': False, 'message': 'Internal server error'}}
+
+    data = response.get_json(silent=True)
+    return {
+        'status': response.status_code,
+        'body': data if data is not None else response.get_data(as_text=True)
+    }
+
+
+def run_batch(app, sub_requests):
+    """ Called from the /batch request: the sub-requests get its client address """
+    environ_base = {'REMOTE_ADDR': request.remote_addr}
+    responses = []
+    for method, path, body, headers in sub_requests:
+        responses.append(_dispatch(app, method, path, body, headers, environ_base))
+        # The sticky cookie of a write never reaches the next sub-requests: they read the
+        # primary for the rest of the batch instead (sub-requests share the batch's g)
+        if method not in READ_METHODS and responses[-1]['status'] < 400:
+            g.force_primary = True
+    return responses
+
+
+def run_atomic_batch(app, sub_requests):
+    """ (responses, committed) with every sub-request inside one transaction """
+    # A fresh app context gets its own db.session scope (and its own g)
+    with app.app_context():
+        with db.engine.connect() as connection:
+            transaction = connection.begin()
+            if connection.dialect.name == 'sqlite':
+                # pysqlite defers BEGIN to the first write, a RELEASE SAVEPOINT before it would commit
+                connection.exec_driver_sql('BEGIN')
+            session = db.session.session_factory(bind=connection, join_transaction_mode='create_savepoint')
+            db.session.registry.set(session)
+            g.force_primary = True
+            g.atomic_batch  = True
+            g.after_commit  = []
+
+            try:
+                responses = run_batch(app, sub_requests)
+                committed = all(response['status'] < 400 for response in responses)
+                if committed:
+                    transaction.commit()
+                else:
+                    transaction.rollback()
+            finally:
+                session.close()
+                if transaction.is_active:
+                    transaction.rollback()
+
+        if committed:
+            for callback in g.after_commit:
+                try:
+                    callback()
+                except Exception as e:
+                    logger.error(f"After commit callback of an atomic batch failed: {str(e)}")
+
+    return responses, committed
@@ -0,0 +1,204 @@
+"""
+Delta sync: GET /people/changes?since=<cursor> (same for /planets and /vehicles).
+
+Answers the rows created or edited after the cursor, read in (edited, id)
+order through the `edited` index, and the ids deleted since, read from the
+tombstone log. Both are paged: clients call again with `next` until
+`has_more` is false, then keep `next` for their next sync. Without `since`
+the sync starts from the first row.
+
+Clients apply `deleted` first, then upsert `data`.
+"""
+import os
+import json
+import base64
+import binascii
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, insert, delete, func, or_, literal, type_coerce, String, event
+
+from models import db, Tombstone
+from prerender import CATALOG_MODELS, with_missing_rendered
+
+
+#########################################################################################
+#########################################################################################
+#############                          DELTA SYNC                           #############
+#########################################################################################
+#########################################################################################
+"""
+Configuration (environment variables):
+
+    CHANGES_PAGE_SIZE=500 ............... rows (and tombstones) per answer
+    CHANGES_SETTLE_SECONDS=5 ............ the cursor never moves past now - this
+    CHANGES_RETENTION_DAYS=30 ........... tombstones kept, older cursors get a 410
+
+`edited` / `deleted_at` are set when the row is written, not when its
+transaction commits, so a slow transaction can land behind a cursor already
+handed out. The cursor stops CHANGES_SETTLE_SECONDS before the database's
+clock: the rows of the last seconds are sent now and again on the next call,
+upserting them twice is harmless.
+
+A cursor that has not seen every tombstone older than the retention window
+is expired (410), the client starts over without `since`.
+Prune with `flask prune-tombstones` (daily cron).
+"""
+
+PAGE_SIZE      = int(os.getenv('CHANGES_PAGE_SIZE', '500'))
+SETTLE_SECONDS = int(os.getenv('CHANGES_SETTLE_SECONDS', '5'))
+RETENTION_DAYS = int(os.getenv('CHANGES_RETENTION_DAYS', '30'))
+
+
+class CursorExpired(Exception):
+    pass
+
+
+############################################
+#######   Tombstones on every delete #######
+############################################
+def _write_tombstone(mapper, connection, target):
+    # Same flush as the DELETE: the tombstone commits (or rolls back) with it
+    connection.execute(
+        insert(Tombstone.__table__).values(table_name=mapper.local_table.name, entity_id=target.id)
+    )
+
+
+for _model in CATALOG_MODELS:
+    event.listen(_model, 'after_delete', _write_tombstone)
+
+
+def prune_tombstones():
+    """ Delete the tombstones older than the retention window, returns how many """
+    _, cutoff = _server_times()
+    result = db.session.execute(
+        delete(Tombstone).where(Tombstone.deleted_at < _bound(cutoff))
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+############################################
+#######   Timestamps, per dialect    #######
+############################################
+"""
+SQLite keeps CURRENT_TIMESTAMP as text ('2026-10-19 18:31:52'), compared as
+text: timestamps are read, kept in cursors and bound back in that exact form.
+Other databases use real timestamps.
+"""
+def _is_sqlite():
+    return db.engine.dialect.name == 'sqlite'
+
+
+def _timestamp(column):
+    return type_coerce(column, String) if _is_sqlite() else column
+
+
+def _bound(value):
+    return literal(value, String) if _is_sqlite() else value
+
+
+def server_time_ago(seconds):
+    """ "now - seconds" by the database's clock, in the form its timestamp columns compare with """
+    if _is_sqlite():
+        return func.datetime('now', f'-{int(seconds)} seconds')
+    return func.now() - timedelta(seconds=seconds)
+
+
+def _server_times():
+    """ (settled, prune cutoff) """
+    query = select(server_time_ago(SETTLE_SECONDS), server_time_ago(RETENTION_DAYS * 86400))
+    return tuple(db.session.execute(query).one())
+
+
+############################################
+#######            Cursors           #######
+############################################
+def encode_cursor(edited, entity_id, tombstone_id, seen_until):
+    """ Opaque for clients: position in the rows, position in the tombstones, tombstones seen until """
+    values = [value if value is None or isinstance(value, (str, int)) else value.isoformat()
+              for value in (edited, entity_id, tombstone_id, seen_until)]
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(value):
+    """ ValueError with a client facing message """
+    try:
+        raw = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4))
+        edited, entity_id, tombstone_id, seen_until = json.loads(raw)
+        if not _is_sqlite():
+            edited     = datetime.fromisoformat(edited) if edited is not None else None
+            seen_until = datetime.fromisoformat(seen_until)
+        return edited, int(entity_id), int(tombstone_id), seen_until
+    except (binascii.Error, ValueError, TypeError):
+        raise ValueError('since is not a valid cursor, use the "next" value of a previous answer')
+
+
+############################################
+#######             Sync             #######
+############################################
+def _changed_rows(model, edited, entity_id):
+    query = select(model.id, model.serialized, _timestamp(model.edited)).where(model.edited.is_not(None))
+    if edited is not None:
+        # Range on the edited index, ties broken by id
+        query = (
+            query
+            .where(model.edited >= _bound(edited))
+            .where(or_(model.edited > _bound(edited), model.id > entity_id))
+        )
+    return db.session.execute(query.order_by(model.edited, model.id).limit(PAGE_SIZE + 1)).all()
+
+
+def _tombstones(table_name, tombstone_id):
+    return db.session.execute(
+        select(Tombstone.id, Tombstone.entity_id, _timestamp(Tombstone.deleted_at))
+        .where(Tombstone.table_name == table_name, Tombstone.id > tombstone_id)
+        .order_by(Tombstone.id)
+        .limit(PAGE_SIZE + 1)
+    ).all()
+
+
+def changes_since(model, cursor=None):
+    """
+    ([(id, blob)], [deleted ids], next cursor, has_more) after `cursor` (None: from the start).
+    Raises ValueError for a malformed cursor, CursorExpired for one older than the retention window.
+    """
+    settled, cutoff = _server_times()
+
+    if cursor is not None:
+        edited, entity_id, tombstone_id, seen_until = decode_cursor(cursor)
+        if seen_until < cutoff:
+            raise CursorExpired()
+    else:
+        # Nothing to delete on the client yet, only the tombstones written from now on matter
+        edited, entity_id, seen_until = None, 0, settled
+        tombstone_id = db.session.execute(
+            select(func.coalesce(func.max(Tombstone.id), 0)).where(Tombstone.deleted_at <= _bound(settled))
+        ).scalar()
+
+    rows = _changed_rows(model, edited, entity_id)
+    has_more = len(rows) > PAGE_SIZE
+    rows = rows[:PAGE_SIZE]
+    for row_id, _, row_edited in rows:
+        if row_edited > settled:
+            # Everything after is unsettled too, sent again on the next sync rather than paged now
+            has_more = False
+            break
+        edited, entity_id = row_edited, row_id
+
+    tombstones = _tombstones(model.__tablename__, tombstone_id)
+    more_tombstones = len(tombstones) > PAGE_SIZE
+    tombstones = tombstones[:PAGE_SIZE]
+    for stone_id, _, deleted_at in tombstones:
+        if deleted_at > settled:
+            more_tombstones = False
+            break
+        tombstone_id, seen_until = stone_id, deleted_at
+    else:
+        if not more_tombstones:
+            # Every settled tombstone of the table has been read
+            seen_until = max(seen_until, settled)
+    has_more |= more_tombstones
+
+    blobs = with_missing_rendered(model, [(row_id, blob) for row_id, blob, _ in rows])
+    deleted = [stone_entity_id for _, stone_entity_id, _ in tombstones]
+    return blobs, deleted, encode_cursor(edited, entity_id, tombstone_id, seen_until), has_more
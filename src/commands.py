@@ -0,0 +1,116 @@
+"""
+Flask CLI commands, run them with `flask <command>` (FLASK_APP=src/app.py).
+"""
+import click
+
+
+def setup_commands(app):
+
+    ############################################
+    #######    Repair favorite counters  #######
+    ############################################
+    @app.cli.command('repair-favorite-counts')
+    def repair_favorite_counts_command():
+        """ Recompute People/Planet/Vehicle.favorite_count from the favorites tables """
+        from counters import repair_favorite_counts
+
+        updated = repair_favorite_counts()
+        for table, rows in updated.items():
+            click.echo(f"{table}: {rows} counters fixed")
+
+    ############################################
+    #######    Backfill homeworld ids    #######
+    ############################################
+    @app.cli.command('backfill-homeworlds')
+    @click.option('--batch-size', default=1000, help='People ids per committed batch')
+    def backfill_homeworlds_command(batch_size):
+        """ Resolve People.homeworld_id from People.homeworld where it is still empty """
+        from residents import backfill_homeworlds
+
+        click.echo(f"{backfill_homeworlds(batch_size)} people linked to their homeworld")
+
+    ############################################
+    #######   Pre-render catalog JSON    #######
+    ############################################
+    @app.cli.command('prerender-catalog')
+    @click.option('--all', 'render_all', is_flag=True, help='Re-render every row, not only the missing ones')
+    def prerender_catalog_command(render_all):
+        """ Fill People/Planet/Vehicle.serialized (after the migration or a serialize() change) """
+        from prerender import prerender_catalog
+
+        for table, rows in prerender_catalog(only_missing=not render_all).items():
+            click.echo(f"{table}: {rows} rows rendered")
+
+    ############################################
+    #######   Prune sync tombstones      #######
+    ############################################
+    @app.cli.command('prune-tombstones')
+    def prune_tombstones_command():
+        """ Delete tombstones older than CHANGES_RETENTION_DAYS (run daily) """
+        from changes import prune_tombstones
+
+        click.echo(f"{prune_tombstones()} tombstones pruned")
+
+    ############################################
+    #######   Prune event outbox         #######
+    ############################################
+    @app.cli.command('prune-events')
+    def prune_events_command():
+        """ Delete /events outbox rows older than EVENTS_RETENTION_HOURS (run hourly) """
+        from events import prune_events
+
+        click.echo(f"{prune_events()} events pruned")
+
+    ############################################
+    #######   Hash plain text passwords  #######
+    ############################################
+    @app.cli.command('hash-passwords')
+    def hash_passwords_command():
+        """ Replace the plain text passwords left in the user table by their hash """
+        from models import db, User
+        from auth import hash_password, is_password_hash
+
+        users = [user for user in User.query.all() if not is_password_hash(user.password)]
+        for user in users:
+            user.password = hash_password(user.password)
+        db.session.commit()
+        click.echo(f"{len(users)} passwords hashed")
+
+    ############################################
+    #######   Prune idempotency keys     #######
+    ############################################
+    @app.cli.command('prune-idempotency-keys')
+    def prune_idempotency_keys_command():
+        """ Delete stored Idempotency-Key responses older than IDEMPOTENCY_TTL_HOURS (run hourly) """
+        from idempotency import prune_idempotency_keys
+
+        click.echo(f"{prune_idempotency_keys()} idempotency keys pruned")
+
+    ############################################
+    #######   Dedicated job runner       #######
+    ############################################
+    @app.cli.command('run-jobs')
+    @click.option('--threads', default=None, type=int, help='Jobs running at once in this process (default JOBS_THREADS)')
+    def run_jobs_command(threads):
+        """ Run queued background jobs until interrupted (pair with JOBS_ENABLED=0 on the web) """
+        import time
+        from jobs import JobRunner, THREADS
+
+        JobRunner(threads=threads or THREADS).start(app)
+        click.echo(f"Running jobs with {threads or THREADS} threads, Ctrl+C to stop")
+        while True:
+            time.sleep(3600)
+
+    ############################################
+    #######   Slow query log summary     #######
+    ############################################
+    @app.cli.command('slow-queries')
+    @click.option('--limit', default=20, help='Statements to show')
+    def slow_queries_command(limit):
+        """ Slowest statements of the slow query log, grouped, full scans flagged """
+        from slow_queries import summarize_slow_log
+
+        for row in summarize_slow_log(limit):
+            scan = '  [SCAN]' if row['full_scan'] else ''
+            click.echo(f"{row['max_ms']:>9.1f} ms max  {row['count']:>5}x  {', '.join(row['endpoints'])}{scan}")
+            click.echo(f"    {' '.join(row['statement'].split())[:200]}")
@@ -0,0 +1,73 @@
+"""
+Denormalized favorite counters (People/Planet/Vehicle.favorite_count).
+
+Every favorite row inserted or deleted through the ORM bumps its entity's
+counter in the same flush: the API handlers, the cascade of a deleted user,
+the jobs, anything using the session. Both commit (or roll back) together.
+`repair_favorite_counts()` recomputes every counter from the favorites tables.
+"""
+from sqlalchemy import select, update, func, event
+
+from models import db, People, Planet, Vehicle, FavoritePeople, FavoritePlanets, FavoriteVehicles
+
+
+# entity model -> (favorites model, FK column on the favorites table)
+FAVORITE_TABLES = {
+    People:  (FavoritePeople,   FavoritePeople.people_id),
+    Planet:  (FavoritePlanets,  FavoritePlanets.planet_id),
+    Vehicle: (FavoriteVehicles, FavoriteVehicles.vehicle_id),
+}
+
+
+############################################
+#######   Bumped on every flush      #######
+############################################
+def _bump_listener(model, fk_column, delta):
+    table = model.__table__
+
+    def bump_favorite_count(mapper, connection, target):
+        # Atomic `favorite_count + delta`, `edited` kept: a new favorite is not an edit of the entry.
+        # Core on the flush's connection: no ORM event, the list generations stay as they are
+        connection.execute(
+            update(table)
+            .where(table.c.id == getattr(target, fk_column.key))
+            .values(favorite_count=table.c.favorite_count + delta, edited=table.c.edited)
+        )
+    return bump_favorite_count
+
+
+for _model, (_favorite_model, _fk_column) in FAVORITE_TABLES.items():
+    event.listen(_favorite_model, 'after_insert', _bump_listener(_model, _fk_column, +1))
+    event.listen(_favorite_model, 'after_delete', _bump_listener(_model, _fk_column, -1))
+
+
+def repair_favorite_counts():
+    """ Recompute every counter from the favorites tables, returns {table: rows updated} """
+    updated = {}
+
+    for model, (favorite_model, fk_column) in FAVORITE_TABLES.items():
+        real_count = (
+            select(func.count(favorite_model.id))
+            .where(fk_column == model.id)
+            .scalar_subquery()
+        )
+        result = db.session.execute(
+            update(model)
+            .where(model.favorite_count != real_count)
+            .values(favorite_count=real_count, edited=model.edited)
+            .execution_options(synchronize_session=False, keeps_generation=True)
+        )
+        updated[model.__tablename__] = result.rowcount
+
+    db.session.commit()
+    return updated
+
+
+def most_favorited(model, limit):
+    """ Top-N entities by favorite_count, one scan of the favorite_count index """
+    return (
+        model.query
+        .order_by(model.favorite_count.desc(), model.id)
+        .limit(limit)
+        .all()
+    )
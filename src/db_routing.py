@@ -0,0 +1,169 @@
+"""
+Read replica routing: GET/HEAD requests read from the "replica" bind, every
+other request (and every flush) goes to the primary database.
+"""
+import os
+import time
+import sqlite3
+import logging
+import threading
+
+from flask import request, has_request_context, g
+from flask_sqlalchemy.session import Session
+
+from sqlite_tuning import is_sqlite_url
+
+
+logger = logging.getLogger(__name__)
+
+
+#########################################################################################
+#########################################################################################
+#############                     READ REPLICA ROUTING                      #############
+#########################################################################################
+#########################################################################################
+"""
+Configuration (environment variables):
+
+    DATABASE_REPLICA_URL ........ read replica, same schema as DATABASE_URL.
+                                  Without it everything runs on the primary.
+    REPLICA_STICKY_SECONDS=5 .... after a client writes, its reads stay on the
+                                  primary for this long (read-your-writes)
+    REPLICA_SIMULATED_LAG=0 ..... local testing only: when primary and replica
+                                  are both SQLite files, copy primary -> replica
+                                  every N seconds to simulate replication lag
+
+Local test with two SQLite files and 3 seconds of lag:
+
+    DATABASE_URL=sqlite:////tmp/primary.db
+    DATABASE_REPLICA_URL=sqlite:////tmp/replica.db
+    REPLICA_SIMULATED_LAG=3
+"""
+
+REPLICA_BIND = 'replica'
+STICKY_COOKIE = 'read_primary_until'
+READ_METHODS = ('GET', 'HEAD')
+
+
+def _sticky_seconds():
+    return float(os.getenv('REPLICA_STICKY_SECONDS', '5'))
+
+
+def _client_is_sticky():
+    # Stickiness is carried by a cookie so it holds across every gunicorn worker
+    try:
+        until = float(request.cookies.get(STICKY_COOKIE, 0))
+    except ValueError:
+        return False
+    return until > time.time()
+
+
+def use_read_replica():
+    """ True when the current request may be answered from the replica """
+    if not has_request_context():
+        return False
+    if request.method not in READ_METHODS:
+        return False
+    if g.get('force_primary'):
+        return False
+    return not _client_is_sticky()
+
+
+############################################
+####### Session choosing the engine  #######
+############################################
+class RoutingSession(Session):
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        # A session opened on one connection (atomic /batch) stays on it
+        if self.bind is not None and bind is None:
+            return self.bind
+
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+        engines = self._db.engines
+        if REPLICA_BIND not in engines or bind is not None:
+            return engine
+
+        # Writes always go to the primary, only default-bind reads are routed
+        if self._flushing or engine is not engines.get(None):
+            return engine
+
+        if use_read_replica():
+            return engines[REPLICA_BIND]
+
+        return engine
+
+
+############################################
+#######     Simulated replication    #######
+############################################
+def _sqlite_path(url):
+    return str(url).split(':///', 1)[1]
+
+
+class ReplicationSimulator(threading.Thread):
+    """ Copies the primary SQLite file onto the replica every `lag` seconds """
+
+    def __init__(self, primary_url, replica_url, lag):
+        super().__init__(daemon=True, name='replication-simulator')
+        self.primary_path = _sqlite_path(primary_url)
+        self.replica_path = _sqlite_path(replica_url)
+        self.lag = lag
+
+    def copy_once(self):
+        if not os.path.exists(self.primary_path):
+            return
+        source = sqlite3.connect(self.primary_path)
+        target = sqlite3.connect(self.replica_path)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+
+    def run(self):
+        while True:
+            time.sleep(self.lag)
+            try:
+                self.copy_once()
+            except sqlite3.Error as e:
+                logger.warning(f"Replication simulator copy failed: {str(e)}")
+
+
+############################################
+#######             Setup            #######
+############################################
+def configure_read_replica(app):
+    """
+    Register the replica bind and the stickiness hooks.
+    Must run before `db.init_app(app)` so the bind engine gets created.
+    """
+    replica_url = os.getenv('DATABASE_REPLICA_URL')
+    if not replica_url:
+        return
+
+    replica_url = replica_url.replace("postgres://", "postgresql://")
+    app.config.setdefault('SQLALCHEMY_BINDS', {})[REPLICA_BIND] = replica_url
+
+    primary_url = app.config['SQLALCHEMY_DATABASE_URI']
+    lag = float(os.getenv('REPLICA_SIMULATED_LAG', '0'))
+    simulate = lag > 0 and is_sqlite_url(primary_url) and is_sqlite_url(replica_url)
+    simulator_started = []
+
+    if simulate and not os.path.exists(_sqlite_path(replica_url)):
+        ReplicationSimulator(primary_url, replica_url, lag).copy_once()
+
+    @app.before_request
+    def start_replication_simulator():
+        # Started lazily so it runs inside each (forked) worker
+        if simulate and not simulator_started:
+            simulator_started.append(True)
+            ReplicationSimulator(primary_url, replica_url, lag).start()
+
+    @app.after_request
+    def mark_client_sticky(response):
+        if request.method not in READ_METHODS and request.method != 'OPTIONS' and response.status_code < 400:
+            window = _sticky_seconds()
+            response.set_cookie(STICKY_COOKIE, str(time.time() + window), max_age=int(window) + 1, httponly=True)
+        return response
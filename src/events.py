@@ -0,0 +1,350 @@
+"""
+Event stream: GET /events, Server-Sent Events of the catalog and favorites changes.
+
+The handlers in app.py call `emit_event()` before they commit. An event is a
+row of the `event` outbox table, committed (or rolled back) with the change
+itself, so every worker and entry point shares one ordered log.
+
+The stream is served by the ASGI entry point (asgi.py): one asyncio task per
+process polls the outbox and fans new rows out to one in-memory queue per
+subscriber. Idle connections cost no thread and the database sees one query
+per poll interval whatever the number of subscribers.
+
+    id: 42
+    event: people.updated
+    data: {"data":{...},"id":1}
+
+Types: people|planets|vehicles.created|updated|deleted, favorites.added|removed.
+Reconnecting clients send Last-Event-ID (EventSource does it by itself) and
+get what they missed replayed from the outbox first.
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+from urllib.parse import parse_qs
+
+from sqlalchemy import select, delete, func
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db, Event
+from changes import server_time_ago
+from auth import bearer_user_id, AuthError
+
+
+logger = logging.getLogger(__name__)
+
+
+#########################################################################################
+#########################################################################################
+#############                         EVENT STREAM                          #############
+#########################################################################################
+#########################################################################################
+"""
+Configuration (environment variables):
+
+    EVENTS_POLL_INTERVAL=0.5 ............ seconds between two polls of the outbox
+    EVENTS_KEEPALIVE_SECONDS=15 ......... comment line sent on idle streams
+    EVENTS_QUEUE_SIZE=1000 .............. events buffered per subscriber, a slower
+                                          client is disconnected and resumes by Last-Event-ID
+    EVENTS_REPLAY_LIMIT=5000 ............ events replayed on resume, further behind gets a reset
+    EVENTS_GAP_TIMEOUT=5 ................ seconds a missing id waits for its (slow) transaction
+    EVENTS_RETENTION_HOURS=24 ........... outbox rows kept, `flask prune-events` (hourly cron)
+
+Query string: ?topics=people,planets,vehicles,favorites (default all).
+
+The favorites topic only carries the events of the user whose token comes
+with the request (Authorization: Bearer, or ?access_token= since EventSource
+cannot set headers), ?user_id=<id> must be that user. Without a token it is
+left out of the default topics, and asked for explicitly it is a 401. With
+AUTH_REQUIRED=0 a request without a token still gets every user's favorites
+events, or the ones of ?user_id= (migration window, see auth.py).
+A client too far behind receives `event: reset` and should reload its data.
+"""
+
+POLL_INTERVAL   = float(os.getenv('EVENTS_POLL_INTERVAL', '0.5'))
+KEEPALIVE       = float(os.getenv('EVENTS_KEEPALIVE_SECONDS', '15'))
+QUEUE_SIZE      = int(os.getenv('EVENTS_QUEUE_SIZE', '1000'))
+REPLAY_LIMIT    = int(os.getenv('EVENTS_REPLAY_LIMIT', '5000'))
+GAP_TIMEOUT     = float(os.getenv('EVENTS_GAP_TIMEOUT', '5'))
+RETENTION_HOURS = float(os.getenv('EVENTS_RETENTION_HOURS', '24'))
+
+TOPICS     = ('people', 'planets', 'vehicles', 'favorites')
+POLL_BATCH = 1000
+
+
+############################################
+#######     Emitting (Flask side)    #######
+############################################
+def emit_event(event_type, entity=None, **payload):
+    """
+    Queue an event in the current transaction, it is streamed once committed.
+    With `entity` the payload carries its id and serialize() output.
+    """
+    if entity is not None:
+        db.session.flush()  # id and server side defaults of a new row
+        payload = {'id': entity.id, 'data': entity.serialize(), **payload}
+
+    db.session.add(Event(type=event_type, payload=json.dumps(payload, sort_keys=True, separators=(',', ':'))))
+
+
+def prune_events():
+    """ Delete the outbox rows older than the retention window, returns how many """
+    result = db.session.execute(
+        delete(Event).where(Event.created_at < server_time_ago(RETENTION_HOURS * 3600))
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+############################################
+#######     Fan-out (ASGI side)      #######
+############################################
+class Subscriber:
+
+    def __init__(self, topics, user_id):
+        self.queue      = asyncio.Queue(QUEUE_SIZE)
+        self.topics     = topics
+        self.user_id    = user_id
+        self.overflowed = False
+
+    def wants(self, event_type, payload):
+        topic = event_type.split('.', 1)[0]
+        if topic not in self.topics:
+            return False
+        return topic != 'favorites' or self.user_id is None or payload.get('user_id') == self.user_id
+
+    def offer(self, event, payload):
+        if self.overflowed or not self.wants(event.type, payload):
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # The stream sends what is queued then ends, the client resumes from the outbox
+            self.overflowed = True
+
+
+class EventCursor:
+    """
+    Position in the outbox of one reader. Ids commit out of order with
+    concurrent writers: a hole below the newest id seen may still fill in, it
+    is waited for GAP_TIMEOUT seconds, then skipped for good (rolled back).
+    """
+
+    def __init__(self, last_id, seen=()):
+        self.last_id = last_id    # every id up to here was handled (or given up on)
+        self.seen    = set(seen)  # ids above last_id already handled
+        self.gaps    = {}         # id missing above last_id -> when it was noticed
+        self._advance(time.monotonic())
+
+    def fresh(self, rows):
+        """ The rows (ordered by id) not handled yet, the cursor moves past them """
+        now = time.monotonic()
+        rows = [row for row in rows if row.id > self.last_id and row.id not in self.seen]
+        for row in rows:
+            self.seen.add(row.id)
+            self.gaps.pop(row.id, None)
+        self._advance(now)
+        return rows
+
+    def _advance(self, now):
+        if self.seen:
+            for missing in range(self.last_id + 1, max(self.seen)):
+                if missing not in self.seen:
+                    self.gaps.setdefault(missing, now)
+
+        while True:
+            following = self.last_id + 1
+            if following in self.seen:
+                self.seen.discard(following)
+            elif following in self.gaps and now - self.gaps[following] > GAP_TIMEOUT:
+                del self.gaps[following]
+            else:
+                break
+            self.last_id = following
+
+
+class EventBroker:
+
+    def __init__(self, engine):
+        self.engine      = engine
+        self.subscribers = set()
+        self.poller      = None
+        self.cursor      = None
+
+    def subscribe(self, topics, user_id):
+        subscriber = Subscriber(topics, user_id)
+        self.subscribers.add(subscriber)
+        if self.poller is None or self.poller.done():
+            self.poller = asyncio.create_task(self._poll())
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+
+    async def close(self):
+        if self.poller is not None:
+            self.poller.cancel()
+
+    async def _poll(self):
+        # Runs while someone listens, the next subscriber starts over from the current end
+        try:
+            async with self.engine.connect() as connection:
+                self.cursor = EventCursor((await connection.execute(select(func.coalesce(func.max(Event.id), 0)))).scalar())
+
+            while self.subscribers:
+                try:
+                    async with self.engine.connect() as connection:
+                        rows = (await connection.execute(
+                            select(Event.id, Event.type, Event.payload)
+                            .where(Event.id > self.cursor.last_id)
+                            .order_by(Event.id)
+                            .limit(POLL_BATCH)
+                        )).all()
+                    self._publish(rows)
+                except SQLAlchemyError as e:
+                    logger.warning(f"Event stream poll failed: {str(e)}")
+                await asyncio.sleep(POLL_INTERVAL)
+        finally:
+            self.cursor = None
+
+    def _publish(self, rows):
+        for event in self.cursor.fresh(rows):
+            payload = json.loads(event.payload)
+            for subscriber in list(self.subscribers):
+                subscriber.offer(event, payload)
+
+
+############################################
+#######         SSE endpoint         #######
+############################################
+def _frame(event):
+    return f'id: {event.id}\nevent: {event.type}\ndata: {event.payload}\n\n'.encode()
+
+
+async def _replay(engine, last_event_id):
+    """ (missed events, reset) after `last_event_id` """
+    async with engine.connect() as connection:
+        oldest = (await connection.execute(select(func.min(Event.id)))).scalar()
+        if oldest is not None and oldest > last_event_id + 1:
+            return [], True  # Pruned meanwhile
+
+        rows = (await connection.execute(
+            select(Event.id, Event.type, Event.payload)
+            .where(Event.id > last_event_id)
+            .order_by(Event.id)
+            .limit(REPLAY_LIMIT + 1)
+        )).all()
+
+    if len(rows) > REPLAY_LIMIT:
+        return [], True
+    return rows, False
+
+
+def _stream_options(scope):
+    """ (topics, user_id, last_event_id), ValueError with a client facing message, AuthError """
+    params = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    headers = dict(scope['headers'])
+
+    requested = set(filter(None, params.get('topics', [''])[0].split(',')))
+    unknown = requested - set(TOPICS)
+    if unknown:
+        raise ValueError(f'Unknown topics: {", ".join(sorted(unknown))} (one of {", ".join(TOPICS)})')
+
+    try:
+        user_id = int(params['user_id'][0]) if 'user_id' in params else None
+        # EventSource sends the header on reconnects, the parameter is for the first connection
+        last_event_id = headers.get(b'last-event-id', b'').decode() or params.get('last_event_id', [''])[0]
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        raise ValueError('user_id and Last-Event-ID must be integers')
+
+    topics = requested or set(TOPICS)
+    if 'favorites' in topics:
+        authorization = headers.get(b'authorization', b'').decode('latin-1')
+        if not authorization and 'access_token' in params:
+            authorization = f'Bearer {params["access_token"][0]}'
+
+        if not authorization and not requested:
+            topics.discard('favorites')
+        else:
+            token_user = bearer_user_id(authorization)
+            if token_user is not None:
+                if user_id is not None and user_id != token_user:
+                    raise AuthError(403, f'The token does not belong to user {user_id}')
+                user_id = token_user
+
+    return topics, user_id, last_event_id
+
+
+async def _pump(send, subscriber, replayed):
+    while True:
+        try:
+            event = await asyncio.wait_for(subscriber.queue.get(), KEEPALIVE)
+        except asyncio.TimeoutError:
+            await send({'type': 'http.response.body', 'body': b': keepalive\n\n', 'more_body': True})
+            continue
+
+        if event.id not in replayed:
+            await send({'type': 'http.response.body', 'body': _frame(event), 'more_body': True})
+        if subscriber.overflowed and subscriber.queue.empty():
+            return
+
+
+async def _until_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def stream_events(scope, receive, send, broker):
+    try:
+        topics, user_id, last_event_id = _stream_options(scope)
+    except (ValueError, AuthError) as e:
+        status = e.status if isinstance(e, AuthError) else 400
+        headers = [(b'content-type', b'application/json')]
+        if status == 401:
+            headers.append((b'www-authenticate', b'Bearer'))
+        payload = json.dumps({'success': False, 'message': str(e)}, sort_keys=True).encode()
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': payload})
+        return
+
+    # Subscribed before the replay is read: nothing committed in between is lost
+    subscriber = broker.subscribe(topics, user_id)
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+                (b'access-control-allow-origin', b'*'),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': b'retry: 3000\n\n', 'more_body': True})
+
+        replayed = set()
+        if last_event_id is not None:
+            rows, reset = await _replay(broker.engine, last_event_id)
+            if reset:
+                await send({'type': 'http.response.body', 'body': b'event: reset\ndata: {}\n\n', 'more_body': True})
+            for event in rows:
+                if subscriber.wants(event.type, json.loads(event.payload)):
+                    await send({'type': 'http.response.body', 'body': _frame(event), 'more_body': True})
+                replayed.add(event.id)
+
+        pump = asyncio.create_task(_pump(send, subscriber, replayed))
+        disconnect = asyncio.create_task(_until_disconnect(receive))
+        done, pending = await asyncio.wait({pump, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        if pump in done and pump.exception() is None:
+            await send({'type': 'http.response.body', 'body': b''})
+
+    except (OSError, SQLAlchemyError) as e:
+        logger.warning(f"Event stream closed: {str(e)}")
+
+    finally:
+        broker.unsubscribe(subscriber)
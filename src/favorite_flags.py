@@ -0,0 +1,164 @@
+"""
+Per-user "is this a favorite?" flags, used to decorate catalog lists.
+
+Every cached user holds one IdBitset per kind: a roaring-style set where the
+high bits of an id select a 65536-id chunk. A chunk holds its low 16 bits
+either as a sorted array('H') (2 bytes per id) or, past ARRAY_MAX ids, as a
+plain Python int used as an 8 KB bitmap, whichever is smaller. A user with a
+few favorites costs a few bytes each, however large or scattered the ids.
+
+Users are kept in a bounded LRU cache (FAVORITE_FLAGS_CACHE_SIZE users). The
+favorite handlers of this worker update a cached user in place; entries expire
+after FAVORITE_FLAGS_TTL_SECONDS to pick up changes made by the other workers.
+"""
+import os
+import time
+import bisect
+import threading
+from array import array
+from collections import OrderedDict
+
+from sqlalchemy import select, literal, union_all
+
+from models import db
+from favorites import FAVORITE_KINDS
+from prerender import with_fields
+
+
+CACHE_SIZE  = int(os.getenv('FAVORITE_FLAGS_CACHE_SIZE', '10000'))
+TTL_SECONDS = float(os.getenv('FAVORITE_FLAGS_TTL_SECONDS', '60'))
+
+CHUNK_BITS = 16
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+# Above it a bitmap (65536 bits) is smaller than the array of 2-byte lows
+ARRAY_MAX  = 4096
+
+
+############################################
+#######       Compressed id set      #######
+############################################
+class IdBitset:
+
+    __slots__ = ('chunks',)
+
+    def __init__(self, ids=()):
+        self.chunks = {}  # high bits -> array('H') of sorted lows, or int bitmap
+        for entity_id in ids:
+            self.add(entity_id)
+
+    def add(self, entity_id):
+        high, low = entity_id >> CHUNK_BITS, entity_id & CHUNK_MASK
+        chunk = self.chunks.get(high)
+        if chunk is None:
+            self.chunks[high] = array('H', (low,))
+        elif isinstance(chunk, int):
+            self.chunks[high] = chunk | (1 << low)
+        else:
+            position = bisect.bisect_left(chunk, low)
+            if position == len(chunk) or chunk[position] != low:
+                chunk.insert(position, low)
+                if len(chunk) > ARRAY_MAX:
+                    self.chunks[high] = sum(1 << value for value in chunk)
+
+    def discard(self, entity_id):
+        high, low = entity_id >> CHUNK_BITS, entity_id & CHUNK_MASK
+        chunk = self.chunks.get(high)
+        if chunk is None:
+            return
+        if isinstance(chunk, int):
+            chunk &= ~(1 << low)
+            if chunk.bit_count() <= ARRAY_MAX:
+                chunk = array('H', (value for value in range(chunk.bit_length()) if chunk >> value & 1))
+            self.chunks[high] = chunk
+        else:
+            position = bisect.bisect_left(chunk, low)
+            if position < len(chunk) and chunk[position] == low:
+                del chunk[position]
+        if not chunk:
+            del self.chunks[high]
+
+    def __contains__(self, entity_id):
+        chunk = self.chunks.get(entity_id >> CHUNK_BITS)
+        if chunk is None:
+            return False
+        low = entity_id & CHUNK_MASK
+        if isinstance(chunk, int):
+            return bool((chunk >> low) & 1)
+        position = bisect.bisect_left(chunk, low)
+        return position < len(chunk) and chunk[position] == low
+
+    def __len__(self):
+        return sum(chunk.bit_count() if isinstance(chunk, int) else len(chunk) for chunk in self.chunks.values())
+
+
+############################################
+#######      Bounded user cache      #######
+############################################
+class FavoriteFlags:
+
+    def __init__(self, size=CACHE_SIZE, ttl=TTL_SECONDS):
+        self.size  = size
+        self.ttl   = ttl
+        self.lock  = threading.Lock()
+        self.users = OrderedDict()  # user_id -> (loaded_at, {kind: IdBitset})
+
+    def _load(self, user_id):
+        """ All favorite ids of one user, one UNION ALL over the three favorites tables """
+        branches = []
+        for kind, (_, favorite_model, fk, _, _) in FAVORITE_KINDS.items():
+            branches.append(
+                select(literal(kind).label('kind'), getattr(favorite_model, fk).label('entity_id'))
+                .where(favorite_model.user_id == user_id)
+            )
+
+        bitsets = {kind: IdBitset() for kind in FAVORITE_KINDS}
+        for kind, entity_id in db.session.execute(union_all(*branches)):
+            bitsets[kind].add(entity_id)
+        return bitsets
+
+    def cached(self, user_id):
+        """ The user's bitsets if cached and fresh, else None (no query) """
+        with self.lock:
+            entry = self.users.get(user_id)
+            if entry is None or time.time() - entry[0] > self.ttl:
+                return None
+            self.users.move_to_end(user_id)
+            return entry[1]
+
+    def get(self, user_id):
+        bitsets = self.cached(user_id)
+        if bitsets is not None:
+            return bitsets
+
+        bitsets = self._load(user_id)
+        with self.lock:
+            self.users[user_id] = (time.time(), bitsets)
+            self.users.move_to_end(user_id)
+            while len(self.users) > self.size:
+                self.users.popitem(last=False)
+        return bitsets
+
+    def set(self, user_id, kind, entity_id, is_favorite):
+        """ Called by the favorite handlers after a successful commit """
+        with self.lock:
+            entry = self.users.get(user_id)
+            if entry is None:
+                return  # Not cached, the next get() reads the committed state
+            if is_favorite:
+                entry[1][kind].add(entity_id)
+            else:
+                entry[1][kind].discard(entity_id)
+
+    def forget_entity(self, kind, entity_id):
+        """ Called when a catalog entity is deleted (SQLite may hand its id out again) """
+        with self.lock:
+            for _, bitsets in self.users.values():
+                bitsets[kind].discard(entity_id)
+
+    def overlay(self, user_id, kind, rows):
+        """ Adds "is_favorite" to pre-rendered (id, blob) rows, the shared blobs are not touched """
+        bitset = self.get(user_id)[kind]
+        return [(entity_id, with_fields(blob, is_favorite=entity_id in bitset)) for entity_id, blob in rows]
+
+
+favorite_flags = FavoriteFlags()
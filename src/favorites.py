@@ -0,0 +1,124 @@
+"""
+Favorites read helpers that avoid the ORM relationship lazy loads.
+
+`user_favorites(user_id)` returns everything GET /user/<id>/favorites needs
+with ONE query: a UNION ALL of the three favorites tables, each joined to its
+entity table. The entity columns of the three kinds are laid out on shared
+positional "slots" (strings padded with NULLs), so the branches line up.
+"""
+from sqlalchemy import select, literal, null, cast, String, Integer, union_all
+
+from utils import IN_CHUNK
+from models import db, People, Planet, Vehicle, FavoritePeople, FavoritePlanets, FavoriteVehicles
+
+
+# kind -> (entity model, favorites model, FK attribute, key of the entity in Favorite*.serialize(), string fields)
+# Integer columns besides id (People.homeworld_id) get their own slots, see INTEGER_FIELDS
+FAVORITE_KINDS = {
+    'people': (
+        People, FavoritePeople, 'people_id', 'character',
+        ('name', 'birth_year', 'eye_color', 'gender', 'hair_color', 'height', 'mass', 'skin_color', 'homeworld', 'url'),
+    ),
+    'planets': (
+        Planet, FavoritePlanets, 'planet_id', 'planet',
+        ('name', 'diameter', 'rotation_period', 'orbital_period', 'gravity', 'population', 'climate', 'terrain', 'surface_water', 'url'),
+    ),
+    'vehicles': (
+        Vehicle, FavoriteVehicles, 'vehicle_id', 'vehicle',
+        ('name', 'model', 'vehicle_class', 'manufacturer', 'length', 'cost_in_credits', 'crew', 'passengers',
+         'max_atmos_speed', 'cargo_capacity', 'consumables', 'url'),
+    ),
+}
+
+INTEGER_FIELDS = {
+    'people':   ('homeworld_id',),
+    'planets':  (),
+    'vehicles': (),
+}
+
+SLOTS = max(len(fields) for *_, fields in FAVORITE_KINDS.values())
+INTEGER_SLOTS = max(len(fields) for fields in INTEGER_FIELDS.values())
+
+
+def _branch(kind, user_id):
+    model, favorite_model, fk, _, fields = FAVORITE_KINDS[kind]
+
+    string_slots = [getattr(model, field) for field in fields]
+    string_slots += [cast(null(), String)] * (SLOTS - len(fields))
+    integer_slots = [getattr(model, field) for field in INTEGER_FIELDS[kind]]
+    integer_slots += [cast(null(), Integer)] * (INTEGER_SLOTS - len(integer_slots))
+
+    return (
+        select(
+            literal(kind).label('kind'),
+            favorite_model.id.label('favorite_id'),
+            favorite_model.created_at.label('favorited_at'),
+            model.id.label('entity_id'),
+            model.created.label('created'),
+            model.edited.label('edited'),
+            *[slot.label(f'slot_{index}') for index, slot in enumerate(string_slots)],
+            *[slot.label(f'int_slot_{index}') for index, slot in enumerate(integer_slots)]
+        )
+        .join(model, getattr(favorite_model, fk) == model.id)
+        .where(favorite_model.user_id == user_id)
+    )
+
+
+def user_favorites_query(user_id):
+    query = union_all(*[_branch(kind, user_id) for kind in FAVORITE_KINDS])
+    return query.order_by(query.selected_columns.kind, query.selected_columns.favorite_id)
+
+
+def rows_to_favorites(rows, user_id):
+    """ UNION ALL rows -> items shaped exactly like Favorite*.serialize() """
+    favorites = {kind: [] for kind in FAVORITE_KINDS}
+
+    for row in rows:
+        model, _, fk, entity_key, fields = FAVORITE_KINDS[row.kind]
+
+        # A transient (never added to the session) instance gives the exact serialize() shape
+        entity = model(
+            id=row.entity_id,
+            created=row.created,
+            edited=row.edited,
+            **{field: row[6 + index] for index, field in enumerate(fields)},
+            **{field: row[6 + SLOTS + index] for index, field in enumerate(INTEGER_FIELDS[row.kind])}
+        )
+
+        favorites[row.kind].append({
+            'id':         row.favorite_id,
+            'user_id':    user_id,
+            fk:           row.entity_id,
+            entity_key:   entity.serialize(),
+            'created_at': row.favorited_at.isoformat() if row.favorited_at else None
+        })
+
+    return favorites
+
+
+def user_favorites(user_id):
+    """ {'people': [...], 'planets': [...], 'vehicles': [...]} in one round trip """
+    return rows_to_favorites(db.session.execute(user_favorites_query(user_id)), user_id)
+
+
+def favorite_membership(user_id, ids_by_kind):
+    """
+    {'people': [1, 2]} -> {'people': {1: True, 2: False}}
+    Every lookup is an IN query on (user_id, <fk>), covered by the unique_user_*_favorite index.
+    """
+    membership = {}
+
+    for kind, ids in ids_by_kind.items():
+        _, favorite_model, fk, _, _ = FAVORITE_KINDS[kind]
+        fk_column = getattr(favorite_model, fk)
+
+        found = set()
+        for start in range(0, len(ids), IN_CHUNK):
+            found.update(db.session.execute(
+                select(fk_column)
+                .where(favorite_model.user_id == user_id, fk_column.in_(ids[start:start + IN_CHUNK]))
+            ).scalars())
+
+        membership[kind] = {entity_id: entity_id in found for entity_id in ids}
+
+    return membership
@@ -0,0 +1,108 @@
+"""
+Gunicorn configuration, loaded with:
+
+    $ gunicorn wsgi --chdir ./src/ --config src/gunicorn.conf.py
+
+Everything can be tuned from the environment without touching this file:
+
+    WEB_CONCURRENCY ............. number of workers   (default: 2 * CPUs + 1, max 12)
+    GUNICORN_THREADS ............ threads per worker  (default: 2 -> gthread worker)
+    GUNICORN_TIMEOUT ............ worker timeout in seconds (default: 30)
+    GUNICORN_MAX_REQUESTS ....... recycle a worker after N requests (default: 2000, 0 = never)
+    GUNICORN_MAX_REQUESTS_JITTER  random extra requests so workers don't restart together (default: 200)
+    GUNICORN_MAX_RSS_MB ......... recycle a worker once its RSS goes above this (default: 512, 0 = never)
+    GUNICORN_WARMUP_PATHS ....... comma separated GET paths requested once per worker before serving
+                                  (default: /people,/planets,/vehicles)
+"""
+import os
+import multiprocessing
+
+
+############################################
+#######        Workers sizing        #######
+############################################
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value not in (None, '') else default
+
+
+cpu_count = multiprocessing.cpu_count()
+
+bind    = f"0.0.0.0:{os.getenv('PORT', '3000')}"
+workers = _env_int('WEB_CONCURRENCY', min(2 * cpu_count + 1, 12))
+threads = _env_int('GUNICORN_THREADS', 2)
+worker_class = 'gthread' if threads > 1 else 'sync'
+timeout = _env_int('GUNICORN_TIMEOUT', 30)
+graceful_timeout = timeout
+keepalive = 5
+
+# Import the app once in the master, workers share that memory copy-on-write
+preload_app = True
+
+# Recycle workers to cap slow memory growth
+max_requests        = _env_int('GUNICORN_MAX_REQUESTS', 2000)
+max_requests_jitter = _env_int('GUNICORN_MAX_REQUESTS_JITTER', 200)
+max_rss_mb          = _env_int('GUNICORN_MAX_RSS_MB', 512)
+
+accesslog = '-'
+
+# Web workers never run migrations (`flask db upgrade` does), don't pay for importing alembic
+os.environ.setdefault('MIGRATIONS_ENABLED', '0')
+
+
+############################################
+#######      Memory (RSS) ceiling    #######
+############################################
+def current_rss_mb():
+    """ Resident memory of this process in MB (Linux /proc, 0 if unknown) """
+    try:
+        with open('/proc/self/statm') as statm:
+            resident_pages = int(statm.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def post_request(worker, req, environ, resp):
+    if max_rss_mb and current_rss_mb() > max_rss_mb:
+        worker.log.warning(f"Worker {worker.pid} above {max_rss_mb} MB RSS, recycling after this request")
+        # Gunicorn finishes in-flight requests and the master spawns a fresh worker
+        worker.alive = False
+
+
+############################################
+#######            Warmup            #######
+############################################
+def post_fork(server, worker):
+    """
+    Runs in every new worker before it accepts connections:
+
+        1. drop DB connections inherited from the master (never share sockets across fork)
+        2. configure all SQLAlchemy mappers
+        3. open the pool connections this worker will need
+        4. hit the warmup paths once to prime compiled queries and caches
+    """
+    from sqlalchemy.orm import configure_mappers
+    from app import app
+    from models import db
+
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+        configure_mappers()
+
+        for engine in db.engines.values():
+            connections = [engine.connect() for _ in range(threads)]
+            for connection in connections:
+                connection.close()
+
+    warmup_paths = os.getenv('GUNICORN_WARMUP_PATHS', '/people,/planets,/vehicles')
+    client = app.test_client()
+    for path in filter(None, (p.strip() for p in warmup_paths.split(','))):
+        try:
+            client.get(path)
+        except Exception as e:
+            worker.log.warning(f"Warmup request {path} failed: {str(e)}")
+
+    worker.log.info(f"Worker {worker.pid} warmed up")
@@ -0,0 +1,260 @@
+"""
+Idempotency keys: a write request sent with an `Idempotency-Key` header is
+run once, its retries get the stored response back.
+
+    POST /user/1/favorite/planet/3
+    Idempotency-Key: 6f1c0e3a-...
+
+The first request claims the key (a committed `idempotency_key` row) before
+its handler runs and stores the response once answered. A retry of the same
+request is answered from that row by a primary key lookup, no handler runs
+and the catalog tables are not read. Every worker shares the table, a retry
+landing on another worker is replayed too.
+
+Keys belong to whoever sent them: the verified user of the token (auth.py),
+or the client address (admission.py) when the endpoint verifies no token.
+Two users picking the same key get two keys.
+
+    same key, request still running ..... 409, Retry-After
+    same key, another request ........... 422
+    replayed response ................... Idempotent-Replayed: true
+
+5xx answers are not stored: the key is released and the retry runs again.
+"""
+import os
+import time
+import hashlib
+import logging
+
+from flask import request
+from sqlalchemy import select, update, delete, func, and_, or_
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+
+from models import db, IdempotencyKey
+from changes import server_time_ago
+from auth import token_user_id
+from admission import client_id
+
+
+logger = logging.getLogger(__name__)
+
+
+#########################################################################################
+#########################################################################################
+#############                       IDEMPOTENCY KEYS                        #############
+#########################################################################################
+#########################################################################################
+"""
+Configuration (environment variables):
+
+    IDEMPOTENCY_TTL_HOURS=24 ............ stored responses kept, the older ones are deleted by
+                                          the writes themselves and by `flask prune-idempotency-keys`
+    IDEMPOTENCY_PRUNE_SECONDS=60 ........ a worker deletes the expired keys at most that often
+    IDEMPOTENCY_LOCK_SECONDS=60 ......... a key in flight for longer belongs to a dead
+                                          request (crashed or recycled worker), a retry takes it over
+    IDEMPOTENCY_MAX_BODY_BYTES=65536 .... larger responses are not stored, their key is released
+
+The fingerprint covers the method, the path with its query string and the
+body, not the Authorization header: a retry made with a refreshed token is
+still replayed. Token checks (auth.py) run first, only an authorized request
+claims or replays a key. POST /login is never stored.
+"""
+
+TTL_HOURS      = float(os.getenv('IDEMPOTENCY_TTL_HOURS', '24'))
+LOCK_SECONDS   = int(os.getenv('IDEMPOTENCY_LOCK_SECONDS', '60'))
+MAX_BODY_BYTES = int(os.getenv('IDEMPOTENCY_MAX_BODY_BYTES', '65536'))
+PRUNE_SECONDS  = float(os.getenv('IDEMPOTENCY_PRUNE_SECONDS', '60'))
+
+HEADER         = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+WRITE_METHODS  = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+# Their responses are credentials, not kept at rest
+NOT_STORED_ENDPOINTS = ('api.login',)
+
+# Set on the claiming request only, a /batch sub-request has its own
+OWNED_KEY = 'idempotency.key'
+
+
+_pruned_at = 0.0
+
+
+def _scoped_key(key):
+    """ Stored key: sha256 of its owner and the header value, fits the column whatever their length """
+    user_id = token_user_id()
+    # A /batch sub-request has the address of the batch's client (batch.run_batch)
+    owner = f'user:{user_id}' if user_id is not None else f'client:{client_id()}'
+    return hashlib.sha256(f'{owner}\0{key}'.encode()).hexdigest()
+
+
+def _fingerprint():
+    digest = hashlib.sha256()
+    for part in (request.method, request.full_path):
+        digest.update(part.encode() + b'\0')
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+def prune_idempotency_keys():
+    """ Delete the keys older than the TTL, returns how many """
+    result = db.session.execute(
+        delete(IdempotencyKey).where(IdempotencyKey.created_at < server_time_ago(TTL_HOURS * 3600))
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def _prune_now_and_then():
+    """ Bounds the table without the cron job: the expired keys go at most every PRUNE_SECONDS per worker """
+    global _pruned_at
+    if time.monotonic() - _pruned_at < PRUNE_SECONDS:
+        return
+    _pruned_at = time.monotonic()
+    try:
+        pruned = prune_idempotency_keys()
+        if pruned:
+            logger.info(f"Pruned {pruned} expired idempotency keys")
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logger.error(f"Expired idempotency keys not pruned: {str(e)}")
+
+
+############################################
+#######        Claim or replay       #######
+############################################
+def _stored(key):
+    """ The row of `key` with its `expired` and `abandoned` (in flight for too long) flags, or None """
+    return db.session.execute(
+        select(
+            IdempotencyKey.fingerprint,
+            IdempotencyKey.status_code,
+            IdempotencyKey.content_type,
+            IdempotencyKey.body,
+            (IdempotencyKey.created_at < server_time_ago(TTL_HOURS * 3600)).label('expired'),
+            and_(IdempotencyKey.status_code.is_(None),
+                 IdempotencyKey.created_at < server_time_ago(LOCK_SECONDS)).label('abandoned'),
+        )
+        .where(IdempotencyKey.key == key)
+    ).first()
+
+
+def _insert(key, fingerprint):
+    try:
+        db.session.add(IdempotencyKey(key=key, fingerprint=fingerprint))
+        db.session.commit()
+        return True
+    except IntegrityError:
+        # Claimed by a concurrent request in between
+        db.session.rollback()
+        return False
+
+
+def _take_over(key, fingerprint):
+    # Conditional: of two retries taking over the same dead key, one wins
+    taken_over = db.session.execute(
+        update(IdempotencyKey)
+        .where(
+            IdempotencyKey.key == key,
+            or_(
+                IdempotencyKey.created_at < server_time_ago(TTL_HOURS * 3600),
+                and_(IdempotencyKey.status_code.is_(None), IdempotencyKey.created_at < server_time_ago(LOCK_SECONDS)),
+            ),
+        )
+        .values(fingerprint=fingerprint, status_code=None, content_type=None, body=None, created_at=func.now())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return taken_over == 1
+
+
+def _error(app, status, message, **headers):
+    response = app.json.response({'success': False, 'message': message})
+    response.status_code = status
+    response.headers.update(headers)
+    return response
+
+
+def _release(key):
+    db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.key == key))
+    db.session.commit()
+
+
+def configure_idempotency(app):
+
+    @app.before_request
+    def claim_or_replay():
+        key = request.headers.get(HEADER)
+        if key is None or request.method not in WRITE_METHODS or request.endpoint in NOT_STORED_ENDPOINTS:
+            return None
+        if not key or len(key) > MAX_KEY_LENGTH or not key.isprintable():
+            return _error(app, 400, f'{HEADER} must be 1 to {MAX_KEY_LENGTH} printable characters')
+
+        fingerprint = _fingerprint()
+        stored_key = _scoped_key(key)
+        try:
+            # Twice: the row can change between the read and the claim (concurrent retry, release, prune)
+            for _ in range(2):
+                stored = _stored(stored_key)
+                if stored is None or stored.expired or stored.abandoned:
+                    claimed = _insert(stored_key, fingerprint) if stored is None else _take_over(stored_key, fingerprint)
+                    if claimed:
+                        request.environ[OWNED_KEY] = stored_key
+                        return None
+                    continue
+
+                if stored.fingerprint != fingerprint:
+                    return _error(app, 422, f'{HEADER} was already used for another request')
+                if stored.status_code is None:
+                    return _error(app, 409, 'A request with this key is still in progress', **{'Retry-After': '1'})
+
+                response = app.response_class(stored.body, status=stored.status_code, content_type=stored.content_type)
+                response.headers['Idempotent-Replayed'] = 'true'
+                return response
+
+            return _error(app, 409, 'A request with this key is still in progress', **{'Retry-After': '1'})
+
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logger.error(f"Idempotency key {key!r} not checked: {str(e)}")
+            return _error(app, 503, 'Idempotency store unavailable, retry later', **{'Retry-After': '1'})
+
+    @app.after_request
+    def store_response(response):
+        key = request.environ.pop(OWNED_KEY, None)
+        if key is None:
+            return response
+
+        try:
+            if response.status_code >= 500 or response.direct_passthrough or response.content_length is None \
+                    or response.content_length > MAX_BODY_BYTES:
+                _release(key)
+                return response
+
+            db.session.execute(
+                update(IdempotencyKey)
+                .where(IdempotencyKey.key == key)
+                .values(status_code=response.status_code, content_type=response.content_type, body=response.get_data())
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            # In flight until LOCK_SECONDS: a retry meanwhile gets a 409, not a second run
+            logger.error(f"Response of idempotency key {key!r} not stored: {str(e)}")
+
+        _prune_now_and_then()
+        return response
+
+    @app.teardown_request
+    def release_on_error(exception):
+        # after_request is skipped when an exception propagates (testing, debug)
+        key = request.environ.pop(OWNED_KEY, None)
+        if key is None:
+            return
+        try:
+            db.session.rollback()
+            _release(key)
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logger.error(f"Idempotency key {key!r} not released: {str(e)}")
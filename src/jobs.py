@@ -0,0 +1,431 @@
+"""
+Background jobs: long bulk operations (imports, exports, counter repairs,
+bulk deletes) run outside the request that asked for them.
+
+POST /jobs stores a `job` row and answers 202 right away. Every worker
+process runs a small thread pool, the job runner, that claims queued jobs
+from the table: jobs spread over the gunicorn workers (so over the cores),
+are never killed by the request timeout and are visible to every worker
+through GET /jobs/<id>. `flask run-jobs` runs a dedicated runner process.
+"""
+import os
+import json
+import time
+import socket
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import select, update, func
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Job
+from favorites import FAVORITE_KINDS
+from counters import repair_favorite_counts
+from prerender import prerender_catalog, with_missing_rendered
+from residents import resolve_homeworld_id, backfill_homeworlds, detach_residents
+from changes import prune_tombstones, server_time_ago
+from events import emit_event, prune_events
+from idempotency import prune_idempotency_keys
+from favorite_flags import favorite_flags
+
+
+logger = logging.getLogger(__name__)
+
+
+#########################################################################################
+#########################################################################################
+#############                        BACKGROUND JOBS                        #############
+#########################################################################################
+#########################################################################################
+"""
+Configuration (environment variables):
+
+    JOBS_ENABLED=1 ...................... run jobs in the web workers too
+                                          (0: only `flask run-jobs` processes run them)
+    JOBS_THREADS=2 ...................... jobs running at once per process
+    JOBS_MAX_RUNNING=4 .................. jobs running at once over all processes
+    JOBS_POLL_INTERVAL=2 ................ seconds between two looks at the queue
+    JOBS_STALE_SECONDS=300 .............. a running job without heartbeat for that long
+                                          failed with its process (recycled worker, crash)
+    JOBS_EXPORT_DIR=/tmp/jobs ........... export files, GET /jobs/<id>/download
+
+Jobs survive a recycled gunicorn worker only as a failed row: run the long
+ones with JOBS_ENABLED=0 on the web and a `flask run-jobs` process next to it.
+The global cap is checked in the claiming UPDATE, concurrent claims on
+PostgreSQL may overshoot it by one.
+"""
+
+THREADS       = int(os.getenv('JOBS_THREADS', '2'))
+MAX_RUNNING   = int(os.getenv('JOBS_MAX_RUNNING', '4'))
+POLL_INTERVAL = float(os.getenv('JOBS_POLL_INTERVAL', '2'))
+STALE_SECONDS = int(os.getenv('JOBS_STALE_SECONDS', '300'))
+EXPORT_DIR    = os.getenv('JOBS_EXPORT_DIR', '/tmp/jobs')
+
+BATCH_SIZE          = 500
+MAX_IMPORT_ITEMS    = 50000
+MAX_DELETE_IDS      = 50000
+MAX_REPORTED_ERRORS = 100
+PROGRESS_INTERVAL   = 1.0
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = 'queued', 'running', 'succeeded', 'failed', 'cancelled'
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobContext:
+    """ Handed to every job function: progress reporting and cancellation """
+
+    def __init__(self, job_id):
+        self.job_id      = job_id
+        self.reported_at = 0.0
+
+    def progress(self, done, total=None):
+        """ Call between committed batches, raises JobCancelled once a cancel was requested """
+        now = time.monotonic()
+        if now - self.reported_at < PROGRESS_INTERVAL and done != total:
+            return
+        self.reported_at = now
+
+        values = {'progress_done': done, 'heartbeat_at': func.now()}
+        if total is not None:
+            values['progress_total'] = total
+        db.session.execute(update(Job).where(Job.id == self.job_id).values(**values))
+        cancel = db.session.execute(select(Job.cancel_requested).where(Job.id == self.job_id)).scalar()
+        db.session.commit()
+        if cancel:
+            raise JobCancelled()
+
+
+############################################
+#######           Job types          #######
+############################################
+def _kind(params):
+    kind = params.get('kind')
+    if kind not in FAVORITE_KINDS:
+        raise ValueError(f'kind must be one of {", ".join(FAVORITE_KINDS)}')
+    return kind
+
+
+def _validate_import(params):
+    items = params.get('items')
+    if not isinstance(items, list) or not items or not all(isinstance(item, dict) for item in items):
+        raise ValueError('items must be a non empty list of objects')
+    if len(items) > MAX_IMPORT_ITEMS:
+        raise ValueError(f'At most {MAX_IMPORT_ITEMS} items per import')
+    return {'kind': _kind(params), 'items': items}
+
+
+def _validate_delete(params):
+    ids = params.get('ids')
+    if not isinstance(ids, list) or not ids or not all(isinstance(entity_id, int) for entity_id in ids):
+        raise ValueError('ids must be a non empty list of integers')
+    if len(ids) > MAX_DELETE_IDS:
+        raise ValueError(f'At most {MAX_DELETE_IDS} ids per delete')
+    return {'kind': _kind(params), 'ids': list(dict.fromkeys(ids))}
+
+
+def _new_entity(kind, item):
+    model, *_, fields = FAVORITE_KINDS[kind]
+    entity = model(**{field: item[field] for field in fields})
+    if kind == 'people':
+        entity.homeworld_id = item.get('homeworld_id') or resolve_homeworld_id(item['homeworld'])
+    return entity
+
+
+def _created_event(kind, entity):
+    # Built by hand: emit_event(entity=...) would flush one row at a time
+    emit_event(f'{kind}.created', id=entity.id, data=entity.serialize())
+
+
+def import_catalog(context, kind, items):
+    """ Create catalog rows in committed batches, a batch with a bad row is retried row by row """
+    fields = FAVORITE_KINDS[kind][-1]
+    created, errors = 0, []
+
+    for start in range(0, len(items), BATCH_SIZE):
+        batch = []
+        for index, item in enumerate(items[start:start + BATCH_SIZE], start):
+            missing = [field for field in fields if field not in item]
+            if missing:
+                errors.append({'index': index, 'error': f'Missing required fields: {", ".join(missing)}'})
+            else:
+                batch.append((index, item))
+
+        try:
+            entities = [_new_entity(kind, item) for _, item in batch]
+            db.session.add_all(entities)
+            db.session.flush()
+            for entity in entities:
+                _created_event(kind, entity)
+            db.session.commit()
+            created += len(entities)
+        except IntegrityError:
+            db.session.rollback()
+            for index, item in batch:
+                try:
+                    entity = _new_entity(kind, item)
+                    db.session.add(entity)
+                    db.session.flush()
+                    _created_event(kind, entity)
+                    db.session.commit()
+                    created += 1
+                except IntegrityError:
+                    db.session.rollback()
+                    errors.append({'index': index, 'error': 'Data integrity error - possibly duplicate URL'})
+
+        context.progress(min(start + BATCH_SIZE, len(items)), len(items))
+
+    return {'created': created, 'failed': len(errors), 'errors': errors[:MAX_REPORTED_ERRORS]}
+
+
+def export_catalog(context, kind):
+    """ Every row of a kind into one JSON array file, pre-rendered blobs in keyset batches """
+    model = FAVORITE_KINDS[kind][0]
+    total = db.session.execute(select(func.count(model.id))).scalar()
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    path = os.path.join(EXPORT_DIR, f'job-{context.job_id}-{kind}.json')
+
+    count, last_id = 0, 0
+    with open(path + '.part', 'w') as export_file:
+        export_file.write('[')
+        while True:
+            rows = db.session.execute(
+                select(model.id, model.serialized).where(model.id > last_id).order_by(model.id).limit(BATCH_SIZE)
+            ).all()
+            if not rows:
+                break
+            rows = with_missing_rendered(model, rows)
+            export_file.write((',' if count else '') + ','.join(blob for _, blob in rows))
+            count += len(rows)
+            last_id = rows[-1][0]
+            db.session.commit()  # No transaction held open between batches
+            context.progress(count, total)
+        export_file.write(']')
+
+    os.replace(path + '.part', path)
+    return {'rows': count, 'file': os.path.basename(path)}
+
+
+def delete_catalog(context, kind, ids):
+    """ Delete through the ORM in batches: favorites cascade, tombstones and events are written """
+    model = FAVORITE_KINDS[kind][0]
+    deleted = 0
+
+    for start in range(0, len(ids), BATCH_SIZE):
+        entities = model.query.filter(model.id.in_(ids[start:start + BATCH_SIZE])).all()
+        for entity in entities:
+            if kind == 'planets':
+                detach_residents(entity.id)
+            db.session.delete(entity)
+            emit_event(f'{kind}.deleted', id=entity.id)
+        db.session.commit()
+
+        for entity in entities:
+            favorite_flags.forget_entity(kind, entity.id)
+        deleted += len(entities)
+        context.progress(min(start + BATCH_SIZE, len(ids)), len(ids))
+
+    return {'deleted': deleted, 'not_found': len(ids) - deleted}
+
+
+def _repair_counters(context):
+    return {'updated': repair_favorite_counts()}
+
+
+def _prerender(context, only_missing):
+    return {'rendered': prerender_catalog(only_missing=only_missing)}
+
+
+def _backfill_homeworlds(context):
+    return {'linked': backfill_homeworlds()}
+
+
+def _prune_logs(context):
+    return {'tombstones': prune_tombstones(), 'events': prune_events(), 'idempotency_keys': prune_idempotency_keys()}
+
+
+# type -> (function(context, **params) -> result, params validator or None)
+JOB_TYPES = {
+    'import-catalog':         (import_catalog, _validate_import),
+    'export-catalog':         (export_catalog, lambda params: {'kind': _kind(params)}),
+    'delete-catalog':         (delete_catalog, _validate_delete),
+    'repair-favorite-counts': (_repair_counters, None),
+    'prerender-catalog':      (_prerender, lambda params: {'only_missing': not params.get('all')}),
+    'backfill-homeworlds':    (_backfill_homeworlds, None),
+    'prune-logs':             (_prune_logs, None),
+}
+
+
+############################################
+#######       Queue operations       #######
+############################################
+def enqueue_job(job_type, params):
+    """ The new queued Job, ValueError with a client facing message """
+    if job_type not in JOB_TYPES:
+        raise ValueError(f'type must be one of {", ".join(JOB_TYPES)}')
+    if params is not None and not isinstance(params, dict):
+        raise ValueError('params must be an object')
+
+    _, validate = JOB_TYPES[job_type]
+    params = validate(params or {}) if validate else {}
+
+    job = Job(type=job_type, params=json.dumps(params))
+    db.session.add(job)
+    db.session.commit()
+    job_runner.notify()
+    return job
+
+
+def cancel_job(job):
+    """ A queued job is cancelled at once, a running one stops at its next progress report """
+    if job.status == QUEUED:
+        cancelled = db.session.execute(
+            update(Job)
+            .where(Job.id == job.id, Job.status == QUEUED)
+            .values(status=CANCELLED, cancel_requested=True, finished_at=func.now())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if cancelled:
+            db.session.commit()
+            db.session.refresh(job)
+            return
+
+    if job.status not in FINISHED:
+        job.cancel_requested = True
+        db.session.commit()
+
+
+############################################
+#######          The runner          #######
+############################################
+class JobRunner:
+
+    def __init__(self, threads=THREADS, max_running=MAX_RUNNING, poll_interval=POLL_INTERVAL):
+        self.threads       = threads
+        self.max_running   = max_running
+        self.poll_interval = poll_interval
+        self.lock          = threading.Lock()
+        self.wakeup        = threading.Event()
+        self.pid           = None
+        self.running       = set()
+
+    def start(self, app):
+        """ Idempotent, starts again in a forked child (threads don't survive a fork) """
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid      = os.getpid()
+            self.app      = app
+            self.name     = f'{socket.gethostname()}:{self.pid}'
+            self.running  = set()
+            self.executor = ThreadPoolExecutor(self.threads, thread_name_prefix='job')
+            threading.Thread(target=self._loop, daemon=True, name='job-runner').start()
+
+    def notify(self):
+        """ A job was just queued, look now instead of at the next poll """
+        self.wakeup.set()
+
+    def _loop(self):
+        while True:
+            self.wakeup.wait(self.poll_interval)
+            self.wakeup.clear()
+            try:
+                with self.app.app_context():
+                    self._heartbeat()
+                    while len(self.running) < self.threads:
+                        job_id = self._claim()
+                        if job_id is None:
+                            break
+                        with self.lock:
+                            self.running.add(job_id)
+                        self.executor.submit(self._run, job_id)
+            except Exception as e:
+                logger.error(f"Job runner loop failed: {str(e)}")
+
+    def _heartbeat(self):
+        """ Own running jobs are alive, the ones nobody heartbeats any more failed with their process """
+        with self.lock:
+            running = list(self.running)
+        if running:
+            db.session.execute(update(Job).where(Job.id.in_(running)).values(heartbeat_at=func.now()))
+
+        db.session.execute(
+            update(Job)
+            .where(Job.status == RUNNING, Job.heartbeat_at < server_time_ago(STALE_SECONDS))
+            .values(status=FAILED, error='Worker lost (no heartbeat)', finished_at=func.now())
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+    def _claim(self):
+        """ Oldest queued job id when this process won it, None otherwise """
+        candidate = db.session.execute(
+            select(Job.id).where(Job.status == QUEUED).order_by(Job.id).limit(1)
+        ).scalar()
+        if candidate is None:
+            return None
+
+        running_now = select(func.count(Job.id)).where(Job.status == RUNNING).scalar_subquery()
+        claimed = db.session.execute(
+            update(Job)
+            .where(Job.id == candidate, Job.status == QUEUED, running_now < self.max_running)
+            .values(status=RUNNING, worker=self.name, started_at=func.now(), heartbeat_at=func.now())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        return candidate if claimed == 1 else None
+
+    def _finish(self, job_id, status, result=None, error=None):
+        db.session.execute(
+            update(Job)
+            .where(Job.id == job_id)
+            .values(status=status, result=result, error=error, finished_at=func.now())
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+    def _run(self, job_id):
+        try:
+            with self.app.app_context():
+                job = db.session.get(Job, job_id)
+                job_type, params, cancel_requested = job.type, json.loads(job.params), job.cancel_requested
+                function, _ = JOB_TYPES[job_type]
+                db.session.commit()
+
+                try:
+                    if cancel_requested:
+                        raise JobCancelled()
+                    result = function(JobContext(job_id), **params)
+                    self._finish(job_id, SUCCEEDED, result=json.dumps(result, default=str))
+                except JobCancelled:
+                    db.session.rollback()
+                    self._finish(job_id, CANCELLED)
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"Job {job_id} ({job_type}) failed: {str(e)}")
+                    self._finish(job_id, FAILED, error=str(e))
+        except Exception as e:
+            logger.error(f"Job {job_id} could not be run: {str(e)}")
+        finally:
+            with self.lock:
+                self.running.discard(job_id)
+            self.wakeup.set()
+
+
+job_runner = JobRunner()
+
+
+def configure_jobs(app):
+    if os.getenv('JOBS_ENABLED', '1') == '0':
+        return
+
+    @app.before_request
+    def start_job_runner():
+        # Started by the first request of every worker, never in the gunicorn master
+        job_runner.start(app)
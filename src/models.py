@@ -1,9 +1,11 @@
+import json
 from flask_sqlalchemy import SQLAlchemy
 from typing import List, Optional
-from sqlalchemy import Column, ForeignKey, Integer, String, DateTime, func, Boolean, UniqueConstraint
+from sqlalchemy import Column, ForeignKey, Integer, String, Text, DateTime, func, Boolean, UniqueConstraint, Index, LargeBinary
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 # from sqlalchemy.orm import DeclarativeBase, declarative_base ### ---> SIN USAR
 from datetime import datetime, timezone
+from db_routing import RoutingSession
 
 
 #########################################################################################
@@ -32,7 +34,8 @@ Create Favorite handling tables:
 """
 
 
-db = SQLAlchemy()
+# RoutingSession sends GET reads to the read replica when one is configured
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 
 ############################################
@@ -137,6 +140,7 @@ TO-DO's:
     [x] mass
     [x] skin_color
     [x] homeworld
+    [x] homeworld_id (Foreign Key to Planet)
     [x] url
     [x] created
     [x] edited
@@ -154,7 +158,7 @@ class People(db.Model):
     ### ATTRIBUTES ###
 
     id:          Mapped[int] = mapped_column(              primary_key=True)
-    name:        Mapped[str] = mapped_column( String(100),                   nullable=False)
+    name:        Mapped[str] = mapped_column( String(100), index=True,       nullable=False)
     birth_year:  Mapped[str] = mapped_column( String(100),                   nullable=False)
     eye_color:   Mapped[str] = mapped_column( String(100),                   nullable=False)
     gender:      Mapped[str] = mapped_column( String(100),                   nullable=False)
@@ -163,9 +167,21 @@ class People(db.Model):
     mass:        Mapped[str] = mapped_column( String(40),                    nullable=False)
     skin_color:  Mapped[str] = mapped_column( String(20),                    nullable=False)
     homeworld:   Mapped[str] = mapped_column( String(40),                    nullable=False)
+    # Normalized homeworld, resolved from the `homeworld` string (planet name or URL), see residents.py
+    homeworld_id: Mapped[Optional[int]] = mapped_column( ForeignKey('planet.id', ondelete='SET NULL'), nullable=True, index=True)
     url:         Mapped[str] = mapped_column( String(100), unique=True,      nullable=False)
-    created:     Mapped[datetime] = mapped_column( DateTime(timezone=True), default=func.now(), nullable=False)
-    edited:      Mapped[Optional[datetime]] = mapped_column( DateTime(timezone=True), default=func.now(), onupdate=func.now())
+    created:     Mapped[datetime] = mapped_column( DateTime(timezone=True), default=func.now(), nullable=False, index=True)
+    # Indexed for the delta sync (GET /<list>/changes, see changes.py)
+    edited:      Mapped[Optional[datetime]] = mapped_column( DateTime(timezone=True), default=func.now(), onupdate=func.now(), index=True)
+
+    # Denormalized number of FavoritePeople rows, kept in sync on every favorite insert / delete (see counters.py)
+    favorite_count: Mapped[int] = mapped_column( Integer, default=0, server_default='0', nullable=False, index=True)
+
+    # serialize() pre-rendered as JSON, refreshed on every write (see prerender.py), never loaded by default
+    serialized: Mapped[Optional[str]] = mapped_column( Text, nullable=True, deferred=True)
+
+    # created/edited come back with the INSERT/UPDATE (RETURNING), prerender.py needs them during the flush
+    __mapper_args__ = {'eager_defaults': True}
 
 
     ### RELATIONS ###
@@ -190,6 +206,7 @@ class People(db.Model):
             "mass":        self.mass,
             "skin_color":  self.skin_color,
             "homeworld":   self.homeworld,
+            "homeworld_id": self.homeworld_id,
             "url":         self.url,
             "created":     self.created.isoformat()  if self.created else None,
             "edited":      self.edited.isoformat()   if self.edited  else None
@@ -234,8 +251,8 @@ class FavoritePeople(db.Model):
     ### ATTRIBUTES ###
     id:         Mapped[int]      = mapped_column( primary_key=True)
     user_id:    Mapped[int]      = mapped_column( ForeignKey('user.id'),   nullable=False)
-    people_id:  Mapped[int]      = mapped_column( ForeignKey('people.id'), nullable=False)
-    created_at: Mapped[datetime] = mapped_column( DateTime(timezone=True), default=func.now(), nullable=False)
+    people_id:  Mapped[int]      = mapped_column( ForeignKey('people.id'), nullable=False, index=True)
+    created_at: Mapped[datetime] = mapped_column( DateTime(timezone=True), default=func.now(), nullable=False, index=True)
 
     ### TABLE CONSTRAINTS ###
     __table_args__ = (
@@ -306,7 +323,7 @@ class Planet(db.Model):
 
     ### ATTRIBUTES ###
     id:              Mapped[int] = mapped_column(              primary_key=True)
-    name:            Mapped[str] = mapped_column( String(100),                   nullable=False)
+    name:            Mapped[str] = mapped_column( String(100), index=True,       nullable=False)
     diameter:        Mapped[str] = mapped_column( String(100),                   nullable=False)
     rotation_period: Mapped[str] = mapped_column( String(100),                   nullable=False)
     orbital_period:  Mapped[str] = mapped_column( String(100),                   nullable=False)
@@ -316,8 +333,18 @@ class Planet(db.Model):
     terrain:         Mapped[str] = mapped_column( String(100),                   nullable=False)
     surface_water:   Mapped[str] = mapped_column( String(100),                   nullable=False)
     url:             Mapped[str] = mapped_column( String(100), unique=True,      nullable=False)
-    created:         Mapped[datetime] = mapped_column( DateTime(timezone=True), default=func.now(), nullable=False)
-    edited:          Mapped[Optional[datetime]] = mapped_column( DateTime(timezone=True), default=func.now(), onupdate=func.now())
+    created:         Mapped[datetime] = mapped_column( DateTime(timezone=True), default=func.now(), nullable=False, index=True)
+    # Indexed for the delta sync (GET /<list>/changes, see changes.py)
+    edited:          Mapped[Optional[datetime]] = mapped_column( DateTime(timezone=True), default=func.now(), onupdate=func.now(), index=True)
+
+    # Denormalized number of FavoritePlanets rows, kept in sync on every favorite insert / delete (see counters.py)
+    favorite_count:  Mapped[int] = mapped_column( Integer, default=0, server_default='0', nullable=False, index=True)
+
+    # serialize() pre-rendered as JSON, refreshed on every write (see prerender.py), never loaded by default
+    serialized: Mapped[Optional[str]] = mapped_column( Text, nullable=True, deferred=True)
+
+    # created/edited come back with the INSERT/UPDATE (RETURNING), prerender.py needs them during the flush
+    __mapper_args__ = {'eager_defaults': True}
 
 
     ### RELATIONS ###
@@ -389,8 +416,8 @@ class FavoritePlanets(db.Model):
     
     id:         Mapped[int]      = mapped_column( primary_key=True)
     user_id:    Mapped[int]      = mapped_column( ForeignKey('user.id'),   nullable=False)
-    planet_id:  Mapped[int]      = mapped_column( ForeignKey('planet.id'), nullable=False)
-    created_at: Mapped[datetime] = mapped_column( DateTime(timezone=True), default=func.now(), nullable=False)
+    planet_id:  Mapped[int]      = mapped_column( ForeignKey('planet.id'), nullable=False, index=True)
+    created_at: Mapped[datetime] = mapped_column( DateTime(timezone=True), default=func.now(), nullable=False, index=True)
 
     ### TABLE CONSTRAINTS ###
     __table_args__ = (
@@ -462,7 +489,7 @@ class Vehicle(db.Model):
 
     ### ATTRIBUTES ###
     id:              Mapped[int] = mapped_column(              primary_key=True)
-    name:            Mapped[str] = mapped_column( String(100),                    nullable=False)
+    name:            Mapped[str] = mapped_column( String(100), index=True,        nullable=False)
     model:           Mapped[str] = mapped_column( String(100),                    nullable=False)
     vehicle_class:   Mapped[str] = mapped_column( String(100),                    nullable=False)
     manufacturer:    Mapped[str] = mapped_column( String(100),                    nullable=False)
@@ -474,9 +501,19 @@ class Vehicle(db.Model):
     cargo_capacity:  Mapped[str] = mapped_column( String(100),                    nullable=False)
     consumables:     Mapped[str] = mapped_column( String(100),                    nullable=False)
     url:             Mapped[str] = mapped_column( String(200), unique=True,       nullable=False)
-    created:         Mapped[datetime] = mapped_column( DateTime(timezone=True), default=func.now(), nullable=False)
-    edited:          Mapped[Optional[datetime]] = mapped_column( DateTime(timezone=True), default=func.now(), onupdate=func.now())
-    
+    created:         Mapped[datetime] = mapped_column( DateTime(timezone=True), default=func.now(), nullable=False, index=True)
+    # Indexed for the delta sync (GET /<list>/changes, see changes.py)
+    edited:          Mapped[Optional[datetime]] = mapped_column( DateTime(timezone=True), default=func.now(), onupdate=func.now(), index=True)
+
+    # Denormalized number of FavoriteVehicles rows, kept in sync on every favorite insert / delete (see counters.py)
+    favorite_count:  Mapped[int] = mapped_column( Integer, default=0, server_default='0', nullable=False, index=True)
+
+    # serialize() pre-rendered as JSON, refreshed on every write (see prerender.py), never loaded by default
+    serialized: Mapped[Optional[str]] = mapped_column( Text, nullable=True, deferred=True)
+
+    # created/edited come back with the INSERT/UPDATE (RETURNING), prerender.py needs them during the flush
+    __mapper_args__ = {'eager_defaults': True}
+
 
     ### RELATIONS ###
 
@@ -548,8 +585,8 @@ class FavoriteVehicles(db.Model):
 
     id:         Mapped[int]      = mapped_column( primary_key=True)
     user_id:    Mapped[int]      = mapped_column( ForeignKey('user.id'),     nullable=False)
-    vehicle_id: Mapped[int]      = mapped_column( ForeignKey('vehicle.id'),  nullable=False)
-    created_at: Mapped[datetime] = mapped_column( DateTime(timezone=True), default=func.now(), nullable=False)
+    vehicle_id: Mapped[int]      = mapped_column( ForeignKey('vehicle.id'),  nullable=False, index=True)
+    created_at: Mapped[datetime] = mapped_column( DateTime(timezone=True), default=func.now(), nullable=False, index=True)
 
     ### TABLE CONSTRAINTS ###
     __table_args__ = (
@@ -585,6 +622,166 @@ class FavoriteVehicles(db.Model):
     def __repr__(self):
         return f'<FavoriteVehicle ... User:{self.user_id} --> Vehicle:{self.vehicle_id}>'
 
+
+############################################
+#########     TableGeneration     ##########
+############################################
+"""
+One row per catalog table, `generation` is bumped inside every transaction
+that writes the table (see response_cache.py). Workers key their cached
+list responses by it.
+"""
+class TableGeneration(db.Model):
+    __tablename__ = 'table_generation'
+
+    ### ATTRIBUTES ###
+    table_name: Mapped[str] = mapped_column( String(50), primary_key=True)
+    generation: Mapped[int] = mapped_column( Integer,    default=0,        nullable=False)
+
+
+    ### __repr__ METHOD ###
+
+    def __repr__(self):
+        return f'<TableGeneration {self.table_name} ... {self.generation}>'
+
+
+############################################
+##########       Tombstone       ###########
+############################################
+"""
+One row per deleted catalog entity, written in the same flush as the DELETE
+(see changes.py) and pruned after CHANGES_RETENTION_DAYS.
+"""
+class Tombstone(db.Model):
+    __tablename__ = 'tombstone'
+
+    ### ATTRIBUTES ###
+    id:         Mapped[int]      = mapped_column(              primary_key=True)
+    table_name: Mapped[str]      = mapped_column( String(50),                    nullable=False)
+    entity_id:  Mapped[int]      = mapped_column( Integer,                       nullable=False)
+    deleted_at: Mapped[datetime] = mapped_column( DateTime(timezone=True), default=func.now(), nullable=False, index=True)
+
+    ### TABLE CONSTRAINTS ###
+    # AUTOINCREMENT on SQLite: ids are cursor positions, never handed out again after a prune
+    __table_args__ = (
+        Index('ix_tombstone_table_name_id', 'table_name', 'id'),
+        {'sqlite_autoincrement': True},
+    )
+
+
+    ### __repr__ METHOD ###
+
+    def __repr__(self):
+        return f'<Tombstone {self.table_name}:{self.entity_id} ... {self.deleted_at}>'
+
+
+############################################
+##########         Event         ###########
+############################################
+"""
+Outbox of the catalog and favorites events, written by the handlers in the
+transaction of the change itself and streamed by GET /events (see events.py).
+"""
+class Event(db.Model):
+    __tablename__ = 'event'
+
+    ### ATTRIBUTES ###
+    id:         Mapped[int]      = mapped_column(              primary_key=True)
+    type:       Mapped[str]      = mapped_column( String(40),                    nullable=False)
+    payload:    Mapped[str]      = mapped_column( Text,                          nullable=False)
+    created_at: Mapped[datetime] = mapped_column( DateTime(timezone=True), default=func.now(), nullable=False, index=True)
+
+    # Ids are the SSE event ids clients resume from, never handed out again on SQLite
+    __table_args__ = {'sqlite_autoincrement': True}
+
+
+    ### __repr__ METHOD ###
+
+    def __repr__(self):
+        return f'<Event {self.id} ... {self.type}>'
+
+
+############################################
+##########          Job          ###########
+############################################
+"""
+Background jobs (imports, exports, repairs, bulk deletes) run by the job
+runner of any worker process, see jobs.py.
+"""
+class Job(db.Model):
+    __tablename__ = 'job'
+
+    ### ATTRIBUTES ###
+    id:               Mapped[int]                = mapped_column(              primary_key=True)
+    type:             Mapped[str]                = mapped_column( String(40),                         nullable=False)
+    params:           Mapped[str]                = mapped_column( Text,                               nullable=False)
+    status:           Mapped[str]                = mapped_column( String(20),  default='queued',      nullable=False, index=True)
+    progress_done:    Mapped[int]                = mapped_column( Integer,     default=0,             nullable=False)
+    progress_total:   Mapped[Optional[int]]      = mapped_column( Integer,                            nullable=True)
+    result:           Mapped[Optional[str]]      = mapped_column( Text,                               nullable=True)
+    error:            Mapped[Optional[str]]      = mapped_column( Text,                               nullable=True)
+    cancel_requested: Mapped[bool]               = mapped_column( Boolean(),   default=False,         nullable=False)
+    # host:pid of the process running it, refreshed with heartbeat_at while it runs
+    worker:           Mapped[Optional[str]]      = mapped_column( String(100),                        nullable=True)
+    heartbeat_at:     Mapped[Optional[datetime]] = mapped_column( DateTime(timezone=True),            nullable=True)
+    created_at:       Mapped[datetime]           = mapped_column( DateTime(timezone=True), default=func.now(), nullable=False)
+    started_at:       Mapped[Optional[datetime]] = mapped_column( DateTime(timezone=True),            nullable=True)
+    finished_at:      Mapped[Optional[datetime]] = mapped_column( DateTime(timezone=True),            nullable=True)
+
+
+    ### SERIALIZATION ###
+    def serialize(self):
+        return {
+            "id":               self.id,
+            "type":             self.type,
+            # Import items / id lists are reported by their size
+            "params":           {key: len(value) if isinstance(value, list) else value for key, value in json.loads(self.params).items()},
+            "status":           self.status,
+            "progress":         {"done": self.progress_done, "total": self.progress_total},
+            "result":           json.loads(self.result) if self.result else None,
+            "error":            self.error,
+            "cancel_requested": self.cancel_requested,
+            "created_at":       self.created_at.isoformat()  if self.created_at  else None,
+            "started_at":       self.started_at.isoformat()  if self.started_at  else None,
+            "finished_at":      self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+    ### __repr__ METHOD ###
+
+    def __repr__(self):
+        return f'<Job {self.id} ... {self.type} ... {self.status}>'
+
+#######  -------------------------------------------------------------------------  ######
+
+
+############################################
+##########    Idempotency key    ###########
+############################################
+"""
+One row per Idempotency-Key sent with a write request (see idempotency.py):
+in flight while `status_code` is empty, then the stored response that
+retries get replayed. Pruned after IDEMPOTENCY_TTL_HOURS.
+"""
+class IdempotencyKey(db.Model):
+    __tablename__ = 'idempotency_key'
+
+    ### ATTRIBUTES ###
+    # sha256 of the owner (user or client address) and the Idempotency-Key header, see idempotency.py
+    key:          Mapped[str]             = mapped_column( String(255),                   primary_key=True)
+    # sha256 of method, path and body: the same key with another request is refused
+    fingerprint:  Mapped[str]             = mapped_column( String(64),                    nullable=False)
+    status_code:  Mapped[Optional[int]]   = mapped_column( Integer,                       nullable=True)
+    content_type: Mapped[Optional[str]]   = mapped_column( String(100),                   nullable=True)
+    body:         Mapped[Optional[bytes]] = mapped_column( LargeBinary,                   nullable=True)
+    created_at:   Mapped[datetime]        = mapped_column( DateTime(timezone=True), default=func.now(), nullable=False, index=True)
+
+
+    ### __repr__ METHOD ###
+
+    def __repr__(self):
+        return f'<IdempotencyKey {self.key} ... {self.status_code or "in flight"}>'
+
 #######  -------------------------------------------------------------------------  ######
 
 
@@ -0,0 +1,55 @@
+"""
+Multi-get by ids: GET /people?ids=1,5,9 (same for /planets, /vehicles, /users).
+
+`get_many` first takes whatever the current session already holds in its
+identity map, then loads the rest with IN queries. Results keep the order of
+the request and ids that don't exist come back as {'id': <id>, 'not_found': true}.
+The catalog lists read their pre-rendered rows instead, see prerender.py.
+"""
+from sqlalchemy.orm.util import identity_key
+
+from models import db
+from utils import IN_CHUNK, parse_id_list
+
+
+MAX_MULTIGET_IDS = 500
+
+
+def parse_multiget_ids(value):
+    """ ?ids=1,5,9 -> [1, 5, 9], ValueError with a client facing message """
+    try:
+        ids = parse_id_list(value)
+    except ValueError:
+        raise ValueError('ids must be comma separated integers, e.g. ?ids=1,5,9')
+
+    if not ids:
+        raise ValueError('ids is empty')
+    if len(ids) > MAX_MULTIGET_IDS:
+        raise ValueError(f'At most {MAX_MULTIGET_IDS} ids per request')
+    return ids
+
+
+def get_many(model, ids):
+    """ {id: entity} for the ids that exist """
+    found, missing = {}, []
+
+    for entity_id in ids:
+        entity = db.session.identity_map.get(identity_key(model, entity_id))
+        if entity is not None:
+            found[entity_id] = entity
+        else:
+            missing.append(entity_id)
+
+    for start in range(0, len(missing), IN_CHUNK):
+        found.update(
+            (entity.id, entity)
+            for entity in model.query.filter(model.id.in_(missing[start:start + IN_CHUNK]))
+        )
+
+    return found
+
+
+def with_not_found_markers(ids, rows):
+    """ Serialized rows back in request order, a marker in place of every missing id """
+    by_id = {row['id']: row for row in rows}
+    return [by_id.get(entity_id, {'id': entity_id, 'not_found': True}) for entity_id in ids]
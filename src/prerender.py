@@ -0,0 +1,150 @@
+"""
+Pre-rendered catalog JSON: every People/Planet/Vehicle row stores its own
+serialize() output, already encoded, in the `serialized` column.
+
+The blob is refreshed inside the same flush as every ORM insert/update of the
+row. Writes that bypass the ORM and change serialized fields set it to NULL
+(see residents.py); read endpoints render NULL rows on the fly and
+`flask prerender-catalog` fills them back.
+
+Read endpoints select (id, serialized) only and splice the blobs into the
+response body: no ORM hydration, no serialize(), no re-encoding.
+"""
+import json
+
+from flask import current_app
+from sqlalchemy import select, update, event
+
+from models import db, People, Planet, Vehicle
+from utils import IN_CHUNK
+
+
+CATALOG_MODELS = (People, Planet, Vehicle)
+
+
+def render(entity):
+    # Same output as Flask's JSON provider (sorted keys, compact), blobs and jsonify() agree
+    return json.dumps(entity.serialize(), sort_keys=True, separators=(',', ':'))
+
+
+def with_fields(blob, **fields):
+    """ Extra keys appended to a rendered object: '{"id":1}' -> '{"id":1,"is_favorite":true}' """
+    extra = ''.join(f',{json.dumps(key)}:{json.dumps(value)}' for key, value in fields.items())
+    return blob[:-1] + extra + '}'
+
+
+############################################
+#######     Refresh on ORM writes    #######
+############################################
+def _refresh_blob(mapper, connection, target):
+    table = mapper.local_table
+    connection.execute(
+        table.update()
+        .where(table.c.id == target.id)
+        .values(serialized=render(target), edited=table.c.edited)
+    )
+
+
+for _model in CATALOG_MODELS:
+    event.listen(_model, 'after_insert', _refresh_blob)
+    event.listen(_model, 'after_update', _refresh_blob)
+
+
+############################################
+#######            Reads             #######
+############################################
+def _render_missing(model, missing_ids):
+    """ Rows without a blob yet: ORM load + render, nothing is written back on reads """
+    rendered = {}
+    for start in range(0, len(missing_ids), IN_CHUNK):
+        chunk = missing_ids[start:start + IN_CHUNK]
+        rendered.update((entity.id, render(entity)) for entity in model.query.filter(model.id.in_(chunk)))
+    return rendered
+
+
+def catalog_blobs(model, ids=None):
+    """ [(id, blob)] of every row by id, or of `ids` in that order (missing ids left out) """
+    if ids is None:
+        rows = db.session.execute(select(model.id, model.serialized).order_by(model.id)).all()
+    else:
+        rows = []
+        for start in range(0, len(ids), IN_CHUNK):
+            rows += db.session.execute(
+                select(model.id, model.serialized).where(model.id.in_(ids[start:start + IN_CHUNK]))
+            ).all()
+        found = dict(rows)
+        rows = [(entity_id, found[entity_id]) for entity_id in ids if entity_id in found]
+
+    return with_missing_rendered(model, rows)
+
+
+def with_missing_rendered(model, rows):
+    """ (id, blob) rows with the NULL blobs rendered """
+    missing = [entity_id for entity_id, blob in rows if blob is None]
+    if not missing:
+        return rows
+
+    rendered = _render_missing(model, missing)
+    return [(entity_id, blob if blob is not None else rendered[entity_id]) for entity_id, blob in rows]
+
+
+def catalog_blob(model, entity_id):
+    rows = catalog_blobs(model, [entity_id])
+    return rows[0][1] if rows else None
+
+
+def in_request_order(ids, rows):
+    """ Blobs of a multi-get, a not-found marker in place of every missing id """
+    by_id = dict(rows)
+    return [
+        by_id.get(entity_id) or json.dumps({'id': entity_id, 'not_found': True}, sort_keys=True, separators=(',', ':'))
+        for entity_id in ids
+    ]
+
+
+def raw_json_body(envelope, data):
+    """
+    Body whose "data" is spliced in as already encoded JSON: a list of blobs
+    or a single blob. `envelope` holds the other keys, all of them sort after "data".
+    """
+    data = '[' + ','.join(data) + ']' if isinstance(data, list) else data
+    rest = json.dumps(envelope, sort_keys=True, separators=(',', ':'))
+    return '{"data":' + data + (',' + rest[1:] if envelope else '}') + '\n'
+
+
+def raw_json(envelope, data):
+    return current_app.response_class(raw_json_body(envelope, data), mimetype='application/json')
+
+
+############################################
+#######            Backfill          #######
+############################################
+def prerender_catalog(only_missing=True, batch_size=500):
+    """ Render the blobs of every catalog row (or only the NULL ones), returns {table: rows} """
+    rendered = {}
+
+    for model in CATALOG_MODELS:
+        count, last_id = 0, 0
+        while True:
+            # Keyset batches, every batch is committed before the next one is read
+            query = model.query.filter(model.id > last_id)
+            if only_missing:
+                query = query.filter(model.serialized.is_(None))
+            entities = query.order_by(model.id).limit(batch_size).all()
+            if not entities:
+                break
+
+            for entity in entities:
+                db.session.execute(
+                    update(model)
+                    .where(model.id == entity.id)
+                    .values(serialized=render(entity), edited=model.edited)
+                    .execution_options(synchronize_session=False, keeps_generation=True)
+                )
+            db.session.commit()
+            count += len(entities)
+            last_id = entities[-1].id
+
+        rendered[model.__tablename__] = count
+
+    return rendered
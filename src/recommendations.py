@@ -0,0 +1,187 @@
+"""
+Co-favorite recommendations ("users who favorited this also favorited ...").
+
+A background thread loads the three favorites tables into a sparse
+user x entity matrix M (NumPy/SciPy), computes the cosine co-occurrence
+C = D^-1/2 (M^T M) D^-1/2 and keeps, for every entity, its top-K neighbors.
+Requests are answered from those lists and from the in-memory user rows of M,
+never from the favorites tables.
+
+The matrix is rebuilt every RECOMMENDATIONS_REFRESH_SECONDS, or sooner (but
+at most every RECOMMENDATIONS_MIN_SECONDS) after favorites change.
+NumPy and SciPy are optional: without them the endpoints answer 503.
+"""
+import os
+import time
+import logging
+import threading
+
+from models import db, People, Planet, Vehicle, FavoritePeople, FavoritePlanets, FavoriteVehicles
+
+
+logger = logging.getLogger(__name__)
+
+TOP_K           = 50
+REFRESH_SECONDS = float(os.getenv('RECOMMENDATIONS_REFRESH_SECONDS', '600'))
+MIN_SECONDS     = float(os.getenv('RECOMMENDATIONS_MIN_SECONDS', '30'))
+
+# kind -> (entity model, favorites model, FK column on the favorites table)
+SOURCES = {
+    'people':  (People,  FavoritePeople,   FavoritePeople.people_id),
+    'planet':  (Planet,  FavoritePlanets,  FavoritePlanets.planet_id),
+    'vehicle': (Vehicle, FavoriteVehicles, FavoriteVehicles.vehicle_id),
+}
+
+
+class RecommendationsUnavailable(Exception):
+    pass
+
+
+############################################
+#######     Snapshot (read only)     #######
+############################################
+class Snapshot:
+    """ Immutable result of one build, swapped atomically by the builder """
+
+    def __init__(self, neighbors, user_items, built_at):
+        self.neighbors  = neighbors     # (kind, id) -> [((kind, id), score), ...] best first
+        self.user_items = user_items    # user_id -> set of (kind, id)
+        self.built_at   = built_at
+
+
+def build_snapshot():
+    import numpy as np
+    from scipy import sparse
+
+    user_ids, item_keys = [], []
+    for kind, (model, favorite_model, fk_column) in SOURCES.items():
+        for user_id, entity_id in db.session.query(favorite_model.user_id, fk_column).yield_per(10000):
+            user_ids.append(user_id)
+            item_keys.append((kind, entity_id))
+
+    if not user_ids:
+        return Snapshot({}, {}, time.time())
+
+    # Compact row/column indexes
+    users, user_index = np.unique(np.array(user_ids), return_inverse=True)
+    items = sorted(set(item_keys))
+    item_position = {key: position for position, key in enumerate(items)}
+    item_index = np.fromiter((item_position[key] for key in item_keys), dtype=np.int64, count=len(item_keys))
+
+    matrix = sparse.csr_matrix(
+        (np.ones(len(item_index), dtype=np.float32), (user_index, item_index)),
+        shape=(len(users), len(items))
+    )
+
+    # Cosine similarity between items from their co-favorite counts
+    cooccurrence = (matrix.T @ matrix).tocsr()
+    popularity = np.asarray(matrix.sum(axis=0)).ravel()
+    scale = sparse.diags(1.0 / np.sqrt(np.maximum(popularity, 1)))
+    similarity = (scale @ cooccurrence @ scale).tocsr()
+    similarity.setdiag(0)
+    similarity.eliminate_zeros()
+
+    neighbors = {}
+    for row in range(similarity.shape[0]):
+        start, end = similarity.indptr[row], similarity.indptr[row + 1]
+        if start == end:
+            continue
+        columns, scores = similarity.indices[start:end], similarity.data[start:end]
+        if len(scores) > TOP_K:
+            best = np.argpartition(-scores, TOP_K)[:TOP_K]
+            columns, scores = columns[best], scores[best]
+        order = np.argsort(-scores, kind='stable')
+        neighbors[items[row]] = [(items[columns[i]], float(scores[i])) for i in order]
+
+    user_items = {
+        int(users[row]): {items[column] for column in matrix.indices[matrix.indptr[row]:matrix.indptr[row + 1]]}
+        for row in range(matrix.shape[0])
+    }
+
+    return Snapshot(neighbors, user_items, time.time())
+
+
+############################################
+#######    Background recommender    #######
+############################################
+class Recommender:
+
+    def __init__(self):
+        self.snapshot = None
+        self.changed  = threading.Event()
+        self.lock     = threading.Lock()
+        self.thread   = None
+        self.disabled = False
+
+    def ensure_started(self, app):
+        """ Start the builder thread lazily, so it lives in each (forked) worker """
+        if self.thread is not None:
+            return
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, args=(app,), daemon=True, name='recommender')
+                self.thread.start()
+
+    def mark_dirty(self):
+        """ Called by the favorite handlers, triggers an early rebuild """
+        self.changed.set()
+
+    def _run(self, app):
+        while True:
+            try:
+                with app.app_context():
+                    started = time.time()
+                    self.snapshot = build_snapshot()
+                    logger.info(f"Recommendations rebuilt in {time.time() - started:.2f}s, {len(self.snapshot.neighbors)} items")
+            except ImportError:
+                logger.warning("NumPy/SciPy not installed, recommendations disabled")
+                self.disabled = True
+                return
+            except Exception as e:
+                logger.error(f"Recommendations build failed: {str(e)}")
+
+            self.changed.wait(REFRESH_SECONDS)
+            self.changed.clear()
+            time.sleep(MIN_SECONDS)
+
+    def _ready_snapshot(self):
+        if self.snapshot is None:
+            raise RecommendationsUnavailable('disabled' if self.disabled else 'warming up')
+        return self.snapshot
+
+    def also_favorited(self, kind, entity_id, limit, only_kind=None):
+        neighbors = self._ready_snapshot().neighbors.get((kind, entity_id), [])
+        if only_kind:
+            neighbors = [item for item in neighbors if item[0][0] == only_kind]
+        return neighbors[:limit]
+
+    def for_user(self, user_id, limit, only_kind=None):
+        """ Sum of the neighbor scores of everything the user already favorited """
+        snapshot = self._ready_snapshot()
+        owned = snapshot.user_items.get(user_id, set())
+
+        scores = {}
+        for key in owned:
+            for neighbor, score in snapshot.neighbors.get(key, []):
+                if neighbor in owned or (only_kind and neighbor[0] != only_kind):
+                    continue
+                scores[neighbor] = scores.get(neighbor, 0.0) + score
+
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+
+recommender = Recommender()
+
+
+def hydrate(ranked):
+    """ [((kind, id), score)] -> entity dicts, one IN query per kind, ranking order kept """
+    entities = {}
+    for kind, (model, _, _) in SOURCES.items():
+        ids = [entity_id for (item_kind, entity_id), _ in ranked if item_kind == kind]
+        if ids:
+            entities.update({(kind, item.id): item for item in model.query.filter(model.id.in_(ids))})
+
+    return [
+        {**entities[key].serialize(), 'type': key[0], 'score': round(score, 4)}
+        for key, score in ranked if key in entities
+    ]
@@ -0,0 +1,99 @@
+"""
+Planet residents through the normalized People.homeworld_id foreign key.
+
+`People.homeworld` stays the free-text value clients send (a planet name or a
+SWAPI style URL); `homeworld_id` is resolved from it on every write and by
+`flask backfill-homeworlds` for rows written before the column existed.
+"""
+from sqlalchemy import select, or_, case, func, text
+
+from models import db, People, Planet
+from prerender import prerender_catalog
+from response_cache import touch_tables
+
+
+BATCH_SIZE = 1000
+
+# Same matching as the e5b2c9d47f13 migration: the planet URL first, then its name.
+# The pre-rendered JSON of the touched rows is dropped, see prerender.py
+BACKFILL = text(
+    "UPDATE people SET serialized = NULL, homeworld_id = COALESCE("
+    "    (SELECT MIN(planet.id) FROM planet WHERE rtrim(planet.url, '/') = rtrim(people.homeworld, '/')),"
+    "    (SELECT MIN(planet.id) FROM planet WHERE planet.name = people.homeworld)"
+    ") WHERE people.id >= :start AND people.id < :end AND people.homeworld_id IS NULL"
+)
+
+
+def resolve_homeworld_id(homeworld):
+    """ Planet id for a homeworld string (URL or name), None when no planet matches """
+    if not homeworld:
+        return None
+
+    url = homeworld.rstrip('/')
+    by_url = Planet.url.in_([url, url + '/'])
+    return db.session.execute(
+        select(Planet.id)
+        .where(or_(by_url, Planet.name == homeworld))
+        .order_by(case((by_url, 0), else_=1), Planet.id)
+        .limit(1)
+    ).scalar()
+
+
+def backfill_homeworlds(batch_size=BATCH_SIZE):
+    """ Resolve homeworld_id where it is still NULL, one committed batch of ids at a time, returns the new links """
+    linked = select(func.count(People.id)).where(People.homeworld_id.is_not(None))
+    before = db.session.execute(linked).scalar()
+    max_id = db.session.execute(select(func.max(People.id))).scalar() or 0
+
+    for start in range(0, max_id + 1, batch_size):
+        db.session.execute(BACKFILL, {'start': start, 'end': start + batch_size})
+        touch_tables(db.session, 'people')
+        db.session.commit()
+
+    prerender_catalog(only_missing=True)
+
+    # Rows without a matching planet are "updated" to NULL too, count the links instead
+    return db.session.execute(linked).scalar() - before
+
+
+def residents_counts_query(planet_ids=None):
+    query = (
+        select(People.homeworld_id, func.count(People.id))
+        .where(People.homeworld_id.is_not(None))
+        .group_by(People.homeworld_id)
+    )
+    if planet_ids is not None:
+        query = query.where(People.homeworld_id.in_(planet_ids))
+    return query
+
+
+def residents_counts(planet_ids=None):
+    """ {planet_id: residents} with one GROUP BY over the homeworld_id index """
+    return dict(db.session.execute(residents_counts_query(planet_ids)).all())
+
+
+def residents_page(planet_id, page, per_page):
+    """ (people, total) of one planet, ordered by id """
+    total = db.session.execute(
+        select(func.count(People.id)).where(People.homeworld_id == planet_id)
+    ).scalar()
+
+    people = (
+        People.query
+        .filter(People.homeworld_id == planet_id)
+        .order_by(People.id)
+        .offset((page - 1) * per_page)
+        .limit(per_page)
+        .all()
+    )
+    return people, total
+
+
+def detach_residents(planet_id):
+    """
+    Before deleting a planet, for databases that don't enforce ON DELETE SET NULL.
+    Through the ORM: the residents' blobs are re-rendered in the same flush (prerender.py).
+    """
+    for person in People.query.filter(People.homeworld_id == planet_id).order_by(People.id):
+        person.homeworld_id = None
+    db.session.flush()
@@ -0,0 +1,200 @@
+"""
+Whole-response cache of the unfiltered catalog lists (GET /people, /planets,
+/vehicles without a query string).
+
+Every worker keeps the last encoded body of each list, plain and gzipped,
+keyed by the generations of the tables it was built from. A generation is a
+row of `table_generation`, bumped inside every transaction that writes the
+table, so a commit made by any worker (or the admin, or a CLI command) moves
+it. A request reads the generations (one primary key lookup) and sends the
+cached bytes when they still match, the database is not touched otherwise.
+"""
+import os
+import gzip
+import logging
+from itertools import chain
+
+from flask import request, g
+from sqlalchemy import select, update, insert, event
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db, TableGeneration
+from db_routing import RoutingSession
+
+
+logger = logging.getLogger(__name__)
+
+
+#########################################################################################
+#########################################################################################
+#############                    CATALOG RESPONSE CACHE                     #############
+#########################################################################################
+#########################################################################################
+"""
+Configuration (environment variables):
+
+    RESPONSE_CACHE=0 .................... disable the cache (generations are still bumped)
+    RESPONSE_CACHE_GZIP_LEVEL=6 ......... compression level of the gzipped copy
+
+Writes that don't change what the lists show (counter repairs, blob
+refreshes) pass `keeps_generation=True` in their execution options. Raw SQL
+writes call `touch_tables()` themselves.
+
+Hits are answered before admission control, they cost one primary key lookup.
+"""
+
+WATCHED_TABLES = ('people', 'planet', 'vehicle')
+
+# Endpoint -> tables its body is built from (planets carry residents_count)
+CACHED_ROUTES = {
+    'api.get_all_people':   ('people',),
+    'api.get_all_planets':  ('planet', 'people'),
+    'api.get_all_vehicles': ('vehicle',),
+}
+
+GENERATIONS_KEY = 'response_cache.generations'
+BUMPED_KEY      = 'response_cache.bumped'
+
+
+############################################
+#######       Table generations      #######
+############################################
+def touch_tables(session, *tables):
+    """ Bump the generation of `tables` once per transaction of `session` """
+    bumped = session.info.setdefault(BUMPED_KEY, set())
+    tables = sorted(set(tables) - bumped)  # Fixed order, two writers never wait on each other crosswise
+    if not tables:
+        return
+
+    connection = session.connection()
+    generations = TableGeneration.__table__
+    for table in tables:
+        result = connection.execute(
+            update(generations)
+            .where(generations.c.table_name == table)
+            .values(generation=generations.c.generation + 1)
+        )
+        if result.rowcount == 0:
+            # Databases built with create_all() have no seeded rows
+            connection.execute(insert(generations).values(table_name=table, generation=1))
+    bumped.update(tables)
+
+
+def read_generations(tables):
+    rows = dict(db.session.execute(
+        select(TableGeneration.table_name, TableGeneration.generation)
+        .where(TableGeneration.table_name.in_(tables))
+    ).all())
+    return tuple(rows.get(table, 0) for table in tables)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _bump_flushed_tables(session, flush_context):
+    # new/dirty/deleted still hold the pre-flush state here
+    tables = {
+        entity.__table__.name
+        for entity in chain(session.new, session.deleted, session.dirty)
+        if getattr(entity, '__tablename__', None) in WATCHED_TABLES
+        and (entity not in session.dirty or session.is_modified(entity))
+    }
+    if tables:
+        touch_tables(session, *tables)
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _bump_bulk_writes(orm_execute_state):
+    # ORM enabled update(Model) / delete(Model) statements skip the flush
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    if orm_execute_state.execution_options.get('keeps_generation'):
+        return
+
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and mapper.local_table.name in WATCHED_TABLES:
+        touch_tables(orm_execute_state.session, mapper.local_table.name)
+
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+def _reset_bumped(session, transaction):
+    if transaction.parent is None:
+        session.info.pop(BUMPED_KEY, None)
+
+
+############################################
+#######         Cached bodies        #######
+############################################
+class CachedList:
+
+    __slots__ = ('generations', 'body', 'gzipped', 'etag')
+
+    def __init__(self, endpoint, generations, body, gzip_level):
+        self.generations = generations
+        self.body        = body
+        # mtime=0: every worker produces the same bytes for the same body
+        self.gzipped     = gzip.compress(body, compresslevel=gzip_level, mtime=0)
+        self.etag        = f'{endpoint[4:]}-' + '.'.join(str(generation) for generation in generations)
+
+    def fill(self, response):
+        """ The cached body (gzipped when accepted) or a 304 into `response` """
+        use_gzip = 'gzip' in request.accept_encodings
+        etag = self.etag + ('-gz' if use_gzip else '')
+
+        if etag in request.if_none_match:
+            response.status_code = 304
+            response.set_data(b'')
+        else:
+            response.set_data(self.gzipped if use_gzip else self.body)
+            response.mimetype = 'application/json'
+            if use_gzip:
+                response.headers['Content-Encoding'] = 'gzip'
+
+        response.set_etag(etag)
+        response.vary.add('Accept-Encoding')
+        return response
+
+
+############################################
+#######             Setup            #######
+############################################
+def configure_response_cache(app):
+    if os.getenv('RESPONSE_CACHE', '1') == '0':
+        return
+
+    gzip_level = int(os.getenv('RESPONSE_CACHE_GZIP_LEVEL', '6'))
+    cache = {}  # endpoint -> CachedList, replaced as a whole so readers never see half an entry
+
+    def cacheable():
+        # Inside an atomic /batch the generations may belong to a transaction that gets rolled back
+        return request.method == 'GET' and not request.args and not g.get('atomic_batch')
+
+    @app.before_request
+    def serve_cached_list():
+        tables = CACHED_ROUTES.get(request.endpoint)
+        if tables is None or not cacheable():
+            return None
+
+        try:
+            # Read before the list itself: a concurrent commit can only make the
+            # body newer than its key, never older
+            generations = read_generations(tables)
+        except SQLAlchemyError as e:
+            logger.warning(f"Response cache bypassed, cannot read generations: {str(e)}")
+            return None
+
+        entry = cache.get(request.endpoint)
+        if entry is not None and entry.generations == generations:
+            return entry.fill(app.response_class())
+
+        request.environ[GENERATIONS_KEY] = generations
+        return None
+
+    @app.after_request
+    def store_cached_list(response):
+        generations = request.environ.pop(GENERATIONS_KEY, None)
+        if generations is None or response.status_code != 200 or response.direct_passthrough:
+            return response
+
+        entry = CachedList(request.endpoint, generations, response.get_data(), gzip_level)
+        cache[request.endpoint] = entry
+        # Filled in place, the after_request hooks that already ran (CORS) keep their headers
+        return entry.fill(response)
@@ -0,0 +1,245 @@
+"""
+Slow query log: statements above a threshold are written, one JSON line each,
+to a rotating file per process together with the Flask endpoint that ran them,
+their duration and the shape (not the values) of their bound parameters. A
+sample of them also gets its query plan captured.
+"""
+import os
+import re
+import sys
+import glob
+import json
+import time
+import random
+import logging
+from logging.handlers import RotatingFileHandler
+
+from flask import request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+logger = logging.getLogger(__name__)
+
+
+#########################################################################################
+#########################################################################################
+#############                        SLOW QUERY LOG                         #############
+#########################################################################################
+#########################################################################################
+"""
+Configuration (environment variables):
+
+    SLOW_QUERY_MS=200 ................... threshold in ms (0 = log disabled)
+    SLOW_QUERY_EXPLAIN_RATE=0.1 ......... share of slow SELECTs whose plan is captured
+                                          (EXPLAIN on Postgres, EXPLAIN QUERY PLAN on SQLite)
+    SLOW_QUERY_LOG=/tmp/slow_queries.log  one rotating file per process, 5 x 10 MB each:
+                                          /tmp/slow_queries.<pid>.log ("-" logs to stderr)
+    SLOW_QUERY_LOG_KEEP_DAYS=7 .......... files of exited processes (recycled workers) untouched
+                                          for longer are deleted
+
+RotatingFileHandler is not safe across processes: the gunicorn workers
+sharing one file would lose or interleave lines when it rotates. Each process
+opens its own file on its first slow statement, after the fork (preload_app).
+
+One line per slow statement:
+
+    {"at": "...", "ms": 412.3, "endpoint": "api.get_all_users", "method": "GET",
+     "statement": "SELECT ... WHERE user.id IN (?, ...)", "params": ["int x 250"],
+     "plan": ["SCAN user"]}
+"""
+
+MAX_STATEMENT_LENGTH = 4000
+
+# "?, ?, ?, ?" / "%(id_1_1)s, %(id_1_2)s, ..." of an expanded IN list -> one marker
+_EXPANDED_IN = re.compile(r'(?:(?:\?|%\([^)]+\)s|\$\d+), ){2,}(?:\?|%\([^)]+\)s|\$\d+)')
+
+MAX_BYTES    = 10 * 1024 * 1024
+BACKUP_COUNT = 5
+
+slow_log = logging.getLogger('slow_queries.file')
+slow_log.propagate = False
+
+
+def _log_path():
+    return os.getenv('SLOW_QUERY_LOG', '/tmp/slow_queries.log')
+
+
+def _process_path(path, pid):
+    """ /tmp/slow_queries.log -> /tmp/slow_queries.<pid>.log """
+    root, extension = os.path.splitext(path)
+    return f'{root}.{pid}{extension or ".log"}'
+
+
+def _process_files(path):
+    """ Every per-process file of the log and their rotated copies """
+    root, extension = os.path.splitext(path)
+    return glob.glob(f'{root}.[0-9]*{extension or ".log"}') + glob.glob(f'{root}.[0-9]*{extension or ".log"}.[0-9]*')
+
+
+def _is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # Alive, owned by another user
+    return True
+
+
+def _prune_old_files(path):
+    cutoff = time.time() - float(os.getenv('SLOW_QUERY_LOG_KEEP_DAYS', '7')) * 86400
+    root = os.path.splitext(path)[0]
+    for name in _process_files(path):
+        pid = name[len(root) + 1:].split('.', 1)[0]
+        try:
+            if os.path.getmtime(name) < cutoff and not _is_running(int(pid)):
+                os.remove(name)
+        except (OSError, ValueError):
+            pass
+
+
+class ProcessLogFile(logging.Handler):
+    """ A RotatingFileHandler of this process' own file, opened on the first record after a fork """
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.pid  = None
+        self.file = None
+
+    def emit(self, record):
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.file = RotatingFileHandler(_process_path(self.path, self.pid), maxBytes=MAX_BYTES, backupCount=BACKUP_COUNT)
+            self.file.setFormatter(self.formatter)
+            _prune_old_files(self.path)
+        self.file.emit(record)
+
+
+def _parameter_shape(parameters):
+    """ Types of the bound values, runs of the same type collapsed: ['int x 250', 'str'] """
+    if isinstance(parameters, dict):
+        values = list(parameters.values())
+    elif isinstance(parameters, (list, tuple)):
+        values = list(parameters)
+    else:
+        return []
+
+    shape = []
+    for value in values:
+        name = type(value).__name__
+        if shape and shape[-1][0] == name:
+            shape[-1][1] += 1
+        else:
+            shape.append([name, 1])
+    return [name if count == 1 else f'{name} x {count}' for name, count in shape]
+
+
+def _explain(conn, statement, parameters):
+    """ Plan rows of a SELECT, run on a raw DBAPI cursor so no engine event fires again """
+    if not statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return None
+
+    prefix = 'EXPLAIN QUERY PLAN ' if conn.dialect.name == 'sqlite' else 'EXPLAIN '
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.execute(prefix + statement, parameters)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+
+    # SQLite: (id, parent, notused, detail) / Postgres: (line,)
+    return [str(row[-1]) for row in rows]
+
+
+############################################
+#######          Engine hooks        #######
+############################################
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the execution context, a failed statement leaves nothing behind
+    if context is not None:
+        context.slow_query_started = time.perf_counter()
+
+
+def _make_after_cursor_execute(threshold_ms, explain_rate):
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, 'slow_query_started', None)
+        if started is None:
+            return
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if elapsed_ms < threshold_ms:
+            return
+
+        record = {
+            'at':        time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'ms':        round(elapsed_ms, 1),
+            'endpoint':  request.endpoint if has_request_context() else None,
+            'method':    request.method if has_request_context() else None,
+            'statement': _EXPANDED_IN.sub('?, ...', statement)[:MAX_STATEMENT_LENGTH],
+            'params':    f'executemany x {len(parameters)}' if executemany else _parameter_shape(parameters),
+        }
+
+        if not executemany and random.random() < explain_rate:
+            try:
+                record['plan'] = _explain(conn, statement, parameters)
+            except Exception as e:
+                record['plan_error'] = str(e)
+
+        slow_log.info(json.dumps(record, default=str))
+
+    return after_cursor_execute
+
+
+############################################
+#######             Setup            #######
+############################################
+def configure_slow_query_log(app):
+    threshold_ms = float(os.getenv('SLOW_QUERY_MS', '200'))
+    if threshold_ms <= 0 or slow_log.handlers:
+        return
+
+    path = _log_path()
+    if path == '-':
+        handler = logging.StreamHandler(sys.stderr)
+    elif os.access(os.path.dirname(os.path.abspath(path)), os.W_OK):
+        handler = ProcessLogFile(path)
+    else:
+        logger.warning(f"Slow query log disabled, cannot write to the directory of {path}")
+        return
+
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    slow_log.addHandler(handler)
+    slow_log.setLevel(logging.INFO)
+
+    explain_rate = float(os.getenv('SLOW_QUERY_EXPLAIN_RATE', '0.1'))
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _make_after_cursor_execute(threshold_ms, explain_rate))
+
+
+def summarize_slow_log(limit=20):
+    """ Log lines of every process grouped by statement, slowest first, for `flask slow-queries` """
+    groups = {}
+
+    for name in _process_files(_log_path()):
+        with open(name) as log_file:
+            for line in log_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                group = groups.setdefault(record['statement'], {
+                    'statement': record['statement'], 'count': 0, 'max_ms': 0.0,
+                    'endpoints': set(), 'full_scan': False
+                })
+                group['count'] += 1
+                group['max_ms'] = max(group['max_ms'], record['ms'])
+                group['endpoints'].add(record.get('endpoint') or 'background')
+                # "SCAN <table>" without an index is what a missing index looks like on SQLite
+                plan = record.get('plan') or []
+                group['full_scan'] |= any(step.startswith('SCAN') and 'INDEX' not in step for step in plan)
+                group['full_scan'] |= any('Seq Scan' in step for step in plan)
+
+    ranked = sorted(groups.values(), key=lambda group: -group['max_ms'])[:limit]
+    return [{**group, 'endpoints': sorted(group['endpoints'])} for group in ranked]
@@ -0,0 +1,146 @@
+"""
+SQLite production profile: WAL journal, tuned PRAGMAs on every connection
+and automatic retries when the database file is locked by another worker.
+"""
+import os
+import time
+import random
+import sqlite3
+import logging
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+logger = logging.getLogger(__name__)
+
+
+#########################################################################################
+#########################################################################################
+#############                     SQLITE PRODUCTION PROFILE                 #############
+#########################################################################################
+#########################################################################################
+"""
+Every value can be overridden with an environment variable of the same name:
+
+    SQLITE_TUNING=0 ..................... disable the whole profile
+    SQLITE_JOURNAL_MODE=WAL ............. readers never block the (single) writer
+    SQLITE_SYNCHRONOUS=NORMAL ........... safe with WAL, fsync only on checkpoints
+    SQLITE_MMAP_SIZE=268435456 .......... 256 MB of the file memory mapped
+    SQLITE_CACHE_SIZE=-65536 ............ negative = KiB -> 64 MB page cache
+    SQLITE_BUSY_TIMEOUT=5000 ............ ms SQLite itself waits for a lock
+    SQLITE_LOCK_RETRIES=5 ............... extra retries on "database is locked", for statements
+                                          starting a transaction and for COMMIT
+    SQLITE_LOCK_BACKOFF=0.05 ............ first backoff in seconds (doubles + jitter)
+"""
+
+DEFAULTS = {
+    'SQLITE_JOURNAL_MODE': 'WAL',
+    'SQLITE_SYNCHRONOUS':  'NORMAL',
+    'SQLITE_MMAP_SIZE':    '268435456',
+    'SQLITE_CACHE_SIZE':   '-65536',
+    'SQLITE_BUSY_TIMEOUT': '5000',
+    'SQLITE_LOCK_RETRIES': '5',
+    'SQLITE_LOCK_BACKOFF': '0.05',
+}
+
+
+def _setting(name):
+    return os.getenv(name, DEFAULTS[name])
+
+
+def is_sqlite_url(url):
+    return str(url).startswith('sqlite')
+
+
+############################################
+#######  Retry "database is locked"  #######
+############################################
+def _is_locked_error(error):
+    message = str(error).lower()
+    return 'database is locked' in message or 'database is busy' in message
+
+
+def _with_lock_retry(operation, *args):
+    retries = int(_setting('SQLITE_LOCK_RETRIES'))
+    backoff = float(_setting('SQLITE_LOCK_BACKOFF'))
+
+    for attempt in range(retries + 1):
+        try:
+            return operation(*args)
+        except sqlite3.OperationalError as e:
+            if not _is_locked_error(e) or attempt == retries:
+                raise
+            delay = backoff * (2 ** attempt) * (1 + random.random())
+            logger.warning(f"SQLite locked, retry {attempt + 1}/{retries} in {delay:.3f}s")
+            time.sleep(delay)
+
+
+class RetryingCursor(sqlite3.Cursor):
+    # A statement that failed with SQLITE_BUSY did not run, so re-executing it is safe, but only
+    # outside a transaction (first statement, BEGIN): inside one, WAL answers SQLITE_BUSY_SNAPSHOT
+    # to a writer whose snapshot is stale and retries cannot succeed until the transaction restarts
+    def execute(self, *args):
+        if self.connection.in_transaction:
+            return super().execute(*args)
+        return _with_lock_retry(super().execute, *args)
+
+    def executemany(self, *args):
+        if self.connection.in_transaction:
+            return super().executemany(*args)
+        return _with_lock_retry(super().executemany, *args)
+
+
+class RetryingConnection(sqlite3.Connection):
+    def cursor(self, factory=RetryingCursor):
+        return super().cursor(factory)
+
+    def commit(self):
+        return _with_lock_retry(super().commit)
+
+
+############################################
+#######    PRAGMAs on every connect  #######
+############################################
+def apply_pragmas(dbapi_connection):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={_setting('SQLITE_JOURNAL_MODE')}")
+    cursor.execute(f"PRAGMA synchronous={_setting('SQLITE_SYNCHRONOUS')}")
+    cursor.execute(f"PRAGMA mmap_size={int(_setting('SQLITE_MMAP_SIZE'))}")
+    cursor.execute(f"PRAGMA cache_size={int(_setting('SQLITE_CACHE_SIZE'))}")
+    cursor.execute(f"PRAGMA busy_timeout={int(_setting('SQLITE_BUSY_TIMEOUT'))}")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+@event.listens_for(Engine, 'connect')
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, RetryingConnection):
+        apply_pragmas(dbapi_connection)
+
+
+def sqlite_engine_options():
+    """
+    Engine options for a SQLite URL. Only connections opened with these
+    options get the PRAGMAs and the lock retries.
+    """
+    return {
+        'connect_args': {
+            'factory': RetryingConnection,
+            'timeout': int(_setting('SQLITE_BUSY_TIMEOUT')) / 1000,
+            'check_same_thread': False,
+        },
+    }
+
+
+def configure_sqlite(app):
+    """ Enable the production profile when the app runs on SQLite """
+    if not is_sqlite_url(app.config['SQLALCHEMY_DATABASE_URI']):
+        return
+    if os.getenv('SQLITE_TUNING', '1') == '0':
+        return
+
+    options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    for key, value in sqlite_engine_options().items():
+        options.setdefault(key, value)
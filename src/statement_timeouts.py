@@ -0,0 +1,141 @@
+"""
+Per-route statement timeouts: a runaway query is cancelled by the database
+instead of holding a pooled connection for tens of seconds.
+"""
+import os
+import time
+import sqlite3
+import logging
+
+from flask import request, has_request_context, jsonify
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+
+from models import db
+
+
+logger = logging.getLogger(__name__)
+
+
+#########################################################################################
+#########################################################################################
+#############                      STATEMENT TIMEOUTS                       #############
+#########################################################################################
+#########################################################################################
+"""
+Configuration (environment variables):
+
+    STATEMENT_TIMEOUT_MS=5000 ........... every statement run while serving a request
+                                          (0 = no timeout). CLI commands and background
+                                          threads are never limited.
+    STATEMENT_TIMEOUTS= ................. per-route overrides in ms "get_all_users=2000,run_batch_requests=10000"
+                                          (endpoint names of the api blueprint)
+
+Postgres: `SET statement_timeout` on the connection, only re-sent when the value
+changes (the connection remembers it, a rollback forgets it).
+SQLite: a progress handler that interrupts the statement past its deadline.
+
+A cancelled statement rolls the session back and the request answers a
+structured 504 instead of the handler's generic 500.
+"""
+
+TIMEOUT_HIT_KEY = 'statement_timeout.hit'
+PG_TIMEOUT_KEY  = 'statement_timeout_ms'
+# SQLite VM instructions between two deadline checks
+SQLITE_CHECK_EVERY = 1000
+
+DEFAULT_TIMEOUT_MS = int(os.getenv('STATEMENT_TIMEOUT_MS', '5000'))
+
+
+def _parse_route_timeouts(value):
+    timeouts = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        endpoint, _, milliseconds = item.partition('=')
+        timeouts[f'api.{endpoint.strip()}'] = int(milliseconds)
+    return timeouts
+
+
+ROUTE_TIMEOUTS = _parse_route_timeouts(os.getenv('STATEMENT_TIMEOUTS', ''))
+
+
+def current_timeout_ms():
+    """ Timeout of the request being served, 0 outside of requests """
+    if not has_request_context():
+        return 0
+    return ROUTE_TIMEOUTS.get(request.endpoint, DEFAULT_TIMEOUT_MS)
+
+
+def _is_timeout(error):
+    # Postgres query_canceled (57014) / SQLite interrupted by the progress handler
+    if getattr(error, 'pgcode', None) == '57014':
+        return True
+    return isinstance(error, sqlite3.OperationalError) and 'interrupted' in str(error)
+
+
+############################################
+#######          Engine hooks        #######
+############################################
+@event.listens_for(Engine, 'before_cursor_execute')
+def apply_statement_timeout(conn, cursor, statement, parameters, context, executemany):
+    timeout_ms = current_timeout_ms()
+    dbapi_connection = conn.connection.dbapi_connection
+
+    if conn.dialect.name == 'postgresql':
+        if conn.connection.info.get(PG_TIMEOUT_KEY) != timeout_ms:
+            cursor.execute(f'SET statement_timeout = {int(timeout_ms)}')
+            conn.connection.info[PG_TIMEOUT_KEY] = timeout_ms
+
+    elif isinstance(dbapi_connection, sqlite3.Connection):
+        if not timeout_ms:
+            dbapi_connection.set_progress_handler(None, 0)
+            return
+        deadline = time.monotonic() + timeout_ms / 1000
+        dbapi_connection.set_progress_handler(lambda: time.monotonic() > deadline, SQLITE_CHECK_EVERY)
+
+
+@event.listens_for(Engine, 'rollback')
+def forget_statement_timeout(conn):
+    # A SET inside a rolled back transaction is undone with it
+    conn.connection.info.pop(PG_TIMEOUT_KEY, None)
+
+
+@event.listens_for(Engine, 'rollback_savepoint')
+def forget_statement_timeout_in_savepoint(conn, name, context):
+    conn.connection.info.pop(PG_TIMEOUT_KEY, None)
+
+
+@event.listens_for(Pool, 'reset')
+def forget_statement_timeout_on_reset(dbapi_connection, connection_record, reset_state):
+    connection_record.info.pop(PG_TIMEOUT_KEY, None)
+
+
+@event.listens_for(Engine, 'handle_error')
+def flag_statement_timeout(context):
+    if _is_timeout(context.original_exception) and has_request_context():
+        request.environ[TIMEOUT_HIT_KEY] = True
+        logger.warning(f"Statement timeout in {request.endpoint}: {context.statement}")
+
+
+############################################
+#######             Setup            #######
+############################################
+def configure_statement_timeouts(app):
+
+    @app.after_request
+    def answer_statement_timeout(response):
+        # The handlers turn the cancelled query into a generic 500, replace it
+        if not request.environ.pop(TIMEOUT_HIT_KEY, False) or response.status_code < 500:
+            return response
+
+        db.session.rollback()
+        timeout_ms = current_timeout_ms()
+        response = jsonify({
+            'success': False,
+            'message': f'The query took longer than {timeout_ms} ms and was cancelled, retry later',
+            'error': 'statement_timeout',
+            'timeout_ms': timeout_ms
+        })
+        response.status_code = 504
+        response.headers['Retry-After'] = '5'
+        return response
@@ -0,0 +1,260 @@
+"""
+"Trending" favorites: exponentially decayed favorite scores per entity.
+
+A favorite added at time t is worth exp(-(now - t) / window) at time `now`.
+Every score is stored relative to a reference time t0, so the common decay
+factor never has to be applied to all entities: adding a favorite just adds
+exp((t - t0) / window) to one entry, removing one subtracts its contribution.
+When the exponent grows too large the table is re-normalized to a new t0.
+
+Scores live in memory per worker and are kept by a background thread, never
+by a request. It loads the favorites of the horizon once, then follows the
+`event` outbox (events.py): favorites.added / removed and the catalog
+deletions, from every worker, in commit order. The load reads the favorites
+and the outbox position in one snapshot, so each favorite is counted once:
+either the load saw it or its event comes after the position.
+"""
+import os
+import json
+import math
+import time
+import heapq
+import logging
+import threading
+from datetime import datetime, timezone
+
+from sqlalchemy import select, func
+
+from models import db, People, Planet, Vehicle, FavoritePeople, FavoritePlanets, FavoriteVehicles, Event
+from events import EventCursor
+
+
+logger = logging.getLogger(__name__)
+
+
+#########################################################################################
+#########################################################################################
+#############                      TRENDING FAVORITES                       #############
+#########################################################################################
+#########################################################################################
+"""
+Configuration (environment variables):
+
+    TRENDING_SYNC_SECONDS=2 ............. seconds between two reads of the outbox
+    TRENDING_RELOAD_HOURS=24 ............ full reload, also picks up the favorites removed
+                                          without an event (user deleted, cascades)
+    TRENDING_WARMUP_SECONDS=10 .......... a request waits that long for the first load, 503 after
+"""
+
+WINDOWS = {
+    '1d':  1 * 24 * 3600,
+    '7d':  7 * 24 * 3600,
+    '30d': 30 * 24 * 3600,
+}
+
+# kind -> (entity model, favorites model, FK column on the favorites table)
+KINDS = {
+    'people':  (People,  FavoritePeople,   FavoritePeople.people_id),
+    'planet':  (Planet,  FavoritePlanets,  FavoritePlanets.planet_id),
+    'vehicle': (Vehicle, FavoriteVehicles, FavoriteVehicles.vehicle_id),
+}
+
+SYNC_SECONDS    = float(os.getenv('TRENDING_SYNC_SECONDS', '2'))
+RELOAD_SECONDS  = float(os.getenv('TRENDING_RELOAD_HOURS', '24')) * 3600
+WARMUP_SECONDS  = float(os.getenv('TRENDING_WARMUP_SECONDS', '10'))
+
+# Outbox topic -> kind, for favorites.* the kind is in the payload
+EVENT_KINDS = {'people': 'people', 'planets': 'planet', 'vehicles': 'vehicle'}
+
+TOP_K           = 100
+SYNC_BATCH      = 1000
+# Ids below the outbox position still uncommitted at load time are waited for (events.EventCursor)
+LOAD_GAP_IDS    = 1000
+# Favorites older than HORIZON windows weigh less than e^-10 and are not loaded
+HORIZON         = 10
+MAX_EXPONENT    = 50
+
+
+def to_timestamp(value):
+    """ DB datetimes come back naive on SQLite (UTC) and aware on Postgres """
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+############################################
+#######     Decayed scores (1 kind)  #######
+############################################
+class DecayedScores:
+
+    def __init__(self, window_seconds, now=None):
+        self.rate   = 1.0 / window_seconds
+        self.t0     = now if now is not None else time.time()
+        self.scores = {}
+        self._top   = None
+
+    def add(self, entity_id, timestamp, sign=1):
+        if self.rate * (timestamp - self.t0) > MAX_EXPONENT:
+            self.renormalize(timestamp)
+
+        score = self.scores.get(entity_id, 0.0) + sign * math.exp(self.rate * (timestamp - self.t0))
+        if score <= 1e-12:
+            self.scores.pop(entity_id, None)
+        else:
+            self.scores[entity_id] = score
+        self._top = None
+
+    def forget(self, entity_id):
+        if self.scores.pop(entity_id, None) is not None:
+            self._top = None
+
+    def renormalize(self, now):
+        """ Move t0 to `now`, dropping entries that decayed to nothing """
+        factor = math.exp(-self.rate * (now - self.t0))
+        self.scores = {
+            entity_id: score * factor
+            for entity_id, score in self.scores.items()
+            if score * factor > 1e-12
+        }
+        self.t0 = now
+        self._top = None
+
+    def top(self, limit, now=None):
+        """ [(entity_id, score at `now`)] best first """
+        now = now if now is not None else time.time()
+        if self._top is None:
+            # Decay is common to every entry, ordering on the stored values is enough
+            self._top = heapq.nlargest(TOP_K, self.scores.items(), key=lambda item: item[1])
+
+        decay = math.exp(-self.rate * (now - self.t0))
+        return [(entity_id, score * decay) for entity_id, score in self._top[:limit]]
+
+
+############################################
+#######          Engine              #######
+############################################
+class TrendingUnavailable(Exception):
+    pass
+
+
+def _snapshot_connection():
+    """ A connection whose reads all see the same snapshot of the primary """
+    connection = db.engine.connect()
+    if connection.dialect.name == 'sqlite':
+        # WAL snapshots are per transaction, pysqlite would only open one for a write
+        connection.exec_driver_sql('BEGIN')
+    else:
+        connection.execution_options(isolation_level='REPEATABLE READ')
+    return connection
+
+
+def _add(tables, kind, entity_id, timestamp, sign, now):
+    for window, seconds in WINDOWS.items():
+        # Favorites past the horizon were never loaded, don't subtract them
+        if now - timestamp <= HORIZON * seconds:
+            tables[(kind, window)].add(entity_id, timestamp, sign)
+
+
+class TrendingEngine:
+
+    def __init__(self):
+        self.lock      = threading.Lock()
+        self.tables    = {}
+        self.cursor    = None   # outbox position of the tables, None until loaded
+        self.loaded_at = 0.0
+        self.ready     = threading.Event()
+        self.thread    = None
+
+    def ensure_started(self, app):
+        """ Start the sync thread lazily, so it lives in each (forked) worker """
+        if self.thread is not None:
+            return
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, args=(app,), daemon=True, name='trending')
+                self.thread.start()
+
+    def _run(self, app):
+        while True:
+            try:
+                with app.app_context():
+                    if self.cursor is None or time.time() - self.loaded_at >= RELOAD_SECONDS:
+                        self._load()
+                    else:
+                        self._sync()
+            except Exception as e:
+                logger.error(f"Trending sync failed: {str(e)}")
+            time.sleep(SYNC_SECONDS)
+
+    def _load(self):
+        """ Build the tables from the favorites inside the horizon of the longest window """
+        started = time.time()
+        tables = {
+            (kind, window): DecayedScores(seconds, started)
+            for kind in KINDS for window, seconds in WINDOWS.items()
+        }
+        since = datetime.fromtimestamp(started - HORIZON * max(WINDOWS.values()), tz=timezone.utc)
+
+        with _snapshot_connection() as connection:
+            newest = connection.execute(select(func.coalesce(func.max(Event.id), 0))).scalar()
+            committed = connection.execute(select(Event.id).where(Event.id > newest - LOAD_GAP_IDS)).scalars().all()
+            cursor = EventCursor(max(newest - LOAD_GAP_IDS, 0), committed)
+
+            for kind, (model, favorite_model, fk_column) in KINDS.items():
+                rows = connection.execute(
+                    select(fk_column, favorite_model.created_at)
+                    .where(favorite_model.created_at >= since)
+                    .execution_options(yield_per=5000)
+                )
+                for entity_id, created_at in rows:
+                    _add(tables, kind, entity_id, to_timestamp(created_at), 1, started)
+
+        with self.lock:
+            self.tables, self.cursor, self.loaded_at = tables, cursor, started
+        self.ready.set()
+        logger.info(f"Trending loaded in {time.time() - started:.2f}s, outbox position {cursor.last_id}")
+
+    def _sync(self):
+        """ Apply the outbox events after the cursor, reload when they were pruned meanwhile """
+        with db.engine.connect() as connection:
+            oldest = connection.execute(select(func.min(Event.id))).scalar()
+            if oldest is not None and oldest > self.cursor.last_id + 1:
+                logger.warning("Trending fell behind the outbox retention, reloading")
+                self._load()
+                return
+
+            rows = connection.execute(
+                select(Event.id, Event.type, Event.payload)
+                .where(Event.id > self.cursor.last_id)
+                .order_by(Event.id)
+                .limit(SYNC_BATCH)
+            ).all()
+
+        now = time.time()
+        with self.lock:
+            for event in self.cursor.fresh(rows):
+                self._apply(event, now)
+
+    def _apply(self, event, now):
+        topic, action = event.type.split('.', 1)
+        if topic == 'favorites':
+            payload = json.loads(event.payload)
+            if 'favorited_at' in payload:  # Events written before it was added are left to the reload
+                sign = 1 if action == 'added' else -1
+                _add(self.tables, EVENT_KINDS[payload['kind']], payload['id'], to_timestamp(payload['favorited_at']), sign, now)
+        elif action == 'deleted':
+            entity_id = json.loads(event.payload)['id']
+            for window in WINDOWS:
+                self.tables[(EVENT_KINDS[topic], window)].forget(entity_id)
+
+    def top(self, kind, window, limit):
+        """ [(entity_id, score)] best first, TrendingUnavailable before the first load """
+        if not self.ready.wait(WARMUP_SECONDS):
+            raise TrendingUnavailable('warming up')
+        with self.lock:
+            return self.tables[(kind, window)].top(limit)
+
+
+trending = TrendingEngine()
@@ -15,13 +15,21 @@ class APIException(Exception):
         rv['message'] = self.message
         return rv
 
+# Ids per IN (...) list, keeps every statement under SQLite's bound parameter limit
+IN_CHUNK = 500
+
+def parse_id_list(value):
+    """ '1,2,3' -> [1, 2, 3] (duplicates dropped, order kept), ValueError on anything else """
+    ids = [int(part) for part in value.split(',') if part.strip()]
+    return list(dict.fromkeys(ids))
+
 def has_no_empty_params(rule):
     defaults = rule.defaults if rule.defaults is not None else ()
     arguments = rule.arguments if rule.arguments is not None else ()
     return len(defaults) >= len(arguments)
 
 def generate_sitemap(app):
-    links = ['/admin/']
+    links = ['/admin/'] if 'admin' in app.blueprints else []
     for rule in app.url_map.iter_rules():
         # Filter out rules we can't navigate to in a browser
         # and rules that require parameters
@@ -0,0 +1,48 @@
+"""
+Test setup: one throwaway SQLite database for the session, configured through
+the same environment variables as a deployment (read when `app` is imported).
+
+    $ python -m pytest -q
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+
+_tmp = tempfile.mkdtemp()
+os.environ.update({
+    'DATABASE_URL':       f'sqlite:///{_tmp}/test.db',
+    'AUTH_REQUIRED':      '0',
+    'AUTH_SECRET_KEY':    'test key',
+    'ADMIN_ENABLED':      '0',
+    'MIGRATIONS_ENABLED': '0',
+    'SLOW_QUERY_MS':      '0',
+    # Small buckets: a few requests are enough to exhaust one client's
+    'ADMISSION_RATE':     '0.001',
+    'ADMISSION_BURST':    '5',
+})
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import app as flask_app
+    from models import db
+
+    with flask_app.app_context():
+        db.create_all()
+    return flask_app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def person(name):
+    return {
+        'name': name, 'birth_year': '19BBY', 'eye_color': 'blue', 'gender': 'male', 'hair_color': 'blond',
+        'height': '172', 'mass': '77', 'skin_color': 'fair', 'homeworld': 'Tatooine', 'url': f'https://swapi.test/people/{name}',
+    }
@@ -0,0 +1,47 @@
+from conftest import person
+
+
+def _batch(client, address, requests):
+    response = client.post('/batch', json={'requests': requests}, headers={'X-Forwarded-For': address})
+    return response, [item['status'] for item in response.get_json().get('responses', [])]
+
+
+############################################
+#######   Client of the sub-requests #######
+############################################
+def test_batches_of_two_clients_do_not_share_a_rate_bucket(client):
+    reads = [{'method': 'GET', 'path': '/people/1'}] * 4
+
+    # Client A: the batch and its 4 sub-requests use up its 5 tokens
+    response, statuses = _batch(client, '10.0.0.1', reads)
+    assert response.status_code == 200 and 429 not in statuses
+    response, _ = _batch(client, '10.0.0.1', reads)
+    assert response.status_code == 429
+
+    # Client B still has its own bucket, for the batch and for the sub-requests
+    response, statuses = _batch(client, '10.0.0.2', reads)
+    assert response.status_code == 200 and 429 not in statuses
+
+
+def test_sub_request_cannot_pick_its_client_address(client):
+    reads = [{'method': 'GET', 'path': '/people/1', 'headers': {'X-Forwarded-For': f'10.1.0.{index}'}} for index in range(4)]
+
+    _batch(client, '10.0.1.1', reads)
+    response, statuses = _batch(client, '10.0.1.1', [{'method': 'GET', 'path': '/people/1', 'headers': {'X-Forwarded-For': '10.1.0.9'}}])
+    assert response.status_code == 429
+
+
+def test_idempotency_keys_of_two_clients_do_not_collide_in_batches(client):
+    def create(address, name):
+        request = {'method': 'POST', 'path': '/people', 'body': person(name), 'headers': {'Idempotency-Key': 'same-key'}}
+        response = client.post('/batch', json={'requests': [request]}, headers={'X-Forwarded-For': address})
+        return response.get_json()['responses'][0]
+
+    first = create('10.0.2.1', 'Luke')
+    second = create('10.0.2.2', 'Leia')
+    assert first['status'] == 201 and second['status'] == 201
+    assert second['body']['data']['name'] == 'Leia'
+
+    # The same client retrying is still answered from its stored response
+    retry = create('10.0.2.1', 'Luke')
+    assert retry['status'] == 201 and retry['body'] == first['body']